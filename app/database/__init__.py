@@ -1 +1 @@
-from .database import create_table, add_highscore, get_highscores
\ No newline at end of file
+from .database import create_table, add_highscore, add_highscores, get_highscores, close_all
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+This module contains a multi-process contention benchmark for the
+highscores database.
+
+Every websocket session runs its own python3 run.py process, so under load
+many processes call add_highscore on the same database file at once. The
+benchmark starts that many processes against a scratch database, has them
+all write at the same moment and reports the write throughput and the
+median and p99 latency of add_highscore for each number of sessions.
+
+Run it from the project root, for example:
+
+    python -m app.database.benchmark --sessions 1 2 4 8 16 --writes 200
+
+Functions:
+    run_benchmark(sessions, writes, path, journal_mode): Measures one
+    number of concurrent sessions.
+    main(argv): Parses the command line and prints a report.
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from . import database
+
+
+def _session(path, writes, journal_mode, start_at):
+    """
+    Writes highscores from one session process and times each write.
+
+    Parameters:
+        path (str): The path of the scratch database file.
+        writes (int): The number of highscores to write.
+        journal_mode (str): The journal mode to use.
+        start_at (float): The time.time() at which all sessions start.
+
+    Returns:
+        tuple: The list of write latencies in seconds and the number of
+        writes that failed.
+    """
+    database.configure_pool(path, 1, journal_mode)
+    latencies = []
+    failures = 0
+    time.sleep(max(0.0, start_at - time.time()))
+    for index in range(writes):
+        start = time.perf_counter()
+        try:
+            database.add_highscore('BOT', index)
+        except database.sqlite3.OperationalError:
+            failures += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    database.close_all()
+    return latencies, failures
+
+
+def _percentile(sorted_values, fraction):
+    """
+    Returns a percentile of already sorted values.
+
+    Parameters:
+        sorted_values (list): The values in ascending order.
+        fraction (float): The percentile as a fraction, e.g. 0.99.
+
+    Returns:
+        float: The value at the percentile, or 0.0 if there are none.
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def run_benchmark(sessions, writes, path, journal_mode=database.JOURNAL_MODE):
+    """
+    Runs a number of concurrent session processes against one database.
+
+    Parameters:
+        sessions (int): The number of concurrent session processes.
+        writes (int): The number of highscores each session writes.
+        path (str): The path of the scratch database file.
+        journal_mode (str): The journal mode to use.
+
+    Returns:
+        dict: The sessions, writes, failures, throughput in writes per
+        second and the p50 and p99 latency in milliseconds.
+    """
+    database.configure_pool(path, 1, journal_mode)
+    database.create_table()
+    database.close_all()
+    start_at = time.time() + 0.5
+    with ProcessPoolExecutor(max_workers=sessions) as pool:
+        futures = [pool.submit(_session, path, writes, journal_mode, start_at)
+                   for _ in range(sessions)]
+        results = [future.result() for future in futures]
+    elapsed = time.time() - start_at
+    latencies = sorted(latency for session, _ in results for latency in session)
+    return {'sessions': sessions,
+            'writes': len(latencies),
+            'failures': sum(failures for _, failures in results),
+            'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0,
+            'p50': _percentile(latencies, 0.50) * 1000,
+            'p99': _percentile(latencies, 0.99) * 1000}
+
+
+def main(argv=None):
+    """
+    Parses the command line, runs the benchmark for each number of
+    sessions and prints a table of the results.
+
+    Parameters:
+        argv (list): The command line arguments, defaults to sys.argv.
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(
+        description="Highscore database contention benchmark")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="the numbers of concurrent sessions to measure")
+    parser.add_argument("--writes", type=int, default=200,
+                        help="the highscores each session writes")
+    parser.add_argument("--journal-mode", default=database.JOURNAL_MODE,
+                        choices=database.JOURNAL_MODES,
+                        help="the journal mode to benchmark")
+    args = parser.parse_args(argv)
+    print(f"{'sessions':>8} {'writes':>8} {'failed':>7} {'writes/s':>10}"
+          f" {'p50 ms':>8} {'p99 ms':>8}")
+    for sessions in args.sessions:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.db')
+            result = run_benchmark(sessions, args.writes, path, args.journal_mode)
+        print(f"{result['sessions']:>8} {result['writes']:>8}"
+              f" {result['failures']:>7} {result['throughput']:>10.0f}"
+              f" {result['p50']:>8.2f} {result['p99']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
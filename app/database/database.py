@@ -5,15 +5,49 @@ The functions in this module are used to create the highscores table,
 add a highscore to the table, retrieve the top 3 highscores, get the
 lowest highscore, delete a highscore, and maintain the highscores table.
 
-The highscores table has the following columns:
-- id (INTEGER): The primary key of the highscore.
+Every finished game is kept in the games table, and the games that
+were finished with chips left and recorded under the player's initials
+are also added to the highscores table. The leaderboard, the highscore
+threshold and ranks are read from the highscores table only, so games
+recorded under ANONYMOUS_NAME or with no chips left never show up on
+it. An index on (score DESC, id) serves the top-k, rank and leaderboard
+page queries from the front of the index, so they stay fast with
+millions of rows. Old scores and games are only removed by
+maintain_highscores, a separate retention job that deletes in batches,
+not by every insert; python3 run.py --maintain runs it, for example from
+a daily cron job.
+
+The highscores and games tables have the following columns:
+- id (INTEGER): The primary key of the highscore or game.
 - name (TEXT): The name of the player.
 - score (INTEGER): The score achieved by the player.
 
 The functions in this module use the sqlite3 module to interact with
 the SQLite database. The connect_db function is used to connect to the
 database, and the create_table function is used to create the highscores
-table if it does not exist.
+and games tables if they do not exist.
+
+Rather than connecting and closing again on every call, the functions
+share the connections of a module level ConnectionPool. The pool is
+created on first use, can be resized or pointed at another database file
+with configure_pool, and is shut down with close_all.
+
+Every game session is a separate process writing the same database
+file, so connections use WAL journaling, which lets readers carry on
+while one session writes, and wait for a busy timeout when the database
+is locked. Writes take the write lock up front with BEGIN IMMEDIATE and
+are retried with exponential backoff if the lock still cannot be had.
+
+Reads of the leaderboard are served from a process level
+LeaderboardCache. The cache reloads from the table whenever PRAGMA
+data_version shows that the database has been changed by another
+connection or process, and add_highscore invalidates it, so repeated
+reads of an unchanged leaderboard do not query the table.
+
+With enable_write_behind, add_highscore only queues the score and a
+HighscoreWriter thread writes queued scores in batches, one transaction
+per batch. Reads include the queued scores, and flush_highscores or
+close_all wait until every queued score has been written.
 
 The add_highscore function is used to add a highscore to the highscores
 table. The function takes two parameters: name and score. The name
@@ -32,31 +66,694 @@ The delete_highscore function is used to delete a highscore from the
 highscores table. The function takes one parameter: score_id, which
 is the id of the highscore to be deleted.
 
+The add_highscores function is used to load many highscores at once,
+such as the results of a bot tournament. It inserts them with
+executemany in large batches, one transaction and commit per batch.
+
+The get_rank, get_leaderboard_page and get_leaderboard_after functions
+are used to find where a score ranks and to page through the full
+leaderboard.
+
 The maintain_highscores function is used to maintain the highscores
-table by keeping only the top 3 highscores. The function checks the
-number of rows in the highscores table and deletes the lowest highscore
-if the number of rows is greater than 3.
+and games tables by keeping only the best scores and the most recent
+games once the tables grow past their retention limits. The function
+deletes the rest in batches, one transaction per batch.
 """
+import queue
+import random
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+#the database file and the number of connections kept open to it
+DB_PATH = 'blackjack_game.db'
+POOL_SIZE = 4
+#how connections share the file: the journal mode, the seconds a connection
+#waits for a lock, and how often and how quickly a locked write is retried
+JOURNAL_MODE = 'WAL'
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+BUSY_TIMEOUT = 5.0
+WRITE_RETRIES = 5
+RETRY_BACKOFF = 0.05
+#the most highscores queued for the write-behind writer, and per transaction
+WRITE_QUEUE_SIZE = 256
+WRITE_BATCH_SIZE = 64
+#the number of highscores shown on the leaderboard, the number of best
+#highscores and of most recent games kept by maintain_highscores, and its
+#batch size
+LEADERBOARD_SIZE = 3
+HIGHSCORE_LIMIT = 100_000
+HISTORY_LIMIT = 1_000_000
+PRUNE_BATCH_SIZE = 5000
+#the number of highscores inserted per transaction by add_highscores
+INGEST_BATCH_SIZE = 5000
+#the name games are recorded under when the player gave no initials, such
+#games are kept in the games table but never on the leaderboard
+ANONYMOUS_NAME = '---'
 
-def connect_db():
+def connect_db(path=DB_PATH, busy_timeout=BUSY_TIMEOUT,
+               journal_mode=JOURNAL_MODE):
     """
     Connects to the SQLite database and returns the connection object.
-    
+
+    The connection may be used from any thread, so that the pool can hand
+    it out to whichever thread asks next. The pool makes sure only one
+    thread uses it at a time.
+
+    Parameters:
+        path (str): The path of the database file.
+        busy_timeout (float): The seconds to wait for a locked database.
+        journal_mode (str): One of JOURNAL_MODES, or None to leave the
+        journal mode of the database file unchanged.
+
     Returns:
         sqlite3.Connection: The connection object to the SQLite database.
     """
-    return sqlite3.connect('blackjack_game.db')
+    if journal_mode is not None and journal_mode.upper() not in JOURNAL_MODES:
+        raise ValueError(f'unknown journal mode {journal_mode!r}')
+    conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+    if journal_mode is not None:
+        conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+    return conn
+
+def _is_busy(error):
+    """
+    Checks whether an error means the database was locked by another
+    connection, in which case the operation can be retried.
+
+    Parameters:
+        error (sqlite3.OperationalError): The error to check.
+
+    Returns:
+        bool: True if the database was locked or busy.
+    """
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+class ConnectionPool:
+    """
+    A thread-safe pool of long-lived connections to the SQLite database.
+
+    Connections are created on demand up to the pool size and returned to
+    the pool after use instead of being closed. A connection is health
+    checked before it is handed out again and replaced if it has failed.
+
+    Attributes:
+        path (str): The path of the database file.
+        size (int): The most connections the pool will open.
+        journal_mode (str): The journal mode set on every connection.
+        busy_timeout (float): The seconds a connection waits for a lock.
+        retries (int): The times a locked write is retried.
+        backoff (float): The seconds before the first retry, doubled on
+        every retry after it.
+
+    Methods:
+        connection: Borrows a connection for the duration of a with block.
+        transaction: Borrows a connection and commits or rolls back.
+        write: Runs a write transaction, retrying it if it is locked out.
+        close_all: Closes every connection in the pool.
+    """
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, journal_mode=JOURNAL_MODE,
+                 busy_timeout=BUSY_TIMEOUT, retries=WRITE_RETRIES,
+                 backoff=RETRY_BACKOFF):
+        """
+        Initializes an empty ConnectionPool.
+
+        Parameters:
+            path (str): The path of the database file.
+            size (int): The most connections the pool will open.
+            journal_mode (str): The journal mode set on every connection.
+            busy_timeout (float): The seconds a connection waits for a lock.
+            retries (int): The times a locked write is retried.
+            backoff (float): The seconds before the first retry.
+
+        Returns:
+            None
+        """
+        if size < 1:
+            raise ValueError('the pool needs room for one connection')
+        self.path = path
+        self.size = size
+        self.journal_mode = journal_mode
+        self.busy_timeout = busy_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    @staticmethod
+    def _is_healthy(conn):
+        """
+        Checks that a pooled connection can still run a query.
+
+        Parameters:
+            conn (sqlite3.Connection): The connection to check.
+
+        Returns:
+            bool: True if the connection answered, False otherwise.
+        """
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _acquire(self):
+        """
+        Takes an idle connection, opening a new one if the pool has room
+        and waiting for one to be released otherwise.
+
+        Parameters:
+            None
+
+        Returns:
+            sqlite3.Connection: A healthy connection.
+        """
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise sqlite3.ProgrammingError('the connection pool is closed')
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = None
+                    if self._opened < self.size:
+                        self._opened += 1
+                        return connect_db(self.path, self.busy_timeout,
+                                          self.journal_mode)
+            if conn is None:
+                conn = self._idle.get()
+            if self._is_healthy(conn):
+                return conn
+            #replace the broken connection with a fresh one
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+    def _release(self, conn):
+        """
+        Returns a borrowed connection to the pool, or closes it if the
+        pool has been closed in the meantime.
+
+        Parameters:
+            conn (sqlite3.Connection): The connection to return.
+
+        Returns:
+            None
+        """
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if not self._closed:
+                self._idle.put(conn)
+                return
+            self._opened -= 1
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection from the pool for the duration of a with block.
+
+        Parameters:
+            None
+
+        Returns:
+            sqlite3.Connection: The borrowed connection.
+
+        Example:
+            with pool.connection() as conn:
+                conn.execute('SELECT 1')
+        """
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Borrows a connection and runs the with block as one transaction,
+        which is committed if the block succeeds and rolled back if it
+        raises. The transaction takes the write lock when it begins, so
+        it cannot fail halfway through on a lock held by another writer.
+
+        Parameters:
+            None
+
+        Returns:
+            sqlite3.Connection: The borrowed connection.
+        """
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def write(self, operation):
+        """
+        Runs an operation in a transaction, retrying it with exponential
+        backoff and jitter if the database stays locked for longer than
+        the busy timeout.
+
+        Parameters:
+            operation (callable): Called with the borrowed connection.
+
+        Returns:
+            The return value of the operation.
+
+        Raises:
+            sqlite3.OperationalError: If the database is still locked
+            after the last retry, or the operation fails for any other
+            reason.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with self.transaction() as conn:
+                    return operation(conn)
+            except sqlite3.OperationalError as error:
+                if attempt == self.retries or not _is_busy(error):
+                    raise
+                time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+        return None
+
+    def close_all(self):
+        """
+        Closes every idle connection and stops the pool from handing out
+        new ones. Connections that are still borrowed are closed when
+        they are released.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
+                self._opened -= 1
+
+class LeaderboardCache:
+    """
+    A process level cache of the top 3 highscores and the lowest highscore.
+
+    The cache watches the database with PRAGMA data_version on a
+    connection of its own. The value changes whenever any other
+    connection, in this process or another, commits to the database, so
+    the table is only queried again once it has changed.
+
+    Attributes:
+        path (str): The path of the database file.
+        hits (int): The number of reads served from memory.
+        misses (int): The number of reads that loaded the table.
+
+    Methods:
+        read: Returns the cached highscores, reloading them if needed.
+        invalidate: Makes the next read reload the highscores.
+        close: Closes the cache's connection and empties the cache.
+    """
+    def __init__(self, path=DB_PATH):
+        """
+        Initializes an empty LeaderboardCache.
+
+        Parameters:
+            path (str): The path of the database file.
+
+        Returns:
+            None
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._version = None
+        self._highscores = None
+        self._lowest = None
+
+    def _data_version(self):
+        """
+        Returns the data version of the database as seen by the cache's
+        own connection, opening the connection on first use.
+
+        Parameters:
+            None
+
+        Returns:
+            int: The value of PRAGMA data_version.
+        """
+        if self._conn is None:
+            self._conn = connect_db(self.path)
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def read(self, pool):
+        """
+        Returns the cached highscores, reloading them through the pool if
+        the database has changed since they were loaded.
+
+        Parameters:
+            pool (ConnectionPool): The pool to reload from.
+
+        Returns:
+            tuple: The list of (name, score) top highscores and the
+            (id, score) lowest highscore.
+        """
+        with self._lock:
+            version = self._data_version()
+            if self._highscores is None or version != self._version:
+                with pool.connection() as conn:
+                    self._highscores = _top_highscores(conn)
+                    self._lowest = _lowest_highscore(conn)
+                self._version = version
+                self.misses += 1
+            else:
+                self.hits += 1
+            return list(self._highscores), self._lowest
+
+    def invalidate(self):
+        """
+        Makes the next read reload the highscores, after a write through
+        another connection of this process.
+
+        The data version cannot be read inside the writer's transaction,
+        as it is counted per connection, and reading it once the
+        transaction has committed would also count as seen any commit
+        another process made in between, leaving the cache stale until
+        the next change.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._version = None
+
+    def close(self):
+        """
+        Closes the cache's connection and empties the cache.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._highscores = None
+            self._lowest = None
+
+class HighscoreWriter:
+    """
+    A background thread that writes queued highscores in batches.
+
+    Scores wait in a bounded queue, so a caller blocks rather than
+    letting the queue grow without limit if the disk cannot keep up. The
+    writer takes everything that is queued, up to the batch size, and
+    inserts it with executemany in a single transaction.
+
+    Attributes:
+        batch_size (int): The most highscores written per transaction.
+        batches (int): The number of transactions committed.
+        written (int): The number of highscores written.
+
+    Methods:
+        submit: Queues a highscore to be written.
+        pending: Returns the highscores that have not been written yet.
+        flush: Waits until every queued highscore has been written.
+        close: Flushes the queue and stops the writer thread.
+    """
+    _STOP = object()
+
+    def __init__(self, maxsize=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE):
+        """
+        Initializes a HighscoreWriter and starts its thread.
+
+        Parameters:
+            maxsize (int): The most highscores that can be queued.
+            batch_size (int): The most highscores written per transaction.
+
+        Returns:
+            None
+        """
+        self.batch_size = batch_size
+        self.batches = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._error = None
+        self._thread = threading.Thread(target=self._run,
+                                        name='highscore-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, name, score):
+        """
+        Queues a highscore to be written, waiting if the queue is full.
+
+        Parameters:
+            name (str): The name of the player.
+            score (int): The score achieved by the player.
+
+        Returns:
+            None
+        """
+        with self._pending_lock:
+            self._pending.append((name, score))
+        self._queue.put((name, score))
+
+    def pending(self):
+        """
+        Returns the highscores that have been queued but not written.
+
+        Parameters:
+            None
+
+        Returns:
+            list of tuples: The name and score of each queued highscore.
+        """
+        with self._pending_lock:
+            return list(self._pending)
+
+    def _run(self):
+        """
+        Writes queued highscores in batches until the writer is closed.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is self._STOP
+            rows = [row for row in batch if row is not self._STOP]
+            try:
+                if rows:
+                    _write_highscores(rows)
+                    self.batches += 1
+                    self.written += len(rows)
+            except sqlite3.Error as error:
+                self._error = error
+            finally:
+                with self._pending_lock:
+                    for row in rows:
+                        self._pending.remove(row)
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """
+        Waits until every queued highscore has been written.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            sqlite3.Error: The first error a batch failed with since the
+            last flush, after the rest of the queue has been written.
+        """
+        self._queue.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def close(self):
+        """
+        Writes everything still queued and stops the writer thread.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self.flush()
+
+_pool = None
+_pool_lock = threading.Lock()
+_cache = LeaderboardCache()
+_writer = None
+
+def enable_write_behind(maxsize=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE):
+    """
+    Switches add_highscore to queue scores for a background writer
+    instead of writing them before it returns.
+
+    Parameters:
+        maxsize (int): The most highscores that can be queued.
+        batch_size (int): The most highscores written per transaction.
+
+    Returns:
+        HighscoreWriter: The writer, or the existing one if write-behind
+        is already enabled.
+    """
+    global _writer
+    if _writer is None:
+        _writer = HighscoreWriter(maxsize, batch_size)
+    return _writer
+
+def disable_write_behind():
+    """
+    Writes every queued highscore, stops the background writer and
+    switches add_highscore back to writing before it returns.
+
+    Parameters:
+        None
+
+    Returns:
+        None
+    """
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+def flush_highscores():
+    """
+    Waits until every highscore queued for the background writer has
+    been written. Does nothing if write-behind is not enabled.
+
+    Parameters:
+        None
+
+    Returns:
+        None
+    """
+    if _writer is not None:
+        _writer.flush()
+
+def configure_pool(path=DB_PATH, size=POOL_SIZE, journal_mode=JOURNAL_MODE,
+                   busy_timeout=BUSY_TIMEOUT, retries=WRITE_RETRIES,
+                   backoff=RETRY_BACKOFF):
+    """
+    Replaces the shared connection pool with one for the given database
+    file and settings, closing the connections of the old pool.
+
+    Parameters:
+        path (str): The path of the database file.
+        size (int): The most connections the pool will open.
+        journal_mode (str): The journal mode set on every connection.
+        busy_timeout (float): The seconds a connection waits for a lock.
+        retries (int): The times a locked write is retried.
+        backoff (float): The seconds before the first retry.
+
+    Returns:
+        ConnectionPool: The new pool.
+    """
+    global _pool, _cache
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _cache.close()
+        _pool = ConnectionPool(path, size, journal_mode, busy_timeout,
+                               retries, backoff)
+        _cache = LeaderboardCache(path)
+        return _pool
+
+def get_pool():
+    """
+    Returns the shared connection pool, creating it on first use and
+    reopening it with the same settings after close_all.
+
+    Parameters:
+        None
+
+    Returns:
+        ConnectionPool: The shared pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        elif _pool._closed:
+            _pool = ConnectionPool(_pool.path, _pool.size, _pool.journal_mode,
+                                   _pool.busy_timeout, _pool.retries,
+                                   _pool.backoff)
+        return _pool
+
+def close_all():
+    """
+    Writes any highscores still queued for the background writer and
+    closes every connection of the shared pool. This should be called
+    when the program shuts down. The next database call opens a new pool.
+
+    Parameters:
+        None
+
+    Returns:
+        None
+    """
+    disable_write_behind()
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _cache.close()
 
 def create_table():
     """
-    Creates the highscores table in the SQLite database if it does not exist.
+    Creates the highscores and games tables in the SQLite database if
+    they do not exist.
 
-    This function connects to the database, creates a cursor, and executes an
-    SQL statement to create the highscores table.
-    If the table already exists, the SQL statement is not executed.
-    After executing the SQL statement, the changes are committed and
-    the connection to the database is closed.
+    This function borrows a pooled connection and executes SQL
+    statements to create the tables and their score indexes.
+    If a table or index already exists, the SQL statement is not executed.
+    When the games table is first created, the games that a database
+    written before it existed holds in the highscores table are copied
+    into it, and those without initials or without chips are taken off
+    the highscores table.
+    After executing the SQL statements, the changes are committed and
+    the connection is returned to the pool.
 
     Parameters:
         None
@@ -64,25 +761,54 @@ def create_table():
     Returns:
         None
     """
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS highscores
-                      (id INTEGER PRIMARY KEY, name TEXT, score INTEGER)''')
-    conn.commit()
-    conn.close()
+    def create(conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS highscores
+                        (id INTEGER PRIMARY KEY, name TEXT, score INTEGER)''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS highscores_score
+                        ON highscores (score DESC, id)''')
+        new = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'games'"
+        ).fetchone() is None
+        conn.execute('''CREATE TABLE IF NOT EXISTS games
+                        (id INTEGER PRIMARY KEY, name TEXT, score INTEGER)''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS games_score
+                        ON games (score DESC, id)''')
+        if new:
+            conn.execute('''INSERT INTO games (name, score)
+                            SELECT name, score FROM highscores ORDER BY id''')
+            conn.execute('DELETE FROM highscores WHERE score <= 0 OR name = ?',
+                         (ANONYMOUS_NAME,))
+    get_pool().write(create)
+
+def is_ranked(name, score):
+    """
+    Checks whether a finished game belongs on the leaderboard, which it
+    does when it was recorded under the player's initials with chips
+    left.
+
+    Parameters:
+        name (str): The name the game was recorded under.
+        score (int): The score achieved by the player.
+
+    Returns:
+        bool: True if the game is added to the highscores table.
+    """
+    return score > 0 and name != ANONYMOUS_NAME
 
 def add_highscore(name, score):
     """
-    Adds a highscore to the highscores table in the SQLite database.
+    Records a finished game in the games table, and adds it to the
+    highscores table in the SQLite database if it is_ranked.
     
-    This function connects to the database, creates a cursor, and executes an
-    SQL statement to insert a new highscore into the highscores table.
+    This function borrows a pooled connection and executes SQL
+    statements to insert the game into the tables.
     The SQL statement uses placeholders (?) to prevent SQL injection attacks.
     
-    After executing the SQL statement, the changes are committed and
-    the connection to the database is closed.
-    The function then calls the maintain_highscores function to ensure 
-    that only the top 3 highscores are kept in the table.
+    After executing the SQL statement, the changes are committed. The new
+    leaderboard is read inside the same transaction and written through
+    to the leaderboard cache.
+    If write-behind is enabled, the highscore is queued for the
+    background writer instead and the function returns straight away.
     
     Parameters:
         name (str): The name of the player.
@@ -91,60 +817,228 @@ def add_highscore(name, score):
     Returns:
         None
     """
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO highscores (name, score) VALUES (?, ?)',
-                   (name, score))
-    conn.commit()
-    conn.close()
-    maintain_highscores()
+    writer = _writer
+    if writer is not None:
+        writer.submit(name, score)
+    else:
+        _write_highscores([(name, score)])
+
+def add_highscores(rows, batch_size=INGEST_BATCH_SIZE):
+    """
+    Records many finished games in large batches, adding those that are
+    ranked to the highscores table as add_highscore does.
+
+    The rows are read from the iterable as they are needed, so results
+    can be streamed in while they are still being produced. Every batch
+    is inserted with executemany in one transaction with one commit, and
+    the new leaderboard is written through to the cache once per batch.
+    The rows are written straight away even if write-behind is enabled.
 
-def get_highscores():
+    Parameters:
+        rows (iterable of tuples): The name and score of each highscore.
+        batch_size (int): The number of highscores per transaction.
+
+    Returns:
+        int: The number of highscores added.
     """
-    Retrieves the top 3 highscores from the highscores table in the SQLite
+    added = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            _write_highscores(batch)
+            added += len(batch)
+            batch = []
+    if batch:
+        _write_highscores(batch)
+        added += len(batch)
+    return added
+
+def _write_highscores(rows):
+    """
+    Inserts games, and the highscores among them, in a single
+    transaction, then invalidates the cached leaderboard.
+
+    Parameters:
+        rows (list of tuples): The name and score of each game.
+
+    Returns:
+        None
+    """
+    ranked = [row for row in rows if is_ranked(*row)]
+    def insert(conn):
+        conn.executemany('INSERT INTO games (name, score) VALUES (?, ?)', rows)
+        if ranked:
+            conn.executemany(
+                'INSERT INTO highscores (name, score) VALUES (?, ?)', ranked)
+    get_pool().write(insert)
+    _cache.invalidate()
+
+def get_highscores(limit=LEADERBOARD_SIZE):
+    """
+    Retrieves the top highscores from the highscores table in the SQLite
     database.
     
-    This function connects to the database, creates a cursor, and executes
-    an SQL statement to select the name and score of the top 3 highscores.
+    The top 3 highscores are served from the leaderboard cache, which only
+    queries the table when the database has changed since the last read.
+    Longer lists are read from the front of the score index.
     The SQL statement orders the highscores by score in descending order
-    and limits the results to 3 rows.
-    
-    After executing the SQL statement, the highscores are fetched and
-    stored in a variable.
-    The connection to the database is then closed.
+    and limits the results to the requested number of rows. Highscores
+    still queued for the background writer are merged in.
     
     Parameters:
-        None
+        limit (int): The number of highscores to return.
     
     Returns:
         list of tuples: A list of tuples containing the name and score
-        of the top 3 highscores.
+        of the top highscores.
     
     Example:
         [('Alice', 100), ('Bob', 90), ('Charlie', 80)]
     
     """
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT name, score FROM highscores ORDER BY score DESC LIMIT 3')
-    highscores = cursor.fetchall()
-    conn.close()
+    if limit <= LEADERBOARD_SIZE:
+        highscores = _cache.read(get_pool())[0][:limit]
+    else:
+        with get_pool().connection() as conn:
+            highscores = _top_highscores(conn, limit)
+    writer = _writer
+    if writer is not None:
+        pending = [row for row in writer.pending() if is_ranked(*row)]
+        if pending:
+            highscores = sorted(highscores + pending,
+                                key=lambda row: row[1], reverse=True)[:limit]
     return highscores
 
+def get_highscore_threshold():
+    """
+    Returns the score a new score has to beat to enter the top 3
+    of the leaderboard.
+
+    This is read from the leaderboard cache, so checking whether a score
+    is a highscore is a single comparison in memory.
+
+    Parameters:
+        None
+
+    Returns:
+        int: The lowest of the top 3 scores, or None if there are fewer
+        than 3 highscores and any score gets in.
+    """
+    highscores = get_highscores()
+    return highscores[-1][1] if len(highscores) >= LEADERBOARD_SIZE else None
+
+def _top_highscores(conn, limit=LEADERBOARD_SIZE):
+    """
+    Retrieves the top highscores using the given connection.
+
+    Ties are broken by id, so the score that was set first ranks higher.
+
+    Parameters:
+        conn (sqlite3.Connection): The connection to query.
+        limit (int): The number of highscores to return.
+
+    Returns:
+        list of tuples: The name and score of the top highscores.
+    """
+    return conn.execute(
+        'SELECT name, score FROM highscores ORDER BY score DESC, id LIMIT ?',
+        (limit,)).fetchall()
+
+def get_rank(score):
+    """
+    Returns the leaderboard position a score would have among the
+    highscores, not counting the unranked games.
+
+    The count walks the score index from the top down to the score, so
+    it costs one index lookup plus one step per better score, which is
+    cheap for the scores near the top that players care about.
+
+    Parameters:
+        score (int): The score to rank.
+
+    Returns:
+        int: 1 plus the number of strictly higher scores.
+    """
+    with get_pool().connection() as conn:
+        higher = conn.execute('SELECT COUNT(*) FROM highscores WHERE score > ?',
+                              (score,)).fetchone()[0]
+    return higher + 1
+
+def get_leaderboard_page(page, page_size=10):
+    """
+    Retrieves one page of the full leaderboard.
+
+    The page is read from the score index with LIMIT and OFFSET, so the
+    cost grows with how deep the page is. get_leaderboard_after pages
+    through deep leaderboards at a constant cost per page.
+
+    Parameters:
+        page (int): The page number, starting at 1.
+        page_size (int): The number of highscores per page.
+
+    Returns:
+        list of tuples: The name and score of each highscore on the page.
+    """
+    with get_pool().connection() as conn:
+        return conn.execute(
+            '''SELECT name, score FROM highscores ORDER BY score DESC, id
+               LIMIT ? OFFSET ?''',
+            (page_size, (page - 1) * page_size)).fetchall()
+
+def get_leaderboard_after(after=None, limit=10):
+    """
+    Retrieves the highscores that follow a given highscore on the
+    leaderboard.
+
+    This is keyset pagination: the last row of one page is passed in to
+    fetch the next, and the query seeks straight to it in the score
+    index, so every page costs one index lookup plus the rows returned.
+
+    Parameters:
+        after (tuple): The (id, name, score) row the previous page ended
+        with, or None to start at the top.
+        limit (int): The number of highscores to return.
+
+    Returns:
+        list of tuples: The id, name and score of each highscore.
+    """
+    with get_pool().connection() as conn:
+        if after is None:
+            return conn.execute(
+                '''SELECT id, name, score FROM highscores
+                   ORDER BY score DESC, id LIMIT ?''', (limit,)).fetchall()
+        score_id, _, score = after
+        return conn.execute(
+            '''SELECT id, name, score FROM highscores
+               WHERE score <= ? AND (score < ? OR id > ?)
+               ORDER BY score DESC, id LIMIT ?''',
+            (score, score, score_id, limit)).fetchall()
+
+def _lowest_highscore(conn):
+    """
+    Retrieves the lowest highscore using the given connection.
+
+    Parameters:
+        conn (sqlite3.Connection): The connection to query.
+
+    Returns:
+        tuple: A tuple containing the id and score of the lowest highscore.
+    """
+    return conn.execute(
+        'SELECT id, score FROM highscores ORDER BY score ASC, id DESC LIMIT 1'
+    ).fetchone()
+
 def get_lowest_highscore():
     """
     Retrieves the lowest highscore from the highscores table in the SQLite
     database.
     
-    This function connects to the database, creates a cursor, and executes
-    an SQL statement to select the id and score of the lowest highscore.
+    The lowest highscore is served from the leaderboard cache, which only
+    queries the table when the database has changed since the last read.
     The SQL statement orders the highscores by score in ascending order
     and limits the results to 1 row.
     
-    After executing the SQL statement, the lowest highscore is fetched
-    and stored in a variable.
-    The connection to the database is then closed.
-    
     Parameters:
         None
         
@@ -154,23 +1048,18 @@ def get_lowest_highscore():
     Example:
         (1, 50)
     """
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, score FROM highscores ORDER BY score ASC LIMIT 1')
-    lowest = cursor.fetchone()
-    conn.close()
-    return lowest
+    return _cache.read(get_pool())[1]
 
 def delete_highscore(score_id):
     """
     Deletes a highscore from the highscores table in the SQLite database.
     
-    This function connects to the database, creates a cursor, and
-    executes an SQL statement to delete a highscore from the highscores table.
+    This function borrows a pooled connection and executes an SQL
+    statement to delete a highscore from the highscores table.
     The SQL statement uses placeholders (?) to prevent SQL injection attacks.
     
     After executing the SQL statement, the changes are committed
-    and the connection to the database is closed.
+    and the connection is returned to the pool.
     
     Parameters:
         score_id (int): The id of the highscore to be deleted.
@@ -178,37 +1067,88 @@ def delete_highscore(score_id):
     Returns:
         None
     """
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM highscores WHERE id = ?', (score_id,))
-    conn.commit()
-    conn.close()
+    get_pool().write(lambda conn: conn.execute(
+        'DELETE FROM highscores WHERE id = ?', (score_id,)))
 
-def maintain_highscores():
+def maintain_highscores(keep=HIGHSCORE_LIMIT, history=HISTORY_LIMIT,
+                        batch_size=PRUNE_BATCH_SIZE):
     """
-    Maintains the highscores table by keeping only the top 3 highscores.
+    Maintains the highscores and games tables by keeping only the best
+    highscores and the most recent games.
 
-    This function connects to the database, creates a cursor, and
-    executes an SQL statement to count the number of rows in the
-    highscores table.
-    If the number of rows is greater than 3, the function calls
-    the get_lowest_highscore function to get the lowest highscore.
-    The function then calls the delete_highscore function to delete
-    the lowest highscore.
-    After deleting the lowest highscore, the connection to the
-    database is closed.
+    This is a retention job to be run on its own schedule rather than
+    on every insert. For each table it finds the last row that is kept
+    and then deletes the rows past it batch_size rows at a time, each
+    batch in its own short transaction so that sessions can keep writing
+    in between. Ties between highscores are broken by id, keeping the
+    score that was set first.
 
     Parameters:
-        None
+        keep (int): The number of highscores to keep, or None to keep
+        every highscore.
+        history (int): The number of games to keep, or None to keep
+        every game.
+        batch_size (int): The most rows deleted per transaction.
     
     Returns:
-        None
+        tuple: The number of highscores and the number of games deleted.
+    """
+    pool = get_pool()
+    highscores = games = 0
+    if keep is not None:
+        if keep > 0:
+            with pool.connection() as conn:
+                cutoff = conn.execute(
+                    '''SELECT score, id FROM highscores ORDER BY score DESC, id
+                       LIMIT 1 OFFSET ?''', (keep - 1,)).fetchone()
+            if cutoff is not None:
+                score, score_id = cutoff
+                highscores = _delete_in_batches(
+                    '''DELETE FROM highscores WHERE id IN
+                       (SELECT id FROM highscores
+                        WHERE score < ? OR (score = ? AND id > ?) LIMIT ?)''',
+                    (score, score, score_id), batch_size)
+        else:
+            highscores = _delete_in_batches(
+                '''DELETE FROM highscores WHERE id IN
+                   (SELECT id FROM highscores LIMIT ?)''', (), batch_size)
+    if history is not None:
+        if history > 0:
+            #ids only grow, so the most recent games are those with the
+            #highest ids, found from the end of the primary key
+            with pool.connection() as conn:
+                cutoff = conn.execute(
+                    'SELECT id FROM games ORDER BY id DESC LIMIT 1 OFFSET ?',
+                    (history - 1,)).fetchone()
+            if cutoff is not None:
+                games = _delete_in_batches(
+                    '''DELETE FROM games WHERE id IN
+                       (SELECT id FROM games WHERE id < ? LIMIT ?)''',
+                    cutoff, batch_size)
+        else:
+            games = _delete_in_batches(
+                '''DELETE FROM games WHERE id IN
+                   (SELECT id FROM games LIMIT ?)''', (), batch_size)
+    return highscores, games
+
+def _delete_in_batches(statement, parameters, batch_size):
+    """
+    Runs a DELETE statement, whose last parameter is the batch size,
+    until it deletes fewer rows than a full batch.
+
+    Parameters:
+        statement (str): The DELETE statement.
+        parameters (tuple): Its parameters before the batch size.
+        batch_size (int): The most rows deleted per transaction.
+
+    Returns:
+        int: The number of rows deleted.
     """
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM highscores')
-    count = cursor.fetchone()[0]
-    if count > 3:
-        lowest = get_lowest_highscore()
-        delete_highscore(lowest[0])
-    conn.close()
+    pool = get_pool()
+    parameters = parameters + (batch_size,)
+    deleted = 0
+    while True:
+        count = pool.write(lambda conn: conn.execute(statement, parameters).rowcount)
+        deleted += count
+        if count < batch_size:
+            return deleted
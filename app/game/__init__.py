@@ -1 +1 @@
-from .game import Deck, Hand, Chips
\ No newline at end of file
+from .game import Deck, Shoe, Hand, Chips
\ No newline at end of file
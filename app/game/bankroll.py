@@ -0,0 +1,256 @@
+"""
+This module contains a risk of ruin and session length estimator for the
+player's chips.
+
+A session of GameEngine lasts while the player has chips left. Given
+the starting Chips total, a betting policy and the probabilities of
+winning, losing and pushing a round, the estimator plays out a few
+hundred thousand bankroll random walks at once as NumPy arrays. Every
+round draws one outcome for each path in the arrays; paths that reach
+zero are recorded as they do and compacted out of the arrays whenever
+they make up a quarter of them, so the work done in each round shrinks
+with the number of paths still alive.
+
+A win pays the bet and a loss costs it, including on a natural 21, as in
+the interactive game. The outcome probabilities can be measured with the
+simulation engines, see outcome_probabilities.
+
+Classes:
+    BankrollResult: Holds the ruin counts and chip totals of the paths.
+
+Functions:
+    flat_bet(amount): A policy betting the same amount every round.
+    proportional_bet(fraction, minimum): A policy betting a fraction of
+    the chips.
+    outcome_probabilities(result): Returns the measured outcome rates of
+    a simulation.
+    estimate_ruin(chips, probabilities, policy, paths, max_rounds, rng):
+    Plays out the bankroll paths.
+    format_bankroll_report(result): Formats a BankrollResult as text.
+
+Attributes:
+    QUANTILES (tuple): The quantiles shown in the report.
+"""
+import time
+import numpy as np
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def flat_bet(amount):
+    """
+    Returns a policy that bets the same amount every round, or all the
+    chips left if there are fewer, as the betting prompt allows.
+
+    Parameters:
+        amount (int): The number of chips to bet.
+
+    Returns:
+        function: The policy, mapping an array of chip totals to bets.
+    """
+    if amount < 1:
+        raise ValueError('a bet must be at least one chip')
+    return lambda totals: np.minimum(totals, amount)
+
+
+def proportional_bet(fraction, minimum=1):
+    """
+    Returns a policy that bets a fraction of the chips, rounded down.
+
+    Parameters:
+        fraction (float): The fraction of the chips to bet, greater than
+        0 and at most 1.
+        minimum (int): The smallest bet, used while the fraction is
+        worth less, capped at the chips left.
+
+    Returns:
+        function: The policy, mapping an array of chip totals to bets.
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError('fraction must be greater than 0 and at most 1')
+    return lambda totals: np.minimum(
+        totals, np.maximum((totals * fraction).astype(totals.dtype), minimum))
+
+
+def outcome_probabilities(result):
+    """
+    Returns the measured outcome rates of a simulation run.
+
+    Parameters:
+        result (SimulationResult): The result of simulate, simulate_batch
+        or simulate_parallel.
+
+    Returns:
+        tuple: The win, loss and push probabilities.
+    """
+    return (result.rate(result.wins), result.rate(result.losses),
+            result.rate(result.pushes))
+
+
+class BankrollResult:
+    """
+    Holds the outcome of a set of bankroll paths.
+
+    Attributes:
+        chips_start (int): The chip total every path started with.
+        paths (int): The number of paths played.
+        max_rounds (int): The most rounds a path was played for.
+        rounds_to_ruin (numpy.ndarray): The round on which each ruined
+        path reached zero chips, in the order they were ruined.
+        final_chips (numpy.ndarray): The chip total of every path at the
+        end, zero for the ruined ones.
+        elapsed (float): The wall clock time of the run in seconds.
+    """
+    def __init__(self, chips_start, paths, max_rounds, rounds_to_ruin,
+                 final_chips, elapsed):
+        """
+        Initializes a BankrollResult.
+
+        Parameters:
+            chips_start (int): The chip total every path started with.
+            paths (int): The number of paths played.
+            max_rounds (int): The most rounds a path was played for.
+            rounds_to_ruin (numpy.ndarray): The ruin round of each ruined
+            path.
+            final_chips (numpy.ndarray): The final chip total of every
+            path.
+            elapsed (float): The wall clock time of the run in seconds.
+
+        Returns:
+            None
+        """
+        self.chips_start = chips_start
+        self.paths = paths
+        self.max_rounds = max_rounds
+        self.rounds_to_ruin = rounds_to_ruin
+        self.final_chips = final_chips
+        self.elapsed = elapsed
+
+    @property
+    def risk_of_ruin(self):
+        """
+        Returns the fraction of paths that ran out of chips within
+        max_rounds rounds.
+
+        Returns:
+            float: The risk of ruin.
+        """
+        return len(self.rounds_to_ruin) / self.paths if self.paths else 0.0
+
+    def session_quantiles(self, quantiles=QUANTILES):
+        """
+        Returns quantiles of the number of rounds until zero chips.
+
+        Paths that were never ruined count as lasting max_rounds, so
+        quantiles above the risk of ruin equal max_rounds.
+
+        Parameters:
+            quantiles (tuple): The quantiles to compute.
+
+        Returns:
+            dict: The number of rounds at each quantile.
+        """
+        lengths = np.full(self.paths, self.max_rounds, dtype=np.int64)
+        lengths[:len(self.rounds_to_ruin)] = self.rounds_to_ruin
+        values = np.quantile(lengths, quantiles, method='lower')
+        return dict(zip(quantiles, values.tolist()))
+
+    def final_quantiles(self, quantiles=QUANTILES):
+        """
+        Returns quantiles of the final chip total.
+
+        Parameters:
+            quantiles (tuple): The quantiles to compute.
+
+        Returns:
+            dict: The chip total at each quantile.
+        """
+        values = np.quantile(self.final_chips, quantiles, method='lower')
+        return dict(zip(quantiles, values.tolist()))
+
+
+def estimate_ruin(chips=100, probabilities=(0.42, 0.49, 0.09), policy=None,
+                  paths=200_000, max_rounds=10_000, rng=None):
+    """
+    Plays out many bankroll paths and records when each one is ruined.
+
+    Parameters:
+        chips (Chips or int): The starting chips, a Chips object or its
+        total.
+        probabilities (tuple): The win, loss and push probability of a
+        round. They are normalised to add up to one.
+        policy (function): Maps an array of chip totals to an array of
+        bets, for example flat_bet(10), which is the default.
+        paths (int): The number of bankroll paths.
+        max_rounds (int): The most rounds to play on each path.
+        rng (numpy.random.Generator): The generator to draw outcomes
+        with.
+
+    Returns:
+        BankrollResult: The ruin rounds and final chips of the paths.
+    """
+    start_chips = int(getattr(chips, 'total', chips))
+    if start_chips < 1:
+        raise ValueError('a session needs at least one chip')
+    win, loss, push = (float(p) for p in probabilities)
+    total = win + loss + push
+    if total <= 0 or min(win, loss, push) < 0:
+        raise ValueError('probabilities must be non-negative with a positive sum')
+    win, loss = win / total, loss / total
+    #wins are checked against 1 - win, which must not reach into losses
+    win = min(win, 1 - loss)
+    policy = policy if policy is not None else flat_bet(10)
+    rng = rng if rng is not None else np.random.default_rng()
+    start = time.perf_counter()
+    totals = np.full(paths, start_chips, dtype=np.int64)
+    ruined = []
+    #ruined paths still in the arrays, which stay at zero since every
+    #policy bets at most the chips left
+    broke = 0
+    for played in range(1, max_rounds + 1):
+        if broke == totals.size:
+            break
+        draw = rng.random(totals.size, dtype=np.float32)
+        bets = policy(totals)
+        #losses take the bottom of [0, 1) and wins the top
+        totals -= bets * (draw < loss)
+        totals += bets * (draw >= 1 - win)
+        count = int(np.count_nonzero(totals <= 0)) - broke
+        if count:
+            ruined.append(np.full(count, played, dtype=np.int64))
+            broke += count
+            if broke * 4 > totals.size:
+                totals = totals[totals > 0]
+                broke = 0
+    totals = totals[totals > 0]
+    rounds_to_ruin = np.concatenate(ruined) if ruined else np.zeros(0, np.int64)
+    final_chips = np.zeros(paths, dtype=np.int64)
+    final_chips[len(rounds_to_ruin):] = totals
+    return BankrollResult(start_chips, paths, max_rounds, rounds_to_ruin,
+                          final_chips, time.perf_counter() - start)
+
+
+def format_bankroll_report(result):
+    """
+    Formats a BankrollResult as a plain text report.
+
+    Parameters:
+        result (BankrollResult): The result to format.
+
+    Returns:
+        str: The report, one statistic per line.
+    """
+    lines = [
+        f"Paths:           {result.paths}",
+        f"Starting chips:  {result.chips_start}",
+        f"Max rounds:      {result.max_rounds}",
+        f"Elapsed:         {result.elapsed:.3f}s",
+        f"Risk of ruin:    {result.risk_of_ruin:.4%}",
+        "Rounds until zero chips:",
+    ]
+    lines.extend(f"  {quantile:>4.0%}: {rounds}" for quantile, rounds
+                 in result.session_quantiles().items())
+    lines.append("Final chips:")
+    lines.extend(f"  {quantile:>4.0%}: {chips}" for quantile, chips
+                 in result.final_quantiles().items())
+    return '\n'.join(lines)
@@ -0,0 +1,254 @@
+"""
+This module contains an array-backed batch engine for the Black Jack game.
+
+Instead of dealing Card objects into Hand objects one round at a time, the
+batch engine holds N decks as one integer matrix and N hands as arrays of
+totals and soft ace counts, so that millions of rounds are played with a
+handful of NumPy operations per card dealt. The rules are the same as
+end_game in run.py and play_round in simulation.py.
+
+Classes:
+    DeckBatch: Represents N shuffled decks as a matrix of card codes.
+    HandBatch: Represents N hands as arrays of hand states.
+
+Functions:
+    play_batch(decks, hits): Plays one round on every deck in a batch.
+    simulate_batch(rounds, strategy, bet): Plays rounds in batches.
+
+Attributes:
+    CARD_VALUES (numpy.ndarray): The value of each card code, as in the
+    card tables of game.py.
+    HAND_TRANSITIONS (numpy.ndarray): game.HAND_TRANSITIONS as an array.
+    STATE_VALUES (numpy.ndarray): game.STATE_VALUES as an array.
+"""
+import time
+import numpy as np
+from . import game
+from .game import Chips, DEALER_STAND_TOTAL
+from .rng import FastRNG
+from .simulation import WIN, LOSS, PUSH, SimulationResult, hit_table
+
+CARD_VALUES = np.array(game.CARD_VALUES, dtype=np.int8)
+HAND_TRANSITIONS = np.array(game.HAND_TRANSITIONS, dtype=np.int8)
+STATE_VALUES = np.array(game.STATE_VALUES, dtype=np.int8)
+
+
+class DeckBatch:
+    """
+    Represents N decks of playing cards as a matrix of card codes.
+
+    Card codes index CARD_VALUES. The decks are shuffled lazily: each deal
+    swaps a uniformly chosen undealt card into the cursor position of its
+    row, which is the Fisher-Yates shuffle done one column at a time. A
+    batch of rounds therefore only pays for the cards it uses rather than
+    for permuting all 52 cards of every deck up front. Every deck keeps
+    its own cursor, so that decks can be dealt from at different rates.
+
+    Attributes:
+        cards (numpy.ndarray): An (N, 52) matrix of card codes.
+        cursor (numpy.ndarray): The position of the next card in each deck.
+
+    Methods:
+        shuffle: Returns every dealt card to its deck.
+        deal: Deals one card from each selected deck.
+    """
+    def __init__(self, size, rng=None):
+        """
+        Initializes a batch of shuffled decks.
+
+        Parameters:
+            size (int): The number of decks in the batch.
+            rng (numpy.random.Generator): The generator to shuffle with,
+            or a FastRNG whose generator is used.
+
+        Returns:
+            None
+        """
+        if isinstance(rng, FastRNG):
+            rng = rng.generator
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.cards = np.tile(np.arange(len(CARD_VALUES), dtype=np.int8),
+                             (size, 1))
+        self.cursor = np.zeros(size, dtype=np.intp)
+
+    def shuffle(self):
+        """
+        Returns every dealt card to its deck so that all decks are dealt
+        afresh in a new random order.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.cursor[:] = 0
+
+    def deal(self, rows=None):
+        """
+        Deals the next card from the selected decks.
+
+        Parameters:
+            rows (numpy.ndarray): The indices of the decks to deal from,
+            defaults to every deck.
+
+        Returns:
+            numpy.ndarray: The values of the dealt cards, one per row.
+        """
+        if rows is None:
+            rows = np.arange(len(self.cursor))
+        position = self.cursor[rows]
+        remaining = self.cards.shape[1] - position
+        swap = position + (self.rng.random(len(rows)) * remaining).astype(np.intp)
+        dealt = self.cards[rows, swap]
+        self.cards[rows, swap] = self.cards[rows, position]
+        self.cards[rows, position] = dealt
+        self.cursor[rows] = position + 1
+        return CARD_VALUES[dealt]
+
+
+class HandBatch:
+    """
+    Represents N hands of playing cards as arrays.
+
+    Attributes:
+        state (numpy.ndarray): The hand state of each hand, an index into
+        the state tables of game.py.
+        value (numpy.ndarray): The total value of each hand.
+
+    Methods:
+        add_cards: Adds one card to each selected hand.
+    """
+    def __init__(self, size):
+        """
+        Initializes N empty hands.
+
+        Parameters:
+            size (int): The number of hands.
+
+        Returns:
+            None
+        """
+        self.state = np.zeros(size, dtype=np.int8)
+        self.value = np.zeros(size, dtype=np.int8)
+
+    def add_cards(self, card_values, rows=None):
+        """
+        Adds a card to each selected hand and adjusts for aces.
+
+        This is Hand.add_card applied to every row at once: one gather
+        from HAND_TRANSITIONS, with no branches for aces.
+
+        Parameters:
+            card_values (numpy.ndarray): The value of the card for each row.
+            rows (numpy.ndarray): The indices of the hands to add to,
+            defaults to every hand.
+
+        Returns:
+            None
+        """
+        if rows is None:
+            rows = slice(None)
+        state = HAND_TRANSITIONS[self.state[rows], card_values]
+        self.state[rows] = state
+        self.value[rows] = STATE_VALUES[state]
+
+
+def play_batch(decks, hits):
+    """
+    Plays one round on every deck in a batch.
+
+    Parameters:
+        decks (DeckBatch): The decks to deal from.
+        hits (numpy.ndarray): The decisions of the player's strategy,
+        hit_table as a boolean array indexed by hand state and upcard.
+
+    Returns:
+        numpy.ndarray: WIN, LOSS or PUSH for each round.
+    """
+    size = len(decks.cursor)
+    player = HandBatch(size)
+    dealer = HandBatch(size)
+    player.add_cards(decks.deal())
+    player.add_cards(decks.deal())
+    dealer.add_cards(decks.deal())
+    #the dealer's second card is the one shown to the player
+    upcard = decks.deal()
+    dealer.add_cards(upcard)
+    outcome = np.full(size, PUSH, dtype=np.int8)
+    #check for blackjack on dealt cards
+    player_natural = player.value == 21
+    dealer_natural = dealer.value == 21
+    outcome[player_natural & ~dealer_natural] = WIN
+    outcome[dealer_natural & ~player_natural] = LOSS
+    playing = ~(player_natural | dealer_natural)
+
+    hitting = hits[player.state, upcard]
+    rows = np.flatnonzero(playing & hitting)
+    while rows.size:
+        player.add_cards(decks.deal(rows), rows)
+        rows = rows[hits[player.state[rows], upcard[rows]]]
+    busted = playing & (player.value > 21)
+    outcome[busted] = LOSS
+    playing &= ~busted
+
+    rows = np.flatnonzero(playing & (dealer.value < DEALER_STAND_TOTAL))
+    while rows.size:
+        dealer.add_cards(decks.deal(rows), rows)
+        rows = rows[dealer.value[rows] < DEALER_STAND_TOTAL]
+    outcome[playing & ((dealer.value > 21) | (dealer.value < player.value))] = WIN
+    outcome[playing & (dealer.value <= 21) & (dealer.value > player.value)] = LOSS
+    return outcome
+
+
+def simulate_batch(rounds, strategy='dealer-mimic', bet=10, samples=20,
+                   batch_size=250_000, rng=None):
+    """
+    Plays a number of rounds with the batch engine and collects the results.
+
+    Every round is dealt from its own freshly shuffled deck, as in
+    simulate. Rounds are played batch_size at a time to keep memory
+    bounded, and the chip trajectory runs through the rounds in order.
+
+    Parameters:
+        rounds (int): The number of rounds to play.
+        strategy (str): The name of a strategy in STRATEGIES, with the
+        'optimal' strategy playing the solver's decisions for one deck.
+        bet (int): The number of chips bet on every round.
+        samples (int): The number of trajectory samples to record.
+        batch_size (int): The number of rounds played at once.
+        rng (numpy.random.Generator): The generator to shuffle with.
+
+    Returns:
+        SimulationResult: The outcome counts and chip trajectory.
+    """
+    hits = np.array(hit_table(strategy), dtype=bool)
+    rng = rng if rng is not None else np.random.default_rng()
+    result = SimulationResult(strategy, Chips().total)
+    sample_every = max(1, rounds // samples) if samples else rounds + 1
+    total = result.chips_start
+    start = time.perf_counter()
+    played = 0
+    decks = None
+    while played < rounds:
+        size = min(batch_size, rounds - played)
+        if decks is None or len(decks.cursor) != size:
+            decks = DeckBatch(size, rng)
+        else:
+            decks.shuffle()
+        outcome = play_batch(decks, hits)
+        result.wins += int(np.count_nonzero(outcome == WIN))
+        result.losses += int(np.count_nonzero(outcome == LOSS))
+        chips = total + bet * np.cumsum(outcome, dtype=np.int64)
+        result.chips_min = min(result.chips_min, int(chips.min()))
+        result.chips_max = max(result.chips_max, int(chips.max()))
+        first = sample_every - played % sample_every - 1
+        for index in range(first, size, sample_every):
+            result.trajectory.append((played + index + 1, int(chips[index])))
+        total = int(chips[-1])
+        played += size
+    result.elapsed = time.perf_counter() - start
+    result.rounds = rounds
+    result.pushes = rounds - result.wins - result.losses
+    result.chips_final = total
+    return result
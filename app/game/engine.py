@@ -0,0 +1,560 @@
+"""
+This module contains the game engine that every way of playing shares.
+
+start_new_game in run.py used to play a session with its prompts and
+printing mixed in with the rules, and went back to the menu by calling
+main_menu again, which could call start_new_game again, so every game
+played left more frames and hands on the stack. The engine holds the
+flow of the game as an explicit state machine instead:
+
+    menu -> bet -> player turn -> play again -> initials -> high scores
+         -> game over -> menu
+    menu -> high scores -> menu
+
+The deal, the dealer's turn and settling the bet happen between those
+states, as part of the action that leads to them. Each call to act
+takes one action, moves the engine to its next state and returns what
+happened on the way as a list of event dictionaries. The engine never
+reads input or prints, so the interactive game, the scripted driver and
+the tournament bots all play by the same rules while reading actions and
+showing events in their own way, and a session runs in a loop whose
+stack depth does not grow with the number of games played.
+
+Every event has an 'event' key naming it:
+
+    menu          the main menu is shown
+    new_game      a session started, with the starting chips
+    high_scores   the high scores table is shown, with the player's
+                  score and rank after a game
+    round_start   a round is waiting for a bet, with the chips left and
+                  whether the shoe was reshuffled
+    deal          the bet was taken and the hands were dealt
+    hit           the player drew a card
+    stand         the player stood and the dealer played
+    round         the round was settled, with both hands, the outcome
+                  and the reason for it
+    quit          the player chose not to play another round
+    highscore     the score made the high score table and the engine
+                  waits for the player's initials
+    session       the session ended and its score was recorded
+    error         the action was not valid, with a message, and the
+                  engine stays in the same state
+    exit          the player left the game
+    resumed       a snapshot was restored, with the state, the chips
+                  and, during the player's turn, the hands
+
+A session can be saved with snapshot and carried on later, in this
+process or another one, with restore. A snapshot is a few hundred bytes:
+a packed header followed by the card codes of the whole shoe, in order,
+and of both hands, so a restored session deals exactly the cards it
+would have dealt. It does not hold the state of the random number
+generator, so the shoe is shuffled differently once the cut card is
+reached.
+
+Classes:
+    GameEngine: Plays sessions of Black Jack one action at a time.
+
+Functions:
+    hand_summary(hand): Returns the cards and value of a hand.
+
+Attributes:
+    MENU, BETTING, PLAYER_TURN, PLAY_AGAIN, INITIALS, HIGH_SCORES,
+    GAME_OVER, EXIT (str): The states of the engine.
+    STATES (tuple): Every state, in the order snapshots number them.
+    STATE_ACTIONS (dict): The actions that each state accepts.
+    OUTCOMES (dict): The name of each round outcome in events.
+    SNAPSHOT_MAGIC (bytes): The bytes every snapshot starts with.
+    SNAPSHOT_VERSION (int): The version of the snapshot layout.
+    SNAPSHOT_HEADER (struct.Struct): The fixed size start of a snapshot.
+"""
+import re
+import struct
+from .game import Shoe, Hand, Chips, CARDS, DEALER_STAND_TOTAL
+from .simulation import WIN, LOSS, PUSH
+
+MENU = 'menu'
+BETTING = 'betting'
+PLAYER_TURN = 'player_turn'
+PLAY_AGAIN = 'play_again'
+INITIALS = 'initials'
+HIGH_SCORES = 'high_scores'
+GAME_OVER = 'game_over'
+EXIT = 'exit'
+
+STATE_ACTIONS = {MENU: ('new_game', 'high_scores', 'exit'),
+                 BETTING: ('bet',),
+                 PLAYER_TURN: ('hit', 'stand'),
+                 PLAY_AGAIN: ('again', 'quit'),
+                 INITIALS: ('name',),
+                 HIGH_SCORES: ('back',),
+                 GAME_OVER: ('menu',),
+                 EXIT: ()}
+
+STATES = (MENU, BETTING, PLAYER_TURN, PLAY_AGAIN, INITIALS, HIGH_SCORES,
+          GAME_OVER, EXIT)
+
+OUTCOMES = {WIN: 'win', LOSS: 'loss', PUSH: 'push'}
+
+SNAPSHOT_MAGIC = b'BJS'
+SNAPSHOT_VERSION = 1
+#magic, version, state, state after the high scores, reshuffled, decks,
+#chips total, bet, rounds, shuffles, cursor, cut, player and dealer
+#card counts, followed by one byte per card of the shoe and the hands
+SNAPSHOT_HEADER = struct.Struct('<3sBBBBBiiIIHHBB')
+
+#the actions typed at the prompts of the interactive game
+_MENU_CHOICES = {'1': 'new_game', '2': 'high_scores', '3': 'exit'}
+_TURN_CHOICES = {'h': 'hit', 's': 'stand'}
+_AGAIN_CHOICES = {'y': 'again', 'n': 'quit'}
+
+
+def hand_summary(hand):
+    """
+    Returns the cards and value of a hand for an event.
+
+    Parameters:
+        hand (Hand): The hand.
+
+    Returns:
+        dict: The card names and the hand value.
+    """
+    return {'cards': [str(card) for card in hand.cards], 'value': hand.value}
+
+
+def _error(message, **fields):
+    """
+    Returns an error event.
+
+    Parameters:
+        message (str): The message shown to the player.
+        fields: Further keys of the event.
+
+    Returns:
+        dict: The event.
+    """
+    return dict(event='error', message=message, **fields)
+
+
+class GameEngine:
+    """
+    Plays sessions of Black Jack one action at a time, with the rules of
+    the interactive game.
+
+    Attributes:
+        state (str): The state the engine is in.
+        shoe (Shoe): The shoe of the current session.
+        chips (Chips): The player's chips in the current session.
+        player_hand (Hand): The player's hand in the current round.
+        dealer_hand (Hand): The dealer's hand in the current round.
+        rounds (int): The number of rounds settled in the session.
+        reshuffled (bool): Whether the shoe was reshuffled before the
+        current round.
+
+    Methods:
+        start: Returns the events of the first screen.
+        act: Takes an action and returns the events it led to.
+        send: Takes a line typed at the prompt of the current state.
+        snapshot: Returns the state of the session as bytes.
+        restore: Carries on the session saved in a snapshot.
+    """
+    def __init__(self, new_shoe=None, add_highscore=None, is_highscore=None,
+                 get_rank=None, get_highscores=None, anonymous_name='---'):
+        """
+        Initializes a GameEngine at the main menu.
+
+        Parameters:
+            new_shoe (function): Returns the Shoe for a new session,
+            defaults to a six deck Shoe.
+            add_highscore (function): Records a name and score, or None
+            to record nothing.
+            is_highscore (function): Returns whether a score makes the
+            high score table, or None if no score does.
+            get_rank (function): Returns the rank of a score among the
+            high scores, or None to leave ranks out of the events.
+            get_highscores (function): Returns the (name, score) rows of
+            the high score table.
+            anonymous_name (str): The name recorded for a score that
+            does not make the high score table.
+
+        Returns:
+            None
+        """
+        self.new_shoe = new_shoe if new_shoe is not None else Shoe
+        self.add_highscore = add_highscore
+        self.is_highscore = is_highscore
+        self.get_rank = get_rank
+        self.get_highscores = get_highscores
+        self.anonymous_name = anonymous_name
+        self.state = MENU
+        self.shoe = None
+        self.chips = None
+        self.player_hand = None
+        self.dealer_hand = None
+        self.rounds = 0
+        self.reshuffled = False
+        #the state the high scores table returns to
+        self._after_scores = MENU
+
+    def start(self):
+        """
+        Returns the events of the screen the engine starts on.
+
+        Parameters:
+        None
+
+        Returns:
+        list: The events.
+        """
+        return [{'event': self.state}] if self.state == MENU else []
+
+    def act(self, action, argument=None):
+        """
+        Takes one action and moves the engine to its next state.
+
+        Parameters:
+            action (str): One of the actions in STATE_ACTIONS for the
+            current state.
+            argument (str or int): The amount of a bet or the initials
+            of a name.
+
+        Returns:
+            list: The events that happened, a single error event if the
+            action was not valid in the current state.
+        """
+        expected = STATE_ACTIONS[self.state]
+        if action not in expected:
+            if not expected:
+                return [_error('the game is over')]
+            return [_error(f'expected {" or ".join(expected)}, got {action}')]
+        return getattr(self, '_' + action)(argument)
+
+    def send(self, line):
+        """
+        Takes a line typed at the prompt of the current state, as the
+        interactive game reads them.
+
+        Parameters:
+            line (str): The line, without the newline.
+
+        Returns:
+            list: The events that happened.
+        """
+        line = line.strip()
+        if self.state == MENU:
+            if line not in _MENU_CHOICES:
+                return [_error("Invalid choice. Please enter 1, 2, or 3.")]
+            return self.act(_MENU_CHOICES[line])
+        if self.state == BETTING:
+            return self.act('bet', line)
+        if self.state == PLAYER_TURN:
+            if line[:1].lower() not in _TURN_CHOICES:
+                return [_error("Invalid input, please enter either 'h' or 's'.")]
+            return self.act(_TURN_CHOICES[line[:1].lower()])
+        if self.state == PLAY_AGAIN:
+            if line.lower() not in _AGAIN_CHOICES:
+                return [_error("Invalid input. Please enter 'y' or 'n'.")]
+            return self.act(_AGAIN_CHOICES[line.lower()])
+        if self.state == INITIALS:
+            return self.act('name', line)
+        if self.state == HIGH_SCORES:
+            if line != 'b':
+                return [_error("Invalid input. Type b to return to the main menu.")]
+            return self.act('back')
+        if self.state == GAME_OVER:
+            if line:
+                return [_error("Invalid input. Please press Enter to return"
+                               " to the main menu.")]
+            return self.act('menu')
+        return self.act(line)
+
+    def snapshot(self):
+        """
+        Returns the whole state of the session as a compact snapshot.
+
+        Parameters:
+        None
+
+        Returns:
+        bytes: The snapshot, which restore takes back.
+        """
+        shoe, chips = self.shoe, self.chips
+        player = self.player_hand.cards if self.player_hand else []
+        dealer = self.dealer_hand.cards if self.dealer_hand else []
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, STATES.index(self.state),
+            STATES.index(self._after_scores), self.reshuffled,
+            shoe.decks if shoe else 0, chips.total if chips else 0,
+            chips.bet if chips else 0, self.rounds,
+            shoe.shuffles if shoe else 0, shoe.cursor if shoe else 0,
+            shoe.cut if shoe else 0, len(player), len(dealer))
+        return b''.join((header,
+                         bytes([card.code for card in shoe.cards]) if shoe else b'',
+                         bytes([card.code for card in player + dealer])))
+
+    def restore(self, data):
+        """
+        Carries on the session saved in a snapshot, replacing the
+        current one. The shoe is set to the saved order, reusing the
+        current shoe if a game is in progress with the same number of
+        decks and otherwise one made with new_shoe. A shoe that is not
+        reused has its prefetcher closed.
+
+        Parameters:
+            data (bytes): A snapshot returned by snapshot.
+
+        Returns:
+            list: A 'resumed' event describing the restored session.
+
+        Raises:
+            ValueError: If the data is not a valid snapshot.
+        """
+        if len(data) < SNAPSHOT_HEADER.size:
+            raise ValueError('snapshot is truncated')
+        (magic, version, state, after_scores, reshuffled, decks, total, bet,
+         rounds, shuffles, cursor, cut, players, dealers) = \
+            SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('not a game snapshot')
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f'unsupported snapshot version {version}')
+        size = decks * len(CARDS)
+        cards = data[SNAPSHOT_HEADER.size:]
+        if len(cards) != size + players + dealers or \
+                max(state, after_scores) >= len(STATES) or \
+                (cards and max(cards) >= len(CARDS)):
+            raise ValueError('snapshot is corrupt')
+        #the fields are checked against each other too, so that a bad
+        #snapshot is turned down here rather than failing later in the game
+        if cursor > size or cut > size or total < 0 or bet < 0 or \
+                STATES[after_scores] not in (MENU, GAME_OVER) or \
+                (STATES[state] in (BETTING, PLAYER_TURN, PLAY_AGAIN, INITIALS)
+                 and not decks) or \
+                (STATES[state] == PLAYER_TURN and min(players, dealers) < 2):
+            raise ValueError('snapshot is inconsistent')
+        shoe = chips = player_hand = dealer_hand = None
+        if decks:
+            shoe = self.shoe
+            #the shoe of a finished game has had its prefetcher closed
+            if shoe is None or shoe.decks != decks or \
+                    self.state in (MENU, GAME_OVER) or \
+                    (shoe.prefetcher is not None and shoe.prefetcher.closed):
+                shoe = self.new_shoe()
+            if shoe.decks != decks:
+                if shoe.prefetcher is not None:
+                    shoe.prefetcher.close()
+                raise ValueError(f'snapshot has a {decks} deck shoe,'
+                                 f' new shoes have {shoe.decks}')
+            shoe.cards = [CARDS[code] for code in cards[:size]]
+            shoe.cursor, shoe.cut, shoe.shuffles = cursor, cut, shuffles
+            chips = Chips()
+            chips.total, chips.bet = total, bet
+        if players:
+            player_hand = Hand()
+            for code in cards[size:size + players]:
+                player_hand.add_card(CARDS[code])
+        if dealers:
+            dealer_hand = Hand()
+            for code in cards[size + players:]:
+                dealer_hand.add_card(CARDS[code])
+        if self.shoe is not None and self.shoe is not shoe and \
+                self.shoe.prefetcher is not None:
+            self.shoe.prefetcher.close()
+        self.state, self._after_scores = STATES[state], STATES[after_scores]
+        self.shoe, self.chips = shoe, chips
+        self.player_hand, self.dealer_hand = player_hand, dealer_hand
+        self.rounds, self.reshuffled = rounds, bool(reshuffled)
+        event = {'event': 'resumed', 'state': self.state,
+                 'chips': total if decks else None, 'rounds': rounds}
+        if self.state == PLAYER_TURN:
+            event['bet'] = bet
+            event['player'] = hand_summary(player_hand)
+            event['upcard'] = str(dealer_hand.cards[1])
+        return [event]
+
+    def _new_game(self, argument):
+        """
+        Starts a session with a new shoe and a fresh Chips total.
+        """
+        self.shoe = self.new_shoe()
+        self.chips = Chips()
+        self.rounds = 0
+        return [{'event': 'new_game', 'chips': self.chips.total}] + \
+            self._begin_round()
+
+    def _begin_round(self):
+        """
+        Reshuffles the shoe if the cut card was reached and waits for a
+        bet.
+        """
+        self.reshuffled = self.shoe.reshuffle_if_needed()
+        self.state = BETTING
+        return [{'event': 'round_start', 'round': self.rounds + 1,
+                 'chips': self.chips.total, 'reshuffled': self.reshuffled}]
+
+    def _bet(self, argument):
+        """
+        Takes the bet and deals the hands, settling the round straight
+        away on a natural 21.
+        """
+        amount = str(argument if argument is not None else '').strip()
+        #isdecimal rather than isnumeric, which passes digits such as ² that
+        #int does not take
+        if not amount.isdecimal():
+            return [_error("bet needs to be a positive number")]
+        if int(amount) == 0:
+            return [_error("bet needs to be a number greater than 0")]
+        if int(amount) > self.chips.total:
+            return [_error("You do not have enough chips",
+                           chips=self.chips.total)]
+        self.chips.bet = int(amount)
+        self.player_hand = Hand()
+        self.player_hand.add_card(self.shoe.deal())
+        self.player_hand.add_card(self.shoe.deal())
+        self.dealer_hand = Hand()
+        self.dealer_hand.add_card(self.shoe.deal())
+        self.dealer_hand.add_card(self.shoe.deal())
+        events = [{'event': 'deal', 'bet': self.chips.bet,
+                   'player': hand_summary(self.player_hand),
+                   'upcard': str(self.dealer_hand.cards[1])}]
+        #check for blackjack on dealt cards
+        if self.player_hand.value == 21 and self.dealer_hand.value == 21:
+            return events + self._settle(PUSH, 'both naturals')
+        if self.player_hand.value == 21:
+            return events + self._settle(WIN, 'player natural')
+        if self.dealer_hand.value == 21:
+            return events + self._settle(LOSS, 'dealer natural')
+        self.state = PLAYER_TURN
+        return events
+
+    def _hit(self, argument):
+        """
+        Deals the player a card, settling the round if they bust.
+        """
+        card = self.shoe.deal()
+        self.player_hand.add_card(card)
+        events = [{'event': 'hit', 'card': str(card),
+                   'player': hand_summary(self.player_hand)}]
+        if self.player_hand.value > 21:
+            return events + self._settle(LOSS, 'player busts')
+        return events
+
+    def _stand(self, argument):
+        """
+        Plays the dealer's hand and settles the round.
+        """
+        while self.dealer_hand.value < DEALER_STAND_TOTAL:
+            self.dealer_hand.add_card(self.shoe.deal())
+        events = [{'event': 'stand'}]
+        dealer, player = self.dealer_hand.value, self.player_hand.value
+        if dealer > 21:
+            return events + self._settle(WIN, 'dealer busts')
+        if dealer > player:
+            return events + self._settle(LOSS, 'dealer wins')
+        if dealer < player:
+            return events + self._settle(WIN, 'player wins')
+        return events + self._settle(PUSH, 'push')
+
+    def _settle(self, outcome, reason):
+        """
+        Pays or takes the bet and ends the session if the player is out
+        of chips.
+        """
+        if outcome == WIN:
+            self.chips.win_bet()
+        elif outcome == LOSS:
+            self.chips.lose_bet()
+        self.rounds += 1
+        events = [{'event': 'round', 'round': self.rounds,
+                   'bet': self.chips.bet, 'reshuffled': self.reshuffled,
+                   'player': hand_summary(self.player_hand),
+                   'dealer': hand_summary(self.dealer_hand),
+                   'outcome': OUTCOMES[outcome], 'reason': reason,
+                   'chips': self.chips.total}]
+        if self.chips.total <= 0:
+            return events + self._finish(None)
+        self.state = PLAY_AGAIN
+        return events
+
+    def _again(self, argument):
+        """
+        Starts the next round of the session.
+        """
+        return self._begin_round()
+
+    def _quit(self, argument):
+        """
+        Ends the session, asking for initials if the score makes the
+        high score table.
+        """
+        score = self.chips.total
+        events = [{'event': 'quit', 'score': score}]
+        if self.is_highscore is not None and self.is_highscore(score):
+            self.state = INITIALS
+            return events + [{'event': 'highscore', 'score': score}]
+        return events + self._finish(None)
+
+    def _name(self, argument):
+        """
+        Records the score under the player's initials.
+        """
+        name = str(argument if argument is not None else '').strip().upper()
+        if not re.match('^[A-Z]{1,3}$', name):
+            return [_error("Invalid input. Please enter 1-3 letters.")]
+        return self._finish(name)
+
+    def _finish(self, name):
+        """
+        Records the score of the session and closes its shoe. A score
+        recorded under initials is followed by the high scores table.
+        """
+        score = self.chips.total
+        if self.add_highscore is not None:
+            self.add_highscore(name or self.anonymous_name, score)
+        event = {'event': 'session', 'rounds': self.rounds, 'score': score,
+                 'name': name}
+        #a game with no chips left is not ranked
+        if self.get_rank is not None and score > 0:
+            event['rank'] = self.get_rank(score)
+        if self.shoe.prefetcher is not None:
+            self.shoe.prefetcher.close()
+        self.state = GAME_OVER
+        if name is None:
+            return [event]
+        return [event] + self._show_scores(score, event.get('rank'), GAME_OVER)
+
+    def _show_scores(self, score, rank, after):
+        """
+        Shows the high scores table until the player goes back.
+        """
+        self.state = HIGH_SCORES
+        self._after_scores = after
+        highscores = self.get_highscores() if self.get_highscores else []
+        return [{'event': 'high_scores', 'highscores': list(highscores),
+                 'score': score, 'rank': rank}]
+
+    def _high_scores(self, argument):
+        """
+        Shows the high scores table from the main menu.
+        """
+        return self._show_scores(None, None, MENU)
+
+    def _back(self, argument):
+        """
+        Leaves the high scores table.
+        """
+        self.state = self._after_scores
+        return [{'event': MENU}] if self.state == MENU else []
+
+    def _menu(self, argument):
+        """
+        Returns to the main menu after a session.
+        """
+        self.state = MENU
+        return [{'event': MENU}]
+
+    def _exit(self, argument):
+        """
+        Leaves the game.
+        """
+        self.state = EXIT
+        return [{'event': EXIT}]
@@ -4,6 +4,7 @@ This module contains classes for a card game.
 Classes:
     Card: Represents a playing card.
     Deck: Represents a deck of playing cards.
+    Shoe: Represents several decks dealt down to a cut card.
     Hand: Represents a hand of playing cards.
     Chips: Represents the chips used for betting in the game.
 
@@ -11,8 +12,31 @@ Attributes:
     suits (list): A list of strings representing the suits of the cards.
     ranks (list): A list of strings representing the ranks of the cards.
     values (dict): A dictionary mapping ranks to values.
+    DEALER_STAND_TOTAL (int): The hand value the dealer stands on.
+    CARD_VALUES (list): The value of each card code.
+    CARD_IS_ACE (list): Whether each card code is an ace.
+    CARD_NAMES (list): The display text of each card code.
+    CARDS (tuple): The shared Card instance for each card code.
+    MAX_HAND_VALUE (int): The highest hand value a state can hold.
+    HAND_STATES (int): The number of hand states.
+    STATE_VALUES (list): The hand value of each hand state.
+    STATE_SOFT (list): Whether each hand state counts an ace as 11.
+    STATE_BUST (list): Whether each hand state is over 21.
+    HAND_TRANSITIONS (list): The hand state reached by adding a card,
+    indexed by state and card value.
+
+Functions:
+    hand_state(value, soft): Returns the id of a hand state.
+
+Card codes are the integers 0-51, numbering the cards suit by suit in the
+order of suits and ranks, which is the order Deck creates them in.
+
+A hand state is the hand value together with whether an ace in it still
+counts as 11, which is all that adding further cards depends on; a hand
+never holds more than one such ace, since two would be over 21. Adding a
+card is a single lookup in HAND_TRANSITIONS, which every engine shares.
 """
-import random
+from .rng import default_rng
 #defining the suits, ranks and values of the cards for the game
 suits = ['Hearts', 'Diamonds', 'Clubs', 'Spades']
 
@@ -44,14 +68,73 @@ values = {'Two': 2,
           'King': 10,
           'Ace': 11}
 
+#the dealer hits until their hand reaches this value
+DEALER_STAND_TOTAL = 17
+
+#precomputed card tables, indexed by card code
+CARD_VALUES = [values[rank] for suit in suits for rank in ranks]
+CARD_IS_ACE = [rank == 'Ace' for suit in suits for rank in ranks]
+CARD_NAMES = [f'{rank} of {suit}' for suit in suits for rank in ranks]
+
+#a hard 21 that draws a ten is the highest hand anyone can hold
+MAX_HAND_VALUE = 31
+HAND_STATES = 2 * (MAX_HAND_VALUE + 1)
+
+def hand_state(value, soft):
+    """
+    Returns the id of a hand state.
+
+    Parameters:
+        value (int): The value of the hand.
+        soft (bool): Whether an ace in the hand still counts as 11.
+
+    Returns:
+        int: The hand state, an index into the state tables.
+    """
+    return 2 * value + bool(soft)
+
+def _next_state(state, card_value):
+    """
+    Returns the hand state reached by adding a card, adjusting for aces.
+
+    Parameters:
+        state (int): The hand state before the card.
+        card_value (int): The value of the card, 11 for an ace.
+
+    Returns:
+        int: The hand state after the card.
+    """
+    value = state // 2 + card_value
+    aces = state % 2 + (card_value == 11)
+    while value > 21 and aces:
+        value -= 10
+        aces -= 1
+    #soft states below 11 cannot be reached, so their second ace is dropped
+    return hand_state(min(value, MAX_HAND_VALUE), aces)
+
+#precomputed hand state tables, indexed by hand state
+STATE_VALUES = [state // 2 for state in range(HAND_STATES)]
+STATE_SOFT = [bool(state % 2) for state in range(HAND_STATES)]
+STATE_BUST = [state // 2 > 21 for state in range(HAND_STATES)]
+HAND_TRANSITIONS = [[_next_state(state, card_value)
+                     for card_value in range(max(CARD_VALUES) + 1)]
+                    for state in range(HAND_STATES)]
+
 class Card:
     """
     Represents a playing card.
 
+    Cards never change once created, so the deck shares the 52 instances
+    in CARDS rather than creating new ones.
+
     Attributes:
         suit (str): The suit of the card.
         rank (str): The rank of the card.
+        code (int): The card code, an index into the card tables.
+        value (int): The value of the card, with aces counted as 11.
+        is_ace (bool): Whether the card is an ace.
     """
+    __slots__ = ('suit', 'rank', 'code', 'value', 'is_ace')
 
     def __init__(self, suit, rank):
         """
@@ -66,6 +149,9 @@ class Card:
         """
         self.suit = suit
         self.rank = rank
+        self.code = suits.index(suit) * len(ranks) + ranks.index(rank)
+        self.value = CARD_VALUES[self.code]
+        self.is_ace = CARD_IS_ACE[self.code]
 
     def __str__(self):
         """
@@ -81,7 +167,23 @@ class Card:
         'Two of Hearts'
                     
         """
-        return f'{self.rank} of {self.suit}'
+        return CARD_NAMES[self.code]
+
+    @staticmethod
+    def from_code(code):
+        """
+        Returns the shared Card for a card code.
+
+        Parameters:
+            code (int): The card code, 0-51.
+
+        Returns:
+            Card: The Card object from CARDS.
+        """
+        return CARDS[code]
+
+#the shared card instances, indexed by card code
+CARDS = tuple(Card(suit, rank) for suit in suits for rank in ranks)
 
 class Deck:
     """
@@ -89,31 +191,36 @@ class Deck:
     
     Attributes:
         deck (list): A list of Card objects representing the deck of cards.
+        rng (FastRNG): The random number generator the deck is shuffled
+        with.
     
     Methods:
         shuffle: Shuffles the deck of cards.
         deal: Removes and returns a card from the deck.
     """
 
-    def __init__(self):
+    def __init__(self, rng=None):
         """
         Initializes a Deck object with a standard deck of 52 playing cards.
         
         Parameters:
-        None
+            rng (FastRNG): The random number generator to shuffle with.
+            Anything with a shuffle method like random.Random works too.
+            Defaults to the shared stream from rng.default_rng.
         
         Returns:
         None
         """
-        self.deck = [Card(suit, rank) for suit in suits for rank in ranks]
+        self.deck = list(CARDS)
+        self.rng = rng if rng is not None else default_rng()
         self.shuffle()
 
     def shuffle(self):
         """
         Shuffles the deck of cards.
         
-        This method shuffles the deck of cards using the
-        random.shuffle function.
+        This method shuffles the deck of cards using the shuffle
+        method of the deck's random number generator.
         
         Parameters:
         None
@@ -124,7 +231,7 @@ class Deck:
         Example:
         deck.shuffle()
     """
-        random.shuffle(self.deck)
+        self.rng.shuffle(self.deck)
 
     def deal(self):
         """
@@ -140,6 +247,127 @@ class Deck:
         """
         return self.deck.pop()
 
+class Shoe:
+    """
+    Represents a shoe of several decks of playing cards.
+
+    The shoe is shuffled once and then dealt from an index cursor, so
+    dealing a card does not move any of the others. A cut card is placed
+    at the penetration point, and the shoe is only reshuffled between
+    rounds once the cut card has been reached. With a ShoePrefetcher the
+    reshuffle swaps in a shoe that was shuffled in the background.
+
+    Attributes:
+        decks (int): The number of decks in the shoe.
+        cards (list): The Card objects in the shoe, in dealing order.
+        cursor (int): The position of the next card to deal.
+        cut (int): The position of the cut card.
+        shuffles (int): The number of times the shoe has been shuffled.
+        prefetcher (ShoePrefetcher): The source of pre-shuffled shoes,
+        or None to shuffle in place.
+
+    Methods:
+        shuffle: Shuffles all the cards back into the shoe.
+        reshuffle_if_needed: Shuffles the shoe if the cut card was reached.
+        deal: Returns the next card in the shoe.
+    """
+    def __init__(self, decks=6, penetration=0.75, rng=None, prefetcher=None):
+        """
+        Initializes a shuffled Shoe.
+
+        Parameters:
+            decks (int): The number of decks in the shoe.
+            penetration (float): The fraction of the shoe dealt before
+            the cut card is reached, greater than 0 and at most 1.
+            rng (FastRNG): The random number generator to shuffle with,
+            or anything with a shuffle method like random.Random.
+            Defaults to the shared stream from rng.default_rng.
+            prefetcher (ShoePrefetcher): An optional source of shoes that
+            were shuffled in the background, with the same number of decks.
+
+        Returns:
+            None
+        """
+        if prefetcher is not None and prefetcher.decks != decks:
+            raise ValueError('the prefetcher builds shoes of a different size')
+        if decks < 1:
+            raise ValueError('a shoe needs at least one deck')
+        if not 0 < penetration <= 1:
+            raise ValueError('penetration must be greater than 0 and at most 1')
+        self.decks = decks
+        self.cards = list(CARDS) * decks
+        self.cut = max(1, int(len(self.cards) * penetration))
+        self.rng = rng if rng is not None else default_rng()
+        self.prefetcher = prefetcher
+        self.cursor = 0
+        self.shuffles = 0
+        self.shuffle()
+
+    def __len__(self):
+        """
+        Returns the number of cards left to deal.
+
+        Parameters:
+        None
+
+        Returns:
+        int: The number of cards after the cursor.
+        """
+        return len(self.cards) - self.cursor
+
+    def shuffle(self):
+        """
+        Shuffles all the cards back into the shoe and resets the cursor.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        if self.prefetcher is not None:
+            self.cards = self.prefetcher.next_shoe()
+        else:
+            self.rng.shuffle(self.cards)
+        self.cursor = 0
+        self.shuffles += 1
+
+    def reshuffle_if_needed(self):
+        """
+        Shuffles the shoe if the cut card has been reached.
+
+        This is called at the start of every round.
+
+        Parameters:
+        None
+
+        Returns:
+        bool: True if the shoe was shuffled, False otherwise.
+        """
+        if self.cursor >= self.cut:
+            self.shuffle()
+            return True
+        return False
+
+    def deal(self):
+        """
+        Returns the next card in the shoe and advances the cursor.
+
+        If a round uses up every card in the shoe, the shoe is shuffled
+        again in the middle of the round so that dealing never fails.
+
+        Parameters:
+        None
+
+        Returns:
+        Card: A Card object representing the dealt card.
+        """
+        if self.cursor == len(self.cards):
+            self.shuffle()
+        card = self.cards[self.cursor]
+        self.cursor += 1
+        return card
+
 class Hand:
     """
     Represents a hand of playing cards.
@@ -147,12 +375,17 @@ class Hand:
     Attributes:
         cards (list): A list of Card objects representing the cards
         in the hand.
+        state (int): The hand state, an index into the state tables.
         value (int): The total value of the cards in the hand.
-        aces (int): The number of aces in the hand.
+        aces (int): The number of aces in the hand still counted as 11,
+        either 0 or 1.
+        is_soft (bool): Whether an ace in the hand still counts as 11.
+        is_bust (bool): Whether the hand is over 21.
     
     Methods:
         add_card: Adds a card to the hand.
-        adjust_for_ace: Adjusts the value of the hand for aces.
+        adjust_for_ace: Kept for callers of the old interface, aces are
+        already adjusted by add_card.
     """
     def __init__(self):
         """
@@ -166,6 +399,7 @@ class Hand:
         None
         """
         self.cards = []
+        self.state = 0
         self.value = 0
         self.aces = 0
 
@@ -173,9 +407,9 @@ class Hand:
         """
         Adds a card to the hand and adjusts the value of the hand.
         
-        This method adds a card to the hand, updates the value of
-        the hand based on the card's rank, and adjusts the value for
-        aces if necessary.
+        This method adds a card to the hand and moves the hand to the
+        state given by HAND_TRANSITIONS, which already has the value
+        adjusted for aces.
         
         Parameters:
             card (Card): The Card object to add to the hand.
@@ -187,18 +421,38 @@ class Hand:
             hand.add_card(card)
         """
         self.cards.append(card)
-        self.value += values[card.rank]
-        if card.rank == 'Ace':
-            self.aces += 1
-        self.adjust_for_ace()
+        state = HAND_TRANSITIONS[self.state][card.value]
+        self.state = state
+        self.value = STATE_VALUES[state]
+        self.aces = state & 1
+
+    @property
+    def is_soft(self):
+        """
+        Returns whether an ace in the hand still counts as 11.
+
+        Returns:
+            bool: True for a soft hand.
+        """
+        return STATE_SOFT[self.state]
+
+    @property
+    def is_bust(self):
+        """
+        Returns whether the hand is over 21.
+
+        Returns:
+            bool: True for a bust hand.
+        """
+        return STATE_BUST[self.state]
 
     def adjust_for_ace(self):
         """
         Adjusts the value of the hand for aces.
         
-        This method adjusts the value of the hand for aces by
-        subtracting 10 from the value if the total value is greater
-        than 21 and there is at least one ace in the hand.
+        The hand state tables already count an ace as 1 whenever 11
+        would put the hand over 21, so there is nothing left to do. The
+        method is kept so that older callers keep working.
         
         Parameters:
         None
@@ -206,9 +460,6 @@ class Hand:
         Returns:
         None
         """
-        while self.value > 21 and self.aces:
-            self.value -= 10
-            self.aces -= 1
 
 class Chips:
     """"
@@ -0,0 +1,230 @@
+"""
+This module contains an exact calculator for the dealer's final total.
+
+Given the dealer's upcard and the cards left in the shoe, the calculator
+returns the probability of each way the dealer's hand can end: standing
+on 17, 18, 19, 20 or 21, or going bust. It plays out every possible draw
+with the same rules as end_game in run.py, so no Monte Carlo rounds are
+needed.
+
+The cards left in the shoe are described by a composition: a tuple with
+the number of cards of each value, from 2 to 11 (the ace), so that all
+the ten-valued ranks count as one. The recursion is memoized on the
+composition and the dealer's hand state, the hand value and the number
+of aces still counted as 11, exactly as Hand tracks them, and the memo is
+an LRU cache so repeated queries during a shoe are close to instant
+without the memory growing without bound.
+
+Functions:
+    shoe_composition(decks): Returns the composition of a full shoe.
+    composition_from_cards(cards): Counts a list of cards by value.
+    remove_cards(composition, card_values): Takes cards out of a
+    composition.
+    add_card_value(value, aces, card_value): Adds a card to a hand state.
+    dealer_final_distribution(upcard, composition, no_natural): Returns
+    the probabilities of the dealer's final totals.
+    clear_dealer_cache(): Empties the memo of the recursion.
+    dealer_cache_info(): Returns the hit and miss counts of the memo.
+
+Attributes:
+    CARD_VALUES (tuple): The distinct card values, the index order of a
+    composition.
+    OUTCOMES (tuple): The final totals in the order of the returned
+    distribution, with BUST last.
+    BUST (str): The key of the bust probability.
+    DEALER_CACHE_SIZE (int): The most dealer states kept in the memo.
+"""
+from functools import lru_cache
+from .game import (values, CARDS, DEALER_STAND_TOTAL, HAND_TRANSITIONS,
+                   STATE_VALUES, hand_state)
+
+CARD_VALUES = tuple(sorted(set(values.values())))
+BUST = 'bust'
+OUTCOMES = tuple(range(DEALER_STAND_TOTAL, 22)) + (BUST,)
+DEALER_CACHE_SIZE = 1 << 18
+
+#the position of each card value in a composition
+_INDEX = {value: index for index, value in enumerate(CARD_VALUES)}
+
+
+def shoe_composition(decks=1):
+    """
+    Returns the composition of a full, unplayed shoe.
+
+    Parameters:
+        decks (int): The number of decks in the shoe.
+
+    Returns:
+        tuple: The number of cards of each value in CARD_VALUES.
+
+    Example:
+        shoe_composition(1) returns (4, 4, 4, 4, 4, 4, 4, 4, 16, 4)
+    """
+    return composition_from_cards(CARDS * decks)
+
+
+def composition_from_cards(cards):
+    """
+    Counts a list of cards by value.
+
+    Parameters:
+        cards (list): The Card objects, for example the undealt part of a
+        Shoe.
+
+    Returns:
+        tuple: The number of cards of each value in CARD_VALUES.
+    """
+    counts = [0] * len(CARD_VALUES)
+    for card in cards:
+        counts[_INDEX[card.value]] += 1
+    return tuple(counts)
+
+
+def remove_cards(composition, card_values):
+    """
+    Returns a composition with some cards taken out of it.
+
+    Parameters:
+        composition (tuple): The number of cards of each value.
+        card_values (list): The values of the cards to take out.
+
+    Returns:
+        tuple: The new composition.
+
+    Raises:
+        ValueError: If a card is not in the composition.
+    """
+    counts = list(composition)
+    for value in card_values:
+        index = _INDEX[value]
+        if not counts[index]:
+            raise ValueError(f'no card of value {value} left to remove')
+        counts[index] -= 1
+    return tuple(counts)
+
+
+def add_card_value(value, aces, card_value):
+    """
+    Adds a card to a hand state with the HAND_TRANSITIONS table that
+    Hand.add_card uses.
+
+    Parameters:
+        value (int): The value of the hand.
+        aces (int): The number of aces in the hand still counted as 11.
+        card_value (int): The value of the new card, 11 for an ace.
+
+    Returns:
+        tuple: The new value and number of aces counted as 11.
+    """
+    state = HAND_TRANSITIONS[hand_state(value, aces)][card_value]
+    return STATE_VALUES[state], state & 1
+
+
+@lru_cache(maxsize=DEALER_CACHE_SIZE)
+def _dealer_outcomes(composition, value, aces):
+    """
+    Returns the probabilities of each final total from a dealer state.
+
+    Parameters:
+        composition (tuple): The cards left to draw from.
+        value (int): The value of the dealer's hand.
+        aces (int): The number of aces still counted as 11.
+
+    Returns:
+        tuple: The probability of each entry in OUTCOMES.
+    """
+    result = [0.0] * len(OUTCOMES)
+    if value >= DEALER_STAND_TOTAL:
+        result[min(value, 22) - DEALER_STAND_TOTAL] = 1.0
+        return tuple(result)
+    remaining = sum(composition)
+    if not remaining:
+        #the shoe ran out before the dealer could finish, counted as a bust
+        result[-1] = 1.0
+        return tuple(result)
+    counts = list(composition)
+    for index, count in enumerate(composition):
+        if not count:
+            continue
+        weight = count / remaining
+        new_value, new_aces = add_card_value(value, aces, CARD_VALUES[index])
+        if new_value >= DEALER_STAND_TOTAL:
+            #final totals are added directly rather than cached
+            result[min(new_value, 22) - DEALER_STAND_TOTAL] += weight
+            continue
+        counts[index] = count - 1
+        branch = _dealer_outcomes(tuple(counts), new_value, new_aces)
+        counts[index] = count
+        for outcome, probability in enumerate(branch):
+            result[outcome] += weight * probability
+    return tuple(result)
+
+
+def dealer_final_distribution(upcard, composition, no_natural=False):
+    """
+    Returns the probability of each final total of the dealer's hand.
+
+    The dealer's hole card is drawn from the composition, then the dealer
+    hits below DEALER_STAND_TOTAL as in end_game.
+
+    Parameters:
+        upcard (int): The value of the dealer's visible card, 11 for an ace.
+        composition (tuple): The cards left in the shoe, not including the
+        upcard.
+        no_natural (bool): If True, the distribution is conditioned on the
+        dealer not having a natural 21, which is what the player knows
+        once the round has got past the deal.
+
+    Returns:
+        dict: The probability of each entry in OUTCOMES.
+
+    Example:
+        dealer_final_distribution(6, shoe_composition(6))[BUST] is about 0.42
+    """
+    result = [0.0] * len(OUTCOMES)
+    remaining = sum(composition)
+    total_weight = 0.0
+    counts = list(composition)
+    for index, count in enumerate(composition):
+        if not count:
+            continue
+        value, aces = add_card_value(*add_card_value(0, 0, upcard),
+                                     CARD_VALUES[index])
+        if no_natural and value == 21:
+            continue
+        counts[index] = count - 1
+        branch = _dealer_outcomes(tuple(counts), value, aces)
+        counts[index] = count
+        weight = count / remaining
+        total_weight += weight
+        for outcome, probability in enumerate(branch):
+            result[outcome] += weight * probability
+    if total_weight:
+        result = [probability / total_weight for probability in result]
+    return dict(zip(OUTCOMES, result))
+
+
+def clear_dealer_cache():
+    """
+    Empties the memo of the dealer recursion.
+
+    Parameters:
+    None
+
+    Returns:
+    None
+    """
+    _dealer_outcomes.cache_clear()
+
+
+def dealer_cache_info():
+    """
+    Returns the hit and miss counts and size of the dealer memo.
+
+    Parameters:
+    None
+
+    Returns:
+    functools._CacheInfo: The statistics of the LRU cache.
+    """
+    return _dealer_outcomes.cache_info()
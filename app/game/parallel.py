@@ -0,0 +1,124 @@
+"""
+This module contains a process pool runner for the headless simulation.
+
+A run of N rounds is split into one shard per worker. Every shard gets its
+own random number stream, spawned from a single seed with
+numpy.random.SeedSequence, so the streams are independent of each other
+and a given seed and worker count always deal exactly the same cards. The
+shard results are merged in shard order, which makes the totals and chip
+statistics identical from run to run regardless of which worker finishes
+first. A run with a single worker plays its one shard in the calling
+process, without starting a pool.
+
+Functions:
+    shard_sizes(rounds, shards): Splits a number of rounds into shards.
+    simulate_parallel(rounds, strategy, bet, workers, seed, engine): Plays
+    rounds across a process pool.
+
+Attributes:
+    ENGINES (tuple): The names of the engines a shard can be played with,
+    from simulation.ENGINES.
+"""
+import os
+import random
+import time
+import numpy as np
+from .simulation import ENGINES, simulate
+from .batch import simulate_batch
+
+
+def shard_sizes(rounds, shards):
+    """
+    Splits a number of rounds as evenly as possible into shards.
+
+    Parameters:
+        rounds (int): The total number of rounds.
+        shards (int): The number of shards.
+
+    Returns:
+        list: The number of rounds in each shard.
+
+    Example:
+        shard_sizes(10, 3) returns [4, 3, 3]
+    """
+    size, extra = divmod(rounds, shards)
+    return [size + (index < extra) for index in range(shards)]
+
+
+def _run_shard(engine, rounds, strategy, bet, seed_sequence, decks,
+               penetration, prefetch):
+    """
+    Plays one shard of a parallel run in a worker process.
+
+    Parameters:
+        engine (str): 'scalar' or 'batch'.
+        rounds (int): The number of rounds in the shard.
+        strategy (str): The name of the strategy to play.
+        bet (int): The number of chips bet on every round.
+        seed_sequence (numpy.random.SeedSequence): The seed of the shard.
+        decks (int): The number of decks in the shoe, or None.
+        penetration (float): The cut card position of the shoe.
+        prefetch (int): The depth of the shoe prefetch queue, or 0.
+
+    Returns:
+        SimulationResult: The result of the shard.
+    """
+    if engine == 'batch':
+        return simulate_batch(rounds, strategy, bet,
+                              rng=np.random.default_rng(seed_sequence))
+    seed = int(seed_sequence.generate_state(1, dtype=np.uint64)[0])
+    return simulate(rounds, strategy, bet, rng=random.Random(seed),
+                    decks=decks, penetration=penetration, prefetch=prefetch)
+
+
+def simulate_parallel(rounds, strategy='dealer-mimic', bet=10, workers=None,
+                      seed=None, engine='scalar', decks=None, penetration=0.75,
+                      prefetch=0):
+    """
+    Plays a number of rounds across a pool of worker processes.
+
+    Parameters:
+        rounds (int): The total number of rounds to play.
+        strategy (str): The name of the strategy to play.
+        bet (int): The number of chips bet on every round.
+        workers (int): The number of worker processes and shards, defaults
+        to the number of CPUs.
+        seed (int): The seed all shard streams are spawned from. If None,
+        fresh entropy is used and the run is not reproducible.
+        engine (str): 'scalar' or 'batch'.
+        decks (int): The number of decks in each shard's shoe, or None to
+        deal every round from a fresh deck. Only the scalar engine deals
+        from a shoe.
+        penetration (float): The cut card position of the shoe.
+        prefetch (int): The depth of each shard's shoe prefetch queue, or 0
+        to shuffle shoes in place.
+
+    Returns:
+        SimulationResult: The merged result of all shards, with elapsed
+        set to the wall clock time of the whole run.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}")
+    if decks and engine != 'scalar':
+        raise ValueError("only the scalar engine deals from a shoe")
+    workers = workers or os.cpu_count() or 1
+    seed_sequences = np.random.SeedSequence(seed).spawn(workers)
+    start = time.perf_counter()
+    if workers == 1:
+        shards = [_run_shard(engine, rounds, strategy, bet, seed_sequences[0],
+                             decks, penetration, prefetch)]
+    else:
+        #imported here, multiprocessing is slow to import and only needed
+        #once the pool is started
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_shard, engine, size, strategy, bet,
+                                   seq, decks, penetration, prefetch)
+                       for size, seq in zip(shard_sizes(rounds, workers),
+                                            seed_sequences)]
+            shards = [future.result() for future in futures]
+    result = shards[0]
+    for shard in shards[1:]:
+        result.extend(shard)
+    result.elapsed = time.perf_counter() - start
+    return result
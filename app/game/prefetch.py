@@ -0,0 +1,139 @@
+"""
+This module contains a background prefetcher for shuffled shoes.
+
+Shuffling a 6-8 deck shoe is the most expensive step between two rounds.
+A ShoePrefetcher builds and shuffles the next shoe on a worker thread
+while the current one is in play, so that when a Shoe reaches its cut card
+the reshuffle is an O(1) swap of card lists. Shuffled shoes wait in a
+bounded queue, which caps memory at a few shoes, and counters record how
+often a shoe was ready and how often the game had to wait for one.
+
+Classes:
+    ShoePrefetcher: Builds shuffled shoes on a background thread.
+"""
+import queue
+import threading
+import time
+from .game import CARDS
+from .rng import default_rng
+
+
+class ShoePrefetcher:
+    """
+    Builds shuffled shoes on a background thread.
+
+    Attributes:
+        decks (int): The number of decks in each shoe.
+        ready (int): The number of shoes that were handed out immediately.
+        waits (int): The number of times a caller had to wait for a shoe.
+        wait_time (float): The total time callers spent waiting, in seconds.
+        closed (bool): Whether the prefetcher has been closed.
+
+    Methods:
+        next_shoe: Returns the next shuffled list of cards.
+        close: Stops the background thread.
+    """
+    def __init__(self, decks=6, depth=2, rng=None):
+        """
+        Initializes a ShoePrefetcher and starts its worker thread.
+
+        Parameters:
+            decks (int): The number of decks in each shoe.
+            depth (int): The most shuffled shoes held in the queue.
+            rng (FastRNG): The random number generator to shuffle with.
+            It is only used by the worker thread, so it should not be
+            shared with other code. Defaults to a stream spawned from
+            rng.default_rng, so a seeded session shuffles the same shoes.
+
+        Returns:
+            None
+        """
+        if depth < 1:
+            raise ValueError('the prefetch queue needs room for one shoe')
+        self.decks = decks
+        self.ready = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self._rng = rng if rng is not None else default_rng().spawn()
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='shoe-prefetcher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        """
+        Fills the queue with shuffled shoes until the prefetcher is closed.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        while not self._stop.is_set():
+            cards = list(CARDS) * self.decks
+            self._rng.shuffle(cards)
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(cards, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def next_shoe(self):
+        """
+        Returns the next shuffled list of cards, waiting for the worker
+        thread if none is ready yet.
+
+        Parameters:
+        None
+
+        Returns:
+        list: The Card objects of a freshly shuffled shoe.
+        """
+        try:
+            cards = self._queue.get_nowait()
+            self.ready += 1
+        except queue.Empty:
+            if self._stop.is_set():
+                raise RuntimeError('the shoe prefetcher has been closed')
+            start = time.perf_counter()
+            cards = self._queue.get()
+            self.wait_time += time.perf_counter() - start
+            self.waits += 1
+        return cards
+
+    @property
+    def closed(self):
+        """
+        Returns whether the prefetcher has been closed.
+
+        Parameters:
+        None
+
+        Returns:
+        bool: True once close has been called.
+        """
+        return self._stop.is_set()
+
+    def close(self):
+        """
+        Stops the worker thread and discards any queued shoes.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self._stop.set()
+        self._thread.join()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
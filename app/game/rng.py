@@ -0,0 +1,251 @@
+"""
+This module contains a fast, seedable random number stream for shuffling.
+
+Deck and Shoe take any object with the shuffle and random methods of
+random.Random, so a seeded random.Random works as well. FastRNG provides
+the same methods on top of NumPy's PCG64 generator, which is quicker
+than the Mersenne Twister behind the random module. It draws its numbers
+in bulk: floats a block at a time, and shuffles of a given length as a
+block of permutations, so that shuffling one deck is a single list
+reorder. The same bulk call is exposed as permutations for the headless
+engines, which can produce thousands of shuffled decks at once.
+
+Streams made from the same seed always produce the same numbers, and
+spawn derives independent child streams from a seed, which is how a
+seeded session gives every game its own reproducible shoe.
+
+The shared stream that Deck and Shoe use by default is a RandomStream,
+a random.Random that can spawn children too, since the interactive game
+only shuffles a shoe now and then and should not have to load NumPy to
+do it. NumPy is only imported when the first FastRNG is made, by the
+simulation and batch engines that shuffle in bulk.
+
+Classes:
+    RandomStream: A random.Random that spawns reproducible child streams.
+    FastRNG: A PCG64 random number stream with the random.Random
+    shuffling interface.
+
+Functions:
+    default_rng(): Returns the shared stream used when none is given.
+    seed(seed): Reseeds the shared stream.
+
+Attributes:
+    BLOCK_SIZE (int): The number of floats, or of permutations of a deck,
+    drawn at once.
+"""
+import random
+
+BLOCK_SIZE = 1024
+
+_default = None
+#numpy, imported by the first FastRNG
+np = None
+
+
+class RandomStream(random.Random):
+    """
+    A random.Random whose seed is kept, so that it can spawn independent
+    child streams that are the same for the same seed.
+
+    Methods:
+        spawn: Returns an independent child stream.
+    """
+    def __init__(self, seed=None):
+        """
+        Initializes a RandomStream.
+
+        Parameters:
+            seed (int or str): The seed of the stream. If None, fresh
+            entropy is used.
+
+        Returns:
+            None
+        """
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(128)
+        self._seed = seed
+        self._spawned = 0
+        super().__init__(seed)
+
+    def spawn(self):
+        """
+        Returns an independent child stream. The children of streams with
+        the same seed are the same in the same order.
+
+        Parameters:
+        None
+
+        Returns:
+        RandomStream: The new stream.
+        """
+        self._spawned += 1
+        return RandomStream(f'{self._seed}/{self._spawned}')
+
+
+class FastRNG:
+    """
+    A PCG64 random number stream with the random.Random shuffling
+    interface.
+
+    Attributes:
+        generator (numpy.random.Generator): The underlying generator.
+
+    Methods:
+        random: Returns a float in [0, 1).
+        getrandbits: Returns a random integer with k bits.
+        shuffle: Shuffles a list in place.
+        permutations: Returns many random permutations at once.
+        spawn: Returns an independent child stream.
+    """
+    def __init__(self, seed=None):
+        """
+        Initializes a FastRNG.
+
+        Parameters:
+            seed (int or numpy.random.SeedSequence): The seed of the
+            stream. If None, fresh entropy is used.
+
+        Returns:
+            None
+        """
+        global np
+        if np is None:
+            import numpy as np
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self._seed_sequence = seed
+        self.generator = np.random.Generator(np.random.PCG64(seed))
+        self._floats = iter(())
+        self._permutations = {}
+
+    def random(self):
+        """
+        Returns the next float from the current block.
+
+        Parameters:
+        None
+
+        Returns:
+        float: A float in [0, 1).
+        """
+        try:
+            return next(self._floats)
+        except StopIteration:
+            self._floats = iter(self.generator.random(BLOCK_SIZE).tolist())
+            return next(self._floats)
+
+    def getrandbits(self, k):
+        """
+        Returns a random non-negative integer with k bits, as
+        random.getrandbits does.
+
+        Parameters:
+            k (int): The number of bits.
+
+        Returns:
+            int: An integer in [0, 2**k).
+        """
+        words = self.generator.integers(0, 1 << 32, (k + 31) // 32,
+                                        dtype=np.uint64).tolist()
+        value = 0
+        for word in words:
+            value = value << 32 | word
+        return value >> (32 * len(words) - k)
+
+    def permutations(self, count, size):
+        """
+        Returns many independent random permutations with one call.
+
+        Parameters:
+            count (int): The number of permutations.
+            size (int): The length of each permutation.
+
+        Returns:
+            numpy.ndarray: A (count, size) matrix whose rows are each a
+            permutation of range(size).
+
+        Example:
+            rng.permutations(10000, 52) shuffles ten thousand decks.
+        """
+        dtype = np.int8 if size <= 128 else np.int16 if size <= 1 << 15 \
+            else np.intp
+        rows = np.tile(np.arange(size, dtype=dtype), (count, 1))
+        return self.generator.permuted(rows, axis=1, out=rows)
+
+    def shuffle(self, items):
+        """
+        Shuffles a list in place.
+
+        The permutation is taken from a block of permutations of the
+        same length, which is refilled with one bulk call when empty.
+        The first block of each length holds a single permutation and
+        every block after that twice as many, so a stream that only
+        shuffles a few times does not pay for a full block. Blocks of
+        long lists, such as whole shoes, stop growing at fewer
+        permutations so that a block stays around the same size.
+
+        Parameters:
+            items (list): The list to shuffle.
+
+        Returns:
+            None
+        """
+        size = len(items)
+        block, count = self._permutations.get(size, (None, 0))
+        try:
+            order = next(block)
+        except (StopIteration, TypeError):
+            count = min(max(1, 2 * count), max(1, BLOCK_SIZE * 64 // max(size, 1)))
+            block = iter(self.permutations(count, size))
+            self._permutations[size] = block, count
+            order = next(block)
+        items[:] = [items[index] for index in order.tolist()]
+
+    def spawn(self):
+        """
+        Returns an independent child stream. The children of streams with
+        the same seed are the same in the same order.
+
+        Parameters:
+        None
+
+        Returns:
+        FastRNG: The new stream.
+        """
+        return FastRNG(self._seed_sequence.spawn(1)[0])
+
+
+def default_rng():
+    """
+    Returns the shared stream that Deck and Shoe shuffle with when they
+    are not given one, creating it the first time.
+
+    Parameters:
+    None
+
+    Returns:
+    RandomStream: The shared stream.
+    """
+    global _default
+    if _default is None:
+        _default = RandomStream()
+    return _default
+
+
+def seed(seed=None):
+    """
+    Replaces the shared stream with one made from a seed.
+
+    Parameters:
+        seed (int or numpy.random.SeedSequence): The seed, or None for
+        fresh entropy.
+
+    Returns:
+        RandomStream: The new shared stream.
+    """
+    global _default
+    if hasattr(seed, 'generate_state'):
+        #a SeedSequence, such as one spawned for a forked child
+        seed = int.from_bytes(seed.generate_state(4).tobytes(), 'little')
+    _default = RandomStream(seed)
+    return _default
@@ -0,0 +1,140 @@
+"""
+This module contains a non-interactive driver for scripted game sessions.
+
+The interactive game in run.py reads every decision with input() and
+draws the table with rich. The scripted driver plays the same sessions
+on the same GameEngine, but takes its decisions from a stream of
+actions and reports each round as a dictionary, which run.py
+writes out as one JSON object per line. There is no screen clearing and
+no styling, so automated regression and load runs go as fast as the game
+itself.
+
+Actions are read one per line, either as plain text or as a JSON object:
+
+    bet 10            {"action": "bet", "amount": 10}
+    hit  or  h        {"action": "hit"}
+    stand  or  s      {"action": "stand"}
+    again  or  y      {"action": "again"}
+    quit  or  n       {"action": "quit"}
+    name ABC          {"action": "name", "name": "ABC"}
+
+A bare number is a bet. Blank lines and lines starting with # are
+skipped. An action that does not fit the point the session has reached
+is reported as an error event and skipped, as the interactive prompts
+ask again after invalid input. When a session ends, the next action
+starts a new one.
+
+Functions:
+    parse_action(line): Parses one line of a script.
+    run_script(lines, emit, ...): Plays the sessions of a script.
+
+Attributes:
+    ACTIONS (dict): The plain text spellings of each action.
+"""
+import json
+from .game import Shoe
+from .engine import GameEngine, MENU, HIGH_SCORES, GAME_OVER
+
+ACTIONS = {'bet': 'bet',
+           'hit': 'hit', 'h': 'hit',
+           'stand': 'stand', 's': 'stand',
+           'again': 'again', 'y': 'again',
+           'quit': 'quit', 'n': 'quit',
+           'name': 'name'}
+
+#the events written out, the others only redraw the interactive screens
+_EMITTED = ('round', 'session', 'error')
+
+#the action that moves on from each state between sessions
+_BETWEEN_SESSIONS = {GAME_OVER: 'menu', HIGH_SCORES: 'back', MENU: 'new_game'}
+
+
+def parse_action(line):
+    """
+    Parses one line of a script into an action and its argument.
+
+    Parameters:
+        line (str): A plain text or JSON action.
+
+    Returns:
+        tuple: The action and its argument, the amount of a bet or the
+        initials of a name, or None for a line to skip.
+
+    Raises:
+        ValueError: If the line is not a known action.
+
+    Example:
+        parse_action('bet 10') returns ('bet', '10')
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('{'):
+        try:
+            fields = json.loads(line)
+        except json.JSONDecodeError as error:
+            raise ValueError(f'invalid JSON action: {error.msg}') from None
+        action = ACTIONS.get(str(fields.get('action', '')).lower())
+        argument = fields.get('amount', fields.get('name'))
+    else:
+        word, _, argument = line.partition(' ')
+        if word.isdecimal():
+            word, argument = 'bet', word
+        action = ACTIONS.get(word.lower())
+        argument = argument.strip() or None
+    if action is None:
+        raise ValueError(f'unknown action {line!r}')
+    return action, None if argument is None else str(argument)
+
+
+def run_script(lines, emit, add_highscore=None, is_highscore=None,
+               get_rank=None, decks=6, rng=None, anonymous_name='---'):
+    """
+    Plays scripted sessions until the script runs out.
+
+    Each session is played by a GameEngine with the rules of the
+    interactive game: rounds are played while the player has chips and
+    chooses to play again, and the final score is recorded under the
+    player's initials if it makes the high score table, otherwise
+    anonymously. The menus between sessions are passed through without
+    actions.
+
+    Parameters:
+        lines (iterable): The lines of the script, for example a file.
+        emit (function): Receives a dictionary for every event: 'round',
+        'session' at the end of each session, 'error' for an action that
+        was skipped and 'end' when the script runs out.
+        add_highscore (function): Records a name and score, or None to
+        record nothing.
+        is_highscore (function): Returns whether a score makes the high
+        score table, or None if no score does.
+        get_rank (function): Returns the rank of a score among the high
+        scores.
+        decks (int): The number of decks in each session's shoe.
+        rng (FastRNG): The random number generator of the shoes.
+        anonymous_name (str): The name recorded for a score that does not
+        make the high score table.
+
+    Returns:
+        int: The number of sessions that were finished.
+    """
+    engine = GameEngine(lambda: Shoe(decks, rng=rng), add_highscore,
+                        is_highscore, get_rank, anonymous_name=anonymous_name)
+    sessions = 0
+    for line in lines:
+        try:
+            parsed = parse_action(line)
+        except ValueError as error:
+            emit({'event': 'error', 'message': str(error)})
+            continue
+        if parsed is None:
+            continue
+        #the next action after a session starts a new one
+        while engine.state in _BETWEEN_SESSIONS:
+            engine.act(_BETWEEN_SESSIONS[engine.state])
+        for event in engine.act(*parsed):
+            if event['event'] in _EMITTED:
+                emit(event)
+            sessions += event['event'] == 'session'
+    emit({'event': 'end', 'sessions': sessions})
+    return sessions
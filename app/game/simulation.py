@@ -0,0 +1,383 @@
+"""
+This module contains a headless simulation engine for the Black Jack game.
+
+The simulation plays rounds with the same rules as the interactive game in
+run.py (natural 21 checked on the deal, dealer hits below 17) but without
+any terminal input or output, so that rule changes can be validated over
+millions of hands.
+
+Classes:
+    SimulationResult: Holds the outcome counts and chip trajectory of a run.
+
+Functions:
+    hit_table(strategy, decks): Returns the hit or stand decision of a
+    strategy for every hand and dealer upcard.
+    play_round(deck, hits): Plays a single round and returns the outcome.
+    simulate(rounds, strategy, bet): Plays a number of rounds headlessly.
+    format_report(result): Formats a SimulationResult as a text report.
+
+Attributes:
+    WIN, LOSS, PUSH (int): The round outcomes, equal to the multiple of
+    the bet that is added to the player's chips.
+    STRATEGIES (dict): A dictionary mapping strategy names to the hand
+    value below which the player hits, or to None for the 'optimal'
+    strategy, which plays the decisions of the precomputed strategy
+    table in tables.py.
+    ENGINES (tuple): The names of the simulation engines, the scalar
+    engine of this module and the NumPy engine of batch.py.
+"""
+import random
+import time
+from .game import CARDS, Deck, Shoe, Hand, Chips, DEALER_STAND_TOTAL, STATE_VALUES
+from .prefetch import ShoePrefetcher
+from .tables import load_strategy_table
+
+WIN = 1
+LOSS = -1
+PUSH = 0
+
+ENGINES = ('scalar', 'batch')
+
+STRATEGIES = {'dealer-mimic': DEALER_STAND_TOTAL,
+              'never-bust': 12,
+              'always-stand': 0,
+              'optimal': None}
+
+#dealer upcards are indexed by their value, 2 to 11
+_TABLE_UPCARDS = 12
+
+
+class _LazyDeck(Deck):
+    """
+    A deck that shuffles lazily as cards are dealt.
+
+    Each call to deal swaps a uniformly chosen card from the undealt part
+    of the deck to the end and returns it, which is the Fisher-Yates
+    shuffle done one step at a time. A round therefore only pays for the
+    cards it uses, and reset makes all 52 cards available again without
+    reallocating them.
+
+    Attributes:
+        remaining (int): The number of cards that have not been dealt.
+    """
+    def __init__(self, rng=random):
+        """
+        Initializes a lazily shuffled deck.
+
+        Parameters:
+            rng (random.Random): The random number generator to draw from.
+
+        Returns:
+            None
+        """
+        #cards start in creation order rather than being shuffled with the
+        #global random module, so that a seeded rng fully determines the deal
+        self.deck = list(CARDS)
+        self._random = rng.random
+        self.remaining = len(self.deck)
+
+    def reset(self):
+        """
+        Returns all dealt cards to the deck.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.remaining = len(self.deck)
+
+    def deal(self):
+        """
+        Draws a random card from the undealt part of the deck.
+
+        Parameters:
+        None
+
+        Returns:
+        Card: A Card object representing the dealt card.
+        """
+        cards = self.deck
+        last = self.remaining - 1
+        i = int(self._random() * self.remaining)
+        cards[i], cards[last] = cards[last], cards[i]
+        self.remaining = last
+        return cards[last]
+
+
+class SimulationResult:
+    """
+    Holds the outcome counts and chip trajectory of a simulation run.
+
+    The chip total is not capped at zero, so that long runs measure the
+    rules rather than the length of a session.
+
+    Attributes:
+        strategy (str): The name of the strategy that was played.
+        rounds (int): The number of rounds played.
+        wins (int): The number of rounds won by the player.
+        losses (int): The number of rounds lost by the player.
+        pushes (int): The number of tied rounds.
+        chips_start (int): The chip total before the first round.
+        chips_final (int): The chip total after the last round.
+        chips_min (int): The lowest chip total reached.
+        chips_max (int): The highest chip total reached.
+        trajectory (list): (round, chip total) samples taken along the run.
+        shoe_shuffles (int): The number of times the shoe was reshuffled.
+        shoe_ready (int): The number of prefetched shoes that were ready
+        when they were needed.
+        shoe_waits (int): The number of prefetched shoes that had to be
+        waited for.
+        elapsed (float): The wall clock time of the run in seconds.
+    """
+    def __init__(self, strategy, chips_start):
+        """
+        Initializes an empty SimulationResult.
+
+        Parameters:
+            strategy (str): The name of the strategy that was played.
+            chips_start (int): The chip total before the first round.
+
+        Returns:
+            None
+        """
+        self.strategy = strategy
+        self.rounds = 0
+        self.wins = 0
+        self.losses = 0
+        self.pushes = 0
+        self.chips_start = chips_start
+        self.chips_final = chips_start
+        self.chips_min = chips_start
+        self.chips_max = chips_start
+        self.trajectory = [(0, chips_start)]
+        self.shoe_shuffles = 0
+        self.shoe_ready = 0
+        self.shoe_waits = 0
+        self.elapsed = 0.0
+
+    def rate(self, count):
+        """
+        Returns a count as a fraction of the rounds played.
+
+        Parameters:
+            count (int): The number of rounds with a given outcome.
+
+        Returns:
+            float: The fraction of rounds, or 0.0 if none were played.
+        """
+        return count / self.rounds if self.rounds else 0.0
+
+    def extend(self, other):
+        """
+        Appends the rounds of another result to this one.
+
+        The other result is treated as having been played straight after
+        this one, so its chip trajectory is shifted to start where this
+        one ends. Counts and chip statistics are merged exactly.
+
+        Parameters:
+            other (SimulationResult): The result to append.
+
+        Returns:
+            None
+        """
+        shift = self.chips_final - other.chips_start
+        self.trajectory.extend((self.rounds + played, total + shift)
+                               for played, total in other.trajectory[1:])
+        self.chips_min = min(self.chips_min, other.chips_min + shift)
+        self.chips_max = max(self.chips_max, other.chips_max + shift)
+        self.chips_final = other.chips_final + shift
+        self.rounds += other.rounds
+        self.wins += other.wins
+        self.losses += other.losses
+        self.pushes += other.pushes
+        self.shoe_shuffles += other.shoe_shuffles
+        self.shoe_ready += other.shoe_ready
+        self.shoe_waits += other.shoe_waits
+
+    @property
+    def rounds_per_second(self):
+        """
+        Returns the throughput of the run.
+
+        Returns:
+            float: The number of rounds played per second.
+        """
+        return self.rounds / self.elapsed if self.elapsed else 0.0
+
+
+def hit_table(strategy, decks=1):
+    """
+    Returns the decision of a strategy for every hand and dealer upcard.
+
+    A threshold strategy hits below its threshold whatever the dealer
+    shows. The 'optimal' strategy reads its decisions from the
+    precomputed strategy table for a fresh shoe of the given number of
+    decks, which is only solved if its table file is missing or stale.
+
+    Parameters:
+        strategy (str): The name of a strategy in STRATEGIES.
+        decks (int): The number of decks the optimal decisions are
+        computed for.
+
+    Returns:
+        list: hits[state][upcard] is True if the player hits a hand in
+        that hand state when the dealer's visible card has that value.
+    """
+    threshold = STRATEGIES[strategy]
+    if threshold is not None:
+        return [[value < threshold] * _TABLE_UPCARDS for value in STATE_VALUES]
+    with load_strategy_table(decks) as table:
+        return table.hits()
+
+
+def play_round(deck, hits):
+    """
+    Plays a single round of Black Jack without any input or output.
+
+    The cards are dealt in the same order as in run.py. A natural 21 for
+    either hand ends the round on the deal. Otherwise the player hits
+    while the hit table says so for their hand and the dealer's visible
+    card, and the dealer hits while their hand is below
+    DEALER_STAND_TOTAL.
+
+    Parameters:
+        deck (Deck): The deck to deal from.
+        hits (list): The decisions of the player's strategy, as returned
+        by hit_table.
+
+    Returns:
+        int: WIN, LOSS or PUSH.
+    """
+    player_hand = Hand()
+    player_hand.add_card(deck.deal())
+    player_hand.add_card(deck.deal())
+    dealer_hand = Hand()
+    dealer_hand.add_card(deck.deal())
+    dealer_hand.add_card(deck.deal())
+    #check for blackjack on dealt cards
+    if player_hand.value == 21:
+        return PUSH if dealer_hand.value == 21 else WIN
+    if dealer_hand.value == 21:
+        return LOSS
+    #the dealer's second card is the one shown to the player
+    upcard = dealer_hand.cards[1].value
+    while hits[player_hand.state][upcard]:
+        player_hand.add_card(deck.deal())
+    if player_hand.value > 21:
+        return LOSS
+    while dealer_hand.value < DEALER_STAND_TOTAL:
+        dealer_hand.add_card(deck.deal())
+    if dealer_hand.value > 21 or dealer_hand.value < player_hand.value:
+        return WIN
+    if dealer_hand.value > player_hand.value:
+        return LOSS
+    return PUSH
+
+
+def simulate(rounds, strategy='dealer-mimic', bet=10, samples=20, rng=random,
+             decks=None, penetration=0.75, prefetch=0):
+    """
+    Plays a number of rounds headlessly and collects the results.
+
+    By default every round is dealt from a full, freshly shuffled deck.
+    If decks is given, the rounds are dealt from a Shoe of that many
+    decks which is reshuffled at the cut card, as in GameEngine.
+    The same flat bet is placed each round.
+
+    Parameters:
+        rounds (int): The number of rounds to play.
+        strategy (str): The name of a strategy in STRATEGIES. The
+        'optimal' strategy plays the solver's decisions for a fresh shoe
+        of the same number of decks.
+        bet (int): The number of chips bet on every round.
+        samples (int): The number of trajectory samples to record.
+        rng (random.Random): The random number generator to shuffle with.
+        decks (int): The number of decks in the shoe, or None to deal
+        every round from a fresh deck.
+        penetration (float): The cut card position of the shoe.
+        prefetch (int): If greater than 0, the shoe is reshuffled from a
+        ShoePrefetcher holding up to this many shoes.
+
+    Returns:
+        SimulationResult: The outcome counts and chip trajectory.
+    """
+    hits = hit_table(strategy, decks or 1)
+    result = SimulationResult(strategy, Chips().total)
+    prefetcher = None
+    if decks:
+        if prefetch:
+            prefetcher = ShoePrefetcher(decks, prefetch,
+                                        random.Random(rng.getrandbits(64)))
+        deck = Shoe(decks, penetration, rng, prefetcher)
+        start_round = deck.reshuffle_if_needed
+    else:
+        deck = _LazyDeck(rng)
+        start_round = deck.reset
+    sample_every = max(1, rounds // samples) if samples else rounds + 1
+    total = low = high = result.chips_start
+    wins = losses = pushes = 0
+    start = time.perf_counter()
+    for played in range(1, rounds + 1):
+        start_round()
+        outcome = play_round(deck, hits)
+        if outcome == WIN:
+            wins += 1
+            total += bet
+            if total > high:
+                high = total
+        elif outcome == LOSS:
+            losses += 1
+            total -= bet
+            if total < low:
+                low = total
+        else:
+            pushes += 1
+        if played % sample_every == 0:
+            result.trajectory.append((played, total))
+    result.elapsed = time.perf_counter() - start
+    if decks:
+        #the shuffle that filled the shoe before the first round is not counted
+        result.shoe_shuffles = deck.shuffles - 1
+    if prefetcher is not None:
+        prefetcher.close()
+        result.shoe_ready = prefetcher.ready
+        result.shoe_waits = prefetcher.waits
+    result.rounds = rounds
+    result.wins, result.losses, result.pushes = wins, losses, pushes
+    result.chips_final, result.chips_min, result.chips_max = total, low, high
+    return result
+
+
+def format_report(result):
+    """
+    Formats a SimulationResult as a plain text report.
+
+    Parameters:
+        result (SimulationResult): The result to format.
+
+    Returns:
+        str: The report, one statistic per line.
+    """
+    lines = [
+        f"Strategy:        {result.strategy}",
+        f"Rounds:          {result.rounds}",
+        f"Elapsed:         {result.elapsed:.3f}s",
+        f"Rounds/second:   {result.rounds_per_second:,.0f}",
+        f"Win rate:        {result.rate(result.wins):.4%}",
+        f"Loss rate:       {result.rate(result.losses):.4%}",
+        f"Push rate:       {result.rate(result.pushes):.4%}",
+        f"Chips:           {result.chips_start} -> {result.chips_final}"
+        f" (min {result.chips_min}, max {result.chips_max})",
+    ]
+    if result.shoe_shuffles:
+        lines.append(f"Shoe shuffles:   {result.shoe_shuffles}")
+    if result.shoe_ready or result.shoe_waits:
+        lines.append(f"Prefetched:      {result.shoe_ready} ready,"
+                     f" {result.shoe_waits} waited for")
+    lines.append("Chip trajectory:")
+    lines.extend(f"  round {played:>12}: {total}"
+                 for played, total in result.trajectory)
+    return '\n'.join(lines)
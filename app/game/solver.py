@@ -0,0 +1,211 @@
+"""
+This module contains an exact expected value solver for hit or stand.
+
+For a player's hand, the dealer's visible card and the cards left in the
+shoe, the solver works out the expected value of standing and of hitting
+by playing out every possible draw, with the dealer's play taken from
+odds.dealer_final_distribution. A win pays the bet, a loss costs it and
+a push returns it, so expected values are in units of the bet, from -1
+to 1.
+
+The decision is only asked for once the round has got past the deal, so
+the dealer is known not to have a natural 21. The player's draws are
+taken from the composition as it stands, which ignores the small effect
+that this knowledge has on the cards left in the shoe.
+
+Expected values are kept in a transposition cache keyed on the hand
+state, the upcard and the composition of the cards left, which is the
+canonical form of the multiset of cards seen so far, so every order of
+drawing the same cards is solved once.
+
+Functions:
+    stand_ev(value, upcard, composition): The expected value of standing.
+    hit_ev(value, aces, upcard, composition): The expected value of
+    hitting and then playing on perfectly.
+    best_action(hand, upcard, composition): The better decision for a
+    Hand.
+    ev_table(decks): Precomputes the expected values of every hand
+    against every upcard for a fresh shoe.
+    strategy_table(decks): Precomputes the decision for every hand
+    against every upcard for a fresh shoe.
+    clear_solver_cache(): Empties the transposition cache.
+
+Attributes:
+    HIT, STAND (str): The two decisions.
+    SOLVER_CACHE_SIZE (int): The most positions kept in the cache.
+"""
+from functools import lru_cache
+from .odds import (CARD_VALUES, BUST, shoe_composition, remove_cards,
+                   add_card_value, dealer_final_distribution, clear_dealer_cache)
+
+HIT = 'hit'
+STAND = 'stand'
+SOLVER_CACHE_SIZE = 1 << 18
+
+
+def stand_ev(value, upcard, composition):
+    """
+    Returns the expected value of standing.
+
+    Parameters:
+        value (int): The value of the player's hand.
+        upcard (int): The value of the dealer's visible card.
+        composition (tuple): The cards left in the shoe.
+
+    Returns:
+        float: The expected value in units of the bet.
+    """
+    if value > 21:
+        return -1.0
+    distribution = dealer_final_distribution(upcard, composition,
+                                             no_natural=True)
+    ev = distribution[BUST]
+    for total, probability in distribution.items():
+        if total == BUST or total == value:
+            continue
+        ev += probability if total < value else -probability
+    return ev
+
+
+@lru_cache(maxsize=SOLVER_CACHE_SIZE)
+def _evs(value, aces, upcard, composition):
+    """
+    Returns the expected values of standing and of hitting a hand state.
+
+    Parameters:
+        value (int): The value of the player's hand.
+        aces (int): The number of aces still counted as 11.
+        upcard (int): The value of the dealer's visible card.
+        composition (tuple): The cards left in the shoe.
+
+    Returns:
+        tuple: The stand and hit expected values.
+    """
+    stand = stand_ev(value, upcard, composition)
+    remaining = sum(composition)
+    if value >= 21 or not remaining:
+        return stand, -1.0
+    hit = 0.0
+    counts = list(composition)
+    for index, count in enumerate(composition):
+        if not count:
+            continue
+        new_value, new_aces = add_card_value(value, aces, CARD_VALUES[index])
+        if new_value > 21:
+            hit -= count / remaining
+            continue
+        counts[index] = count - 1
+        hit += count / remaining * max(_evs(new_value, new_aces, upcard,
+                                            tuple(counts)))
+        counts[index] = count
+    return stand, hit
+
+
+def hit_ev(value, aces, upcard, composition):
+    """
+    Returns the expected value of hitting once and then playing on with
+    the better decision at every later step.
+
+    Parameters:
+        value (int): The value of the player's hand.
+        aces (int): The number of aces still counted as 11.
+        upcard (int): The value of the dealer's visible card.
+        composition (tuple): The cards left in the shoe.
+
+    Returns:
+        float: The expected value in units of the bet.
+    """
+    return _evs(value, aces, upcard, composition)[1]
+
+
+def best_action(hand, upcard, composition):
+    """
+    Returns the better decision for a hand and its expected value.
+
+    Parameters:
+        hand (Hand): The player's hand.
+        upcard (Card): The dealer's visible card.
+        composition (tuple): The cards left in the shoe, not including
+        the cards in either hand.
+
+    Returns:
+        tuple: HIT or STAND, and the expected value of that decision.
+    """
+    stand, hit = _evs(hand.value, hand.aces, upcard.value, composition)
+    return (HIT, hit) if hit > stand else (STAND, stand)
+
+
+def _starting_hands():
+    """
+    Returns a two-card hand for every hard and soft total a player can
+    be asked to play.
+
+    Parameters:
+    None
+
+    Returns:
+    list: (value, soft, card values) for each total.
+    """
+    hands = [(total, False, (2, total - 2)) for total in range(4, 12)]
+    hands += [(total, False, (10, total - 10)) for total in range(12, 21)]
+    hands += [(total, True, (11, total - 11)) for total in range(13, 22)]
+    hands.append((12, True, (11, 11)))
+    #hard 21 takes three cards
+    hands.append((21, False, (10, 9, 2)))
+    return hands
+
+
+@lru_cache(maxsize=None)
+def ev_table(decks=1):
+    """
+    Precomputes the expected values of standing and of hitting every hand
+    against every upcard, dealt from a fresh shoe.
+
+    Each total is represented by one hand, for example hard 15 by a ten
+    and a five, and hard 21 by a ten, a nine and a two.
+
+    Parameters:
+        decks (int): The number of decks in the shoe.
+
+    Returns:
+        dict: The stand and hit expected values for each
+        (value, soft, upcard) key.
+    """
+    shoe = shoe_composition(decks)
+    table = {}
+    for value, soft, cards in _starting_hands():
+        for upcard in CARD_VALUES:
+            composition = remove_cards(shoe, cards + (upcard,))
+            table[(value, soft, upcard)] = _evs(value, int(soft), upcard,
+                                                composition)
+    return table
+
+
+@lru_cache(maxsize=None)
+def strategy_table(decks=1):
+    """
+    Precomputes the decision for every hand against every upcard, dealt
+    from a fresh shoe. Hard 21 and soft 21 always stand.
+
+    Parameters:
+        decks (int): The number of decks in the shoe.
+
+    Returns:
+        dict: HIT or STAND for each (value, soft, upcard) key.
+    """
+    return {key: HIT if hit > stand else STAND
+            for key, (stand, hit) in ev_table(decks).items()}
+
+
+def clear_solver_cache():
+    """
+    Empties the transposition cache and the dealer memo behind it.
+
+    Parameters:
+    None
+
+    Returns:
+    None
+    """
+    _evs.cache_clear()
+    clear_dealer_cache()
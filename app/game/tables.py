@@ -0,0 +1,507 @@
+"""
+This module contains memory-mapped binary files for the precomputed
+strategy and dealer outcome tables.
+
+Solving the strategy for a shoe takes seconds, which would be paid again
+by every websocket session that starts python3 run.py. The tables are
+therefore generated once and saved in a compact binary format: a fixed
+64 byte header followed by fixed-width little-endian records. The header
+holds a magic number, the format version, the kind of table, the number
+of decks, the record size and count, a CRC-32 of the records and a hash
+of the rules in game.py. A table is opened with mmap, so every process
+shares the same read-only pages and reads records in place without
+parsing the file.
+
+A table whose file is missing, damaged or was generated for different
+rules is regenerated automatically the first time it is loaded. To
+generate the tables ahead of time, run from the project root:
+
+    python -m app.game.tables --decks 1 6
+
+Classes:
+    MappedTable: A read-only memory-mapped table file.
+    StrategyTable: The expected values and decisions of every hand.
+    DealerTable: The dealer's final total distributions.
+
+Functions:
+    rules_hash(): Returns the hash of the rules the tables depend on.
+    table_path(kind, decks): Returns the path of a table file.
+    build_strategy(decks): Returns the bytes of a strategy table.
+    build_dealer(decks): Returns the bytes of a dealer table.
+    write_table(path, data): Saves a table file atomically.
+    load_strategy_table(decks): Opens a strategy table, generating it if
+    needed.
+    load_dealer_table(decks): Opens a dealer table, generating it if
+    needed.
+    main(argv): Generates table files from the command line.
+
+Attributes:
+    MAGIC (bytes): The first four bytes of every table file.
+    FORMAT_VERSION (int): The version of the file format.
+    KIND_STRATEGY, KIND_DEALER (int): The kinds of table.
+    HEADER (struct.Struct): The layout of the file header.
+    STRATEGY_RECORD (struct.Struct): The layout of a strategy record.
+    DEALER_RECORD (struct.Struct): The layout of a dealer record.
+    TABLES_DIR (str): The directory the table files are kept in.
+"""
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+from . import game
+from .game import HAND_STATES, STATE_VALUES, STATE_SOFT
+from .odds import CARD_VALUES, OUTCOMES, shoe_composition, remove_cards, \
+    dealer_final_distribution
+from .solver import ev_table
+
+MAGIC = b'BJTB'
+FORMAT_VERSION = 1
+KIND_STRATEGY = 1
+KIND_DEALER = 2
+
+#magic, version, kind, decks, record size, record count, crc32, rules hash
+HEADER = struct.Struct('<4sHHHHII16s28x')
+#hand state, upcard, hit flag, stand expected value, hit expected value
+STRATEGY_RECORD = struct.Struct('<BBBxff')
+#upcard, no natural flag, probability of each entry in odds.OUTCOMES
+DEALER_RECORD = struct.Struct(f'<BB6x{len(OUTCOMES)}d')
+
+TABLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'precomputed')
+
+_KIND_NAMES = {KIND_STRATEGY: 'strategy', KIND_DEALER: 'dealer'}
+#upcards are indexed by their value, 2 to 11
+_UPCARDS = max(CARD_VALUES) + 1
+
+
+def rules_hash():
+    """
+    Returns a hash of the rules that the tables are computed from.
+
+    Any change to the cards, their values, the dealer's stand total, the
+    hand states or the file format changes the hash, which makes existing
+    table files stale.
+
+    Parameters:
+    None
+
+    Returns:
+    bytes: The first 16 bytes of a SHA-256 digest.
+    """
+    rules = (FORMAT_VERSION, game.suits, game.ranks,
+             sorted(game.values.items()), game.DEALER_STAND_TOTAL,
+             game.MAX_HAND_VALUE)
+    return hashlib.sha256(repr(rules).encode()).digest()[:16]
+
+
+def table_path(kind, decks):
+    """
+    Returns the path of a table file.
+
+    Parameters:
+        kind (int): KIND_STRATEGY or KIND_DEALER.
+        decks (int): The number of decks the table is for.
+
+    Returns:
+        str: The path in TABLES_DIR.
+    """
+    return os.path.join(TABLES_DIR, f'{_KIND_NAMES[kind]}-{decks}.bin')
+
+
+def _pack(kind, decks, record, records):
+    """
+    Packs a header and its records into the bytes of a table file.
+
+    Parameters:
+        kind (int): KIND_STRATEGY or KIND_DEALER.
+        decks (int): The number of decks the table is for.
+        record (struct.Struct): The layout of a record.
+        records (list): The field tuples of each record.
+
+    Returns:
+        bytes: The contents of the file.
+    """
+    payload = b''.join(record.pack(*fields) for fields in records)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, kind, decks, record.size,
+                         len(records), zlib.crc32(payload), rules_hash())
+    return header + payload
+
+
+def build_strategy(decks=1):
+    """
+    Solves the strategy for a fresh shoe and packs it as a table file.
+
+    There is one record for every hand state and upcard value, indexed
+    by state * 12 + upcard. States and upcards that never occur have no
+    decision and NaN expected values.
+
+    Parameters:
+        decks (int): The number of decks in the shoe.
+
+    Returns:
+        bytes: The contents of the file.
+    """
+    evs = ev_table(decks)
+    nan = float('nan')
+    records = []
+    for state in range(HAND_STATES):
+        for upcard in range(_UPCARDS):
+            stand, hit = evs.get((STATE_VALUES[state], STATE_SOFT[state],
+                                  upcard), (nan, nan))
+            records.append((state, upcard, hit > stand, stand, hit))
+    return _pack(KIND_STRATEGY, decks, STRATEGY_RECORD, records)
+
+
+def build_dealer(decks=1):
+    """
+    Computes the dealer's final total distributions for a fresh shoe and
+    packs them as a table file.
+
+    There are two records for every upcard value from 2 to 11, the
+    first without and the second with the dealer known not to have a
+    natural 21.
+
+    Parameters:
+        decks (int): The number of decks in the shoe.
+
+    Returns:
+        bytes: The contents of the file.
+    """
+    shoe = shoe_composition(decks)
+    records = []
+    for upcard in CARD_VALUES:
+        composition = remove_cards(shoe, [upcard])
+        for no_natural in (False, True):
+            distribution = dealer_final_distribution(upcard, composition,
+                                                     no_natural)
+            records.append((upcard, no_natural,
+                            *(distribution[outcome] for outcome in OUTCOMES)))
+    return _pack(KIND_DEALER, decks, DEALER_RECORD, records)
+
+
+def write_table(path, data):
+    """
+    Saves a table file, replacing any existing one atomically so that
+    other processes never map a half written file.
+
+    Parameters:
+        path (str): The path of the file.
+        data (bytes): The contents of the file.
+
+    Returns:
+        None
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            file.write(data)
+        #every session process maps the same file, whoever generated it
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+class MappedTable:
+    """
+    A read-only table file mapped into memory.
+
+    Attributes:
+        kind (int): KIND_STRATEGY or KIND_DEALER.
+        decks (int): The number of decks the table is for.
+        records (memoryview): The records, read in place from the map.
+
+    Methods:
+        record: Unpacks one record.
+        close: Unmaps the file.
+    """
+    kind = None
+    record_struct = None
+
+    def __init__(self, source):
+        """
+        Maps a table file and checks its header.
+
+        Parameters:
+            source (str or bytes): The path of the file, or its contents
+            if it could not be saved.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: If the file is not a valid, current table of this
+            kind.
+        """
+        if isinstance(source, bytes):
+            self._map = None
+            buffer = memoryview(source)
+        else:
+            with open(source, 'rb') as file:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            buffer = memoryview(self._map)
+        try:
+            self._check(buffer)
+        except ValueError:
+            buffer.release()
+            self.close()
+            raise
+        self.records = buffer[HEADER.size:]
+        buffer.release()
+
+    def _check(self, buffer):
+        """
+        Checks the header and checksum of a table file.
+
+        Parameters:
+            buffer (memoryview): The whole file.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: If anything in the file does not match.
+        """
+        if len(buffer) < HEADER.size:
+            raise ValueError('table file is truncated')
+        (magic, version, kind, decks, record_size, count, checksum,
+         rules) = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('not a table file of this version')
+        if kind != self.kind or record_size != self.record_struct.size:
+            raise ValueError('table file is of another kind')
+        if rules != rules_hash():
+            raise ValueError('table file was generated for other rules')
+        with buffer[HEADER.size:] as payload:
+            if len(payload) != record_size * count or \
+                    zlib.crc32(payload) != checksum:
+                raise ValueError('table file is damaged')
+        self.decks = decks
+
+    def __len__(self):
+        return len(self.records) // self.record_struct.size
+
+    def record(self, index):
+        """
+        Unpacks one record.
+
+        Parameters:
+            index (int): The position of the record.
+
+        Returns:
+            tuple: The fields of the record.
+        """
+        return self.record_struct.unpack_from(self.records,
+                                              index * self.record_struct.size)
+
+    def close(self):
+        """
+        Releases the records and unmaps the file.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        if getattr(self, 'records', None) is not None:
+            self.records.release()
+            self.records = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StrategyTable(MappedTable):
+    """
+    The expected values and decisions of every hand state against every
+    upcard.
+
+    Methods:
+        hit: Returns whether to hit.
+        evs: Returns the expected values of standing and of hitting.
+        hits: Returns all decisions as a hit table.
+    """
+    kind = KIND_STRATEGY
+    record_struct = STRATEGY_RECORD
+
+    def hit(self, state, upcard):
+        """
+        Returns whether the player should hit.
+
+        Parameters:
+            state (int): The player's hand state.
+            upcard (int): The value of the dealer's visible card.
+
+        Returns:
+            bool: True to hit, False to stand.
+        """
+        return bool(self.records[(state * _UPCARDS + upcard)
+                                 * STRATEGY_RECORD.size + 2])
+
+    def evs(self, state, upcard):
+        """
+        Returns the expected values of standing and of hitting.
+
+        Parameters:
+            state (int): The player's hand state.
+            upcard (int): The value of the dealer's visible card.
+
+        Returns:
+            tuple: The stand and hit expected values, NaN for hands that
+            never occur.
+        """
+        return self.record(state * _UPCARDS + upcard)[3:]
+
+    def hits(self):
+        """
+        Returns every decision in the layout of simulation.hit_table.
+
+        Parameters:
+        None
+
+        Returns:
+        list: hits[state][upcard] is True to hit.
+        """
+        flags = self.records[2::STRATEGY_RECORD.size]
+        return [[bool(flag) for flag in flags[state * _UPCARDS:
+                                              (state + 1) * _UPCARDS]]
+                for state in range(HAND_STATES)]
+
+
+class DealerTable(MappedTable):
+    """
+    The probabilities of the dealer's final totals for each upcard.
+
+    Methods:
+        distribution: Returns the distribution for an upcard.
+    """
+    kind = KIND_DEALER
+    record_struct = DEALER_RECORD
+
+    def distribution(self, upcard, no_natural=False):
+        """
+        Returns the probability of each final total of the dealer's hand,
+        as odds.dealer_final_distribution does for a fresh shoe.
+
+        Parameters:
+            upcard (int): The value of the dealer's visible card.
+            no_natural (bool): If True, the dealer is known not to have a
+            natural 21.
+
+        Returns:
+            dict: The probability of each entry in OUTCOMES.
+        """
+        index = 2 * CARD_VALUES.index(upcard) + bool(no_natural)
+        return dict(zip(OUTCOMES, self.record(index)[2:]))
+
+
+def _load(table_class, build, decks, regenerate):
+    """
+    Opens a table file, generating and saving it first if it is missing
+    or no longer valid.
+
+    Parameters:
+        table_class (type): StrategyTable or DealerTable.
+        build (function): Returns the contents of the table file.
+        decks (int): The number of decks the table is for.
+        regenerate (bool): If False, an invalid file raises instead.
+
+    Returns:
+        MappedTable: The opened table.
+    """
+    path = table_path(table_class.kind, decks)
+    try:
+        table = table_class(path)
+        if table.decks == decks:
+            return table
+        table.close()
+    except (OSError, ValueError):
+        if not regenerate:
+            raise
+    data = build(decks)
+    try:
+        write_table(path, data)
+    except OSError:
+        #the directory is read-only, so this process keeps its own copy
+        return table_class(data)
+    return table_class(path)
+
+
+def load_strategy_table(decks=1, regenerate=True):
+    """
+    Opens the strategy table for a fresh shoe.
+
+    Parameters:
+        decks (int): The number of decks in the shoe.
+        regenerate (bool): Whether to generate the table if its file is
+        missing, damaged or stale.
+
+    Returns:
+        StrategyTable: The mapped table.
+
+    Raises:
+        ValueError: If the file is invalid and regenerate is False.
+    """
+    return _load(StrategyTable, build_strategy, decks, regenerate)
+
+
+def load_dealer_table(decks=1, regenerate=True):
+    """
+    Opens the dealer outcome table for a fresh shoe.
+
+    Parameters:
+        decks (int): The number of decks in the shoe.
+        regenerate (bool): Whether to generate the table if its file is
+        missing, damaged or stale.
+
+    Returns:
+        DealerTable: The mapped table.
+
+    Raises:
+        ValueError: If the file is invalid and regenerate is False.
+    """
+    return _load(DealerTable, build_dealer, decks, regenerate)
+
+
+def main(argv=None):
+    """
+    Generates the strategy and dealer tables for each number of decks.
+
+    Parameters:
+        argv (list): The command line arguments, defaults to sys.argv.
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate the precomputed Black Jack tables")
+    parser.add_argument("--decks", type=int, nargs="+", default=[1, 6],
+                        help="the shoe sizes to generate tables for")
+    args = parser.parse_args(argv)
+    for decks in args.decks:
+        for kind, build in ((KIND_STRATEGY, build_strategy),
+                            (KIND_DEALER, build_dealer)):
+            start = time.perf_counter()
+            path = table_path(kind, decks)
+            data = build(decks)
+            write_table(path, data)
+            print(f"{path}: {len(data)} bytes"
+                  f" in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+This module contains a tournament runner for automated players.
+
+Every bot plays a full session with the rules of GameEngine: it
+starts with a fresh Chips total, is dealt from its own shoe that is
+reshuffled at the cut card, bets the same number of chips every round
+(all of them once it has fewer) and plays until it runs out of chips or
+quits after a fixed number of rounds. Bots play one of the simulation
+strategies each, so a tournament also compares the strategies over whole
+sessions. The rounds are played by simulation.play_round, which deals
+and settles them exactly as a bot acting on a GameEngine would, but
+without building the engine's events, at several times the speed.
+
+Sessions are played in chunks across a process pool and the results are
+streamed back in the order of the bots, each chunk as soon as it and the
+chunks before it are finished, to be ingested in large batches by a
+function such as database.add_highscores. Every chunk has its own seed,
+spawned from the tournament seed, so a seeded tournament plays the same
+sessions, and ranks its tied scores in the same order, whatever the
+number of workers. The result keeps the best
+scores of the tournament itself, so its leaderboard can be reported
+whatever else the database it was ingested into holds.
+
+Classes:
+    TournamentResult: Holds the counts, timings and strategy totals.
+
+Functions:
+    bot_name(index, strategy): Returns the initials of a bot.
+    play_session(hits, bet, max_rounds, rng, decks, penetration): Plays
+    one bot session.
+    play_bots(bots, strategies, bet, max_rounds, workers, seed, decks):
+    Plays the sessions across a process pool and yields their results.
+    run_tournament(bots, ingest, ...): Plays the sessions and ingests the
+    results in batches.
+    format_tournament_report(result, top): Formats a TournamentResult as
+    text.
+
+Attributes:
+    CHUNK_SIZE (int): The number of sessions played by one task.
+    DECKS (int): The number of decks in every bot's shoe by default.
+    TOP (int): The number of best scores a result keeps by default.
+"""
+import heapq
+import os
+import string
+import time
+import numpy as np
+from .game import Shoe, Chips
+from .rng import FastRNG
+from .simulation import STRATEGIES, WIN, LOSS, hit_table, play_round
+
+CHUNK_SIZE = 250
+DECKS = 6
+TOP = 10
+
+#the hit tables of each strategy and number of decks, loaded once per
+#worker process
+_hit_tables = {}
+
+
+def bot_name(index, strategy):
+    """
+    Returns the initials a bot is recorded under, the first letter of its
+    strategy followed by two letters counting the bots.
+
+    Parameters:
+        index (int): The number of the bot.
+        strategy (str): The name of the bot's strategy.
+
+    Returns:
+        str: Three capital letters, as the initials prompt accepts.
+
+    Example:
+        bot_name(27, 'optimal') returns 'OBB'
+    """
+    letters = string.ascii_uppercase
+    index %= len(letters) ** 2
+    return strategy[0].upper() + letters[index // 26] + letters[index % 26]
+
+
+def play_session(hits, bet=10, max_rounds=1000, rng=None, decks=DECKS,
+                 penetration=0.75):
+    """
+    Plays one bot session until the bot runs out of chips or quits.
+
+    Parameters:
+        hits (list): The decisions of the bot's strategy, as returned by
+        simulation.hit_table for the same number of decks.
+        bet (int): The number of chips bet on every round.
+        max_rounds (int): The number of rounds after which the bot quits.
+        rng (FastRNG): The random number generator of the bot's shoe.
+        decks (int): The number of decks in the shoe.
+        penetration (float): The cut card position of the shoe.
+
+    Returns:
+        tuple: The final chip total and the number of rounds played.
+    """
+    shoe = Shoe(decks, penetration, rng)
+    total = Chips().total
+    played = 0
+    while total > 0 and played < max_rounds:
+        shoe.reshuffle_if_needed()
+        stake = min(bet, total)
+        outcome = play_round(shoe, hits)
+        if outcome == WIN:
+            total += stake
+        elif outcome == LOSS:
+            total -= stake
+        played += 1
+    return total, played
+
+
+def _play_chunk(first, count, strategies, bet, max_rounds, seed_sequence,
+                decks=DECKS):
+    """
+    Plays a chunk of bot sessions in a worker process.
+
+    Parameters:
+        first (int): The number of the first bot in the chunk.
+        count (int): The number of bots in the chunk.
+        strategies (list): The strategies that bots take in turn.
+        bet (int): The number of chips bet on every round.
+        max_rounds (int): The number of rounds after which a bot quits.
+        seed_sequence (numpy.random.SeedSequence): The seed of the chunk.
+        decks (int): The number of decks in each bot's shoe.
+
+    Returns:
+        list: (name, strategy, final chips, rounds) for each bot.
+    """
+    results = []
+    for index, seed in zip(range(first, first + count),
+                           seed_sequence.spawn(count)):
+        strategy = strategies[index % len(strategies)]
+        #the optimal decisions depend on the number of decks dealt from
+        if (strategy, decks) not in _hit_tables:
+            _hit_tables[strategy, decks] = hit_table(strategy, decks)
+        total, played = play_session(_hit_tables[strategy, decks], bet,
+                                     max_rounds, FastRNG(seed), decks)
+        results.append((bot_name(index // len(strategies), strategy),
+                        strategy, total, played))
+    return results
+
+
+def play_bots(bots, strategies=None, bet=10, max_rounds=1000, workers=None,
+              seed=None, chunk_size=CHUNK_SIZE, decks=DECKS):
+    """
+    Plays bot sessions across a process pool, yielding the chunks of
+    results in the order of the bots, each as soon as it and the chunks
+    before it are finished.
+
+    Parameters:
+        bots (int): The number of bot sessions.
+        strategies (list): The strategies that bots take in turn,
+        defaults to every strategy in STRATEGIES.
+        bet (int): The number of chips bet on every round.
+        max_rounds (int): The number of rounds after which a bot quits.
+        workers (int): The number of worker processes, defaults to the
+        number of CPUs.
+        seed (int): The seed all chunk seeds are spawned from. If None,
+        fresh entropy is used.
+        chunk_size (int): The number of sessions played by one task.
+        decks (int): The number of decks in each bot's shoe.
+
+    Returns:
+        generator: Lists of (name, strategy, final chips, rounds) tuples.
+    """
+    strategies = list(strategies or STRATEGIES)
+    for strategy in strategies:
+        if strategy not in STRATEGIES:
+            raise ValueError(f"unknown strategy {strategy!r}")
+    #imported here, multiprocessing is slow to import and only needed
+    #once the pool is started
+    from concurrent.futures import ProcessPoolExecutor
+    starts = range(0, bots, chunk_size)
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(starts))
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        futures = [pool.submit(_play_chunk, first, min(chunk_size, bots - first),
+                               strategies, bet, max_rounds, seq, decks)
+                   for first, seq in zip(starts, seed_sequences)]
+        #waiting on the chunks in the order they were submitted, rather
+        #than as they complete, keeps the results in bot order, so that
+        #tied scores rank the same however the workers were scheduled
+        for future in futures:
+            yield future.result()
+
+
+class TournamentResult:
+    """
+    Holds the outcome of a tournament.
+
+    Attributes:
+        bots (int): The number of bot sessions played.
+        rounds (int): The total number of rounds played.
+        rows (int): The number of results ingested.
+        batches (int): The number of ingest batches.
+        ingest_time (float): The seconds spent ingesting results.
+        elapsed (float): The wall clock time of the whole tournament.
+        strategies (dict): For each strategy, a list of the number of
+        bots, their total final chips and the number that ran out of
+        chips.
+        top_size (int): The number of best scores kept.
+    """
+    def __init__(self, top_size=TOP):
+        """
+        Initializes an empty TournamentResult.
+
+        Parameters:
+            top_size (int): The number of best scores to keep.
+
+        Returns:
+            None
+        """
+        self.top_size = top_size
+        #a min-heap of (chips, -arrival, name), so that among equal scores
+        #the bot ingested first ranks higher, as on the leaderboard
+        self._top = []
+        self.bots = 0
+        self.rounds = 0
+        self.rows = 0
+        self.batches = 0
+        self.ingest_time = 0.0
+        self.elapsed = 0.0
+        self.strategies = {}
+
+    def add(self, strategy, chips, played, name=None):
+        """
+        Counts the result of one bot session.
+
+        Parameters:
+            strategy (str): The bot's strategy.
+            chips (int): The bot's final chip total.
+            played (int): The number of rounds the bot played.
+            name (str): The bot's name, to rank its score among the best
+            of the tournament. Bots that ran out of chips are not ranked.
+
+        Returns:
+            None
+        """
+        if name is not None and chips > 0 and self.top_size > 0:
+            entry = (chips, -self.bots, name)
+            if len(self._top) < self.top_size:
+                heapq.heappush(self._top, entry)
+            elif entry > self._top[0]:
+                heapq.heapreplace(self._top, entry)
+        totals = self.strategies.setdefault(strategy, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += chips
+        totals[2] += chips <= 0
+        self.bots += 1
+        self.rounds += played
+
+    @property
+    def top(self):
+        """
+        Returns the best scores of the tournament.
+
+        Returns:
+            list: (name, score) rows, best first.
+        """
+        return [(name, chips) for chips, _, name in
+                sorted(self._top, reverse=True)]
+
+    @property
+    def rows_per_second(self):
+        """
+        Returns the ingest throughput.
+
+        Returns:
+            float: The number of results written per second of ingest.
+        """
+        return self.rows / self.ingest_time if self.ingest_time else 0.0
+
+
+def run_tournament(bots, ingest, strategies=None, bet=10, max_rounds=1000,
+                   workers=None, seed=None, batch_size=5000, top=TOP,
+                   decks=DECKS):
+    """
+    Plays bot sessions in parallel and ingests the results in batches
+    while the sessions are still being played.
+
+    Parameters:
+        bots (int): The number of bot sessions.
+        ingest (function): Writes a list of (name, score) rows, for
+        example database.add_highscores.
+        strategies (list): The strategies that bots take in turn,
+        defaults to every strategy in STRATEGIES.
+        bet (int): The number of chips bet on every round.
+        max_rounds (int): The number of rounds after which a bot quits.
+        workers (int): The number of worker processes.
+        seed (int): The seed of the tournament.
+        batch_size (int): The number of results per ingest call.
+        top (int): The number of best scores to keep.
+        decks (int): The number of decks in each bot's shoe.
+
+    Returns:
+        TournamentResult: The counts, timings, strategy totals and best
+        scores.
+    """
+    result = TournamentResult(top)
+    pending = []
+
+    def flush(rows):
+        start = time.perf_counter()
+        ingest(rows)
+        result.ingest_time += time.perf_counter() - start
+        result.rows += len(rows)
+        result.batches += 1
+
+    start = time.perf_counter()
+    for chunk in play_bots(bots, strategies, bet, max_rounds, workers, seed,
+                           decks=decks):
+        for name, strategy, chips, played in chunk:
+            result.add(strategy, chips, played, name)
+            pending.append((name, chips))
+        while len(pending) >= batch_size:
+            flush(pending[:batch_size])
+            del pending[:batch_size]
+    if pending:
+        flush(pending)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def format_tournament_report(result, top=None):
+    """
+    Formats a TournamentResult as a plain text report.
+
+    Parameters:
+        result (TournamentResult): The result to format.
+        top (list): The (name, score) rows of the leaderboard to show,
+        defaults to the best scores of the tournament.
+
+    Returns:
+        str: The report, one statistic per line.
+    """
+    lines = [
+        f"Bots:            {result.bots}",
+        f"Rounds:          {result.rounds}",
+        f"Elapsed:         {result.elapsed:.3f}s",
+        f"Ingested:        {result.rows} rows in {result.batches} batches,"
+        f" {result.ingest_time:.3f}s",
+        f"Ingest rows/s:   {result.rows_per_second:,.0f}",
+        "Strategies:",
+    ]
+    for strategy, (bots, chips, ruined) in sorted(result.strategies.items()):
+        lines.append(f"  {strategy:<14} mean chips {chips / bots:>8.1f},"
+                     f" out of chips {ruined / bots:.2%}")
+    if top is None:
+        top = result.top
+    if top:
+        lines.append(f"Top {len(top)}:")
+        lines.extend(f"  {rank:>3}. {name:<3} {score}"
+                     for rank, (name, score) in enumerate(top, 1))
+    return '\n'.join(lines)
@@ -0,0 +1,2 @@
+from .server import GameServer, SnapshotStore, serve
+from .zygote import serve_forked
@@ -0,0 +1,506 @@
+"""
+This module contains a game server that hosts many sessions in one
+process.
+
+The web front end used to spawn a python3 run.py process behind a pty for
+every websocket, so every player cost a whole interpreter. The server
+instead plays every connection on its own GameEngine, each with its own
+shoe, hands and chips, inside a single asyncio event loop, and the front
+end multiplexes its players onto it with one connection each, over TCP
+or a Unix socket.
+
+The protocol is line oriented. The client sends the lines the player
+types, the same input the prompts of the interactive game take, and the
+server answers every line with the engine's events, one JSON object per
+line, followed by a prompt event naming the state the engine now waits
+in:
+
+    > 1
+    < {"event": "new_game", "chips": 100}
+    < {"event": "round_start", "round": 1, "chips": 100, ...}
+    < {"event": "prompt", "state": "betting"}
+
+A connection starts with a hello event holding its session number and
+the main menu. It is closed when the player exits, when the client
+closes it, or after it has been idle for the idle timeout, which is
+reported with a timeout event.
+
+Each session reads its next line only once the events of the last one
+have been handed to the socket with the write buffer below its high
+water mark, so a client that stops reading stops being served and its
+output cannot pile up in the server's memory, while the other sessions
+carry on.
+
+The engine's actions read and write the high scores database, which
+blocks, so every line is played in a worker thread while the event loop
+goes on serving the other sessions. A session whose engine raises is
+logged to standard error and closed, and the others are not affected.
+
+With a SnapshotStore, a session is not lost when it times out or its
+client goes away in the middle of a game. The hello event then holds a
+token, the session is hibernated under that token as a GameEngine
+snapshot of a few hundred bytes, and its memory is freed. A later
+connection whose first line is resume followed by the token carries on
+from the same cards, with a resumed event describing where it was.
+
+Classes:
+    SnapshotStore: Keeps hibernated sessions as files in a directory.
+    GameServer: Serves game sessions over a stream socket.
+
+Functions:
+    parse_address(address): Splits an address into a host and port or a
+    Unix socket path.
+    serve(address, new_engine, ...): Runs a GameServer until it is
+    interrupted.
+
+Attributes:
+    IDLE_TIMEOUT (float): The seconds a session may wait for input.
+    MAX_SESSIONS (int): The most sessions served at once.
+    MAX_LINE (int): The longest line a client may send, in bytes.
+    BACKLOG (int): The most connections waiting to be accepted, as a
+    front end reconnecting its players after a restart opens them all
+    at once.
+    WRITE_BUFFER_HIGH (int): The write buffer size, in bytes, at which a
+    session waits for its client to read.
+    SNAPSHOT_MAX_AGE (float): The seconds a hibernated session is kept.
+"""
+import asyncio
+import json
+import os
+import re
+import secrets
+import tempfile
+import time
+import traceback
+from ..game.engine import MENU, EXIT
+
+IDLE_TIMEOUT = 300.0
+MAX_SESSIONS = 10_000
+MAX_LINE = 1024
+BACKLOG = 1024
+WRITE_BUFFER_HIGH = 64 * 1024
+SNAPSHOT_MAX_AGE = 7 * 24 * 3600.0
+
+#the first line of a connection that carries on a hibernated session
+RESUME = 'resume '
+
+
+def parse_address(address):
+    """
+    Splits an address into a host and port, or a Unix socket path.
+
+    Parameters:
+        address (str): HOST:PORT, :PORT for every interface, or a path
+        containing a slash for a Unix socket.
+
+    Returns:
+        tuple: (host, port) for TCP, or (path, None) for a Unix socket.
+
+    Raises:
+        ValueError: If the port is not a number.
+
+    Example:
+        parse_address('127.0.0.1:8700') returns ('127.0.0.1', 8700)
+    """
+    if '/' in address:
+        return address, None
+    host, _, port = address.rpartition(':')
+    if not port.isdecimal():
+        raise ValueError(f'invalid address {address!r}, expected HOST:PORT'
+                         ' or a socket path')
+    return host or None, int(port)
+
+
+def _encode(events):
+    """
+    Returns events as JSON lines.
+
+    Parameters:
+        events (list): The event dictionaries.
+
+    Returns:
+        bytes: One JSON object per line.
+    """
+    return ''.join(json.dumps(event) + '\n' for event in events).encode()
+
+
+class SnapshotStore:
+    """
+    Keeps the snapshots of hibernated sessions as files in a directory,
+    one per token.
+
+    Attributes:
+        directory (str): The directory the snapshots are kept in.
+
+    Methods:
+        new_token: Returns a token for a new session.
+        save: Writes the snapshot of a session.
+        load: Reads and removes the snapshot of a session.
+        prune: Removes snapshots older than a given age.
+    """
+    #tokens are checked before they become file names
+    _TOKEN = re.compile('[0-9a-f]{32}')
+
+    def __init__(self, directory):
+        """
+        Initializes a SnapshotStore, creating its directory if needed.
+
+        Parameters:
+            directory (str): The directory to keep the snapshots in.
+
+        Returns:
+            None
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def new_token(self):
+        """
+        Returns a token for a new session, which cannot be guessed.
+
+        Parameters:
+        None
+
+        Returns:
+        str: 32 hexadecimal digits.
+        """
+        return secrets.token_hex(16)
+
+    def _path(self, token):
+        """
+        Returns the path of the snapshot of a token.
+
+        Parameters:
+            token (str): The session's token.
+
+        Returns:
+            str: The file path.
+
+        Raises:
+            ValueError: If the token is not one new_token returns.
+        """
+        if not self._TOKEN.fullmatch(token):
+            raise ValueError('invalid token')
+        return os.path.join(self.directory, token + '.bjs')
+
+    def save(self, token, data):
+        """
+        Writes the snapshot of a session, replacing any older one, so
+        that a reader never sees part of a snapshot.
+
+        Parameters:
+            token (str): The session's token.
+            data (bytes): The snapshot.
+
+        Returns:
+            None
+        """
+        path = self._path(token)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                temp.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def load(self, token):
+        """
+        Reads the snapshot of a session and removes it, so that it is
+        only resumed once.
+
+        Parameters:
+            token (str): The session's token.
+
+        Returns:
+            bytes: The snapshot.
+
+        Raises:
+            ValueError: If the token is not valid.
+            OSError: If there is no snapshot for the token.
+        """
+        path = self._path(token)
+        with open(path, 'rb') as snapshot:
+            data = snapshot.read()
+        os.unlink(path)
+        return data
+
+    def prune(self, max_age=SNAPSHOT_MAX_AGE):
+        """
+        Removes the snapshots that were written longer ago than max_age.
+
+        Parameters:
+            max_age (float): The age in seconds.
+
+        Returns:
+            int: The number of snapshots removed.
+        """
+        removed = 0
+        cutoff = time.time() - max_age
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.bjs') and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+        return removed
+
+
+class GameServer:
+    """
+    Serves game sessions over a stream socket, one GameEngine for each
+    connection.
+
+    Attributes:
+        new_engine (function): Returns the GameEngine of a new session.
+        idle_timeout (float): The seconds a session may wait for input.
+        max_sessions (int): The most sessions served at once.
+        store (SnapshotStore): Where unfinished sessions are hibernated,
+        or None to drop them.
+        sessions (int): The number of sessions being served.
+        started (int): The number of sessions started.
+        timeouts (int): The number of sessions closed for being idle.
+        errors (int): The number of sessions closed because their engine
+        raised an exception.
+        lines (int): The number of lines received.
+        hibernated (int): The number of sessions hibernated.
+        resumed (int): The number of sessions resumed.
+
+    Methods:
+        handle: Serves one connection.
+        start: Starts listening on an address.
+    """
+    def __init__(self, new_engine, idle_timeout=IDLE_TIMEOUT,
+                 max_sessions=MAX_SESSIONS, store=None):
+        """
+        Initializes a GameServer.
+
+        Parameters:
+            new_engine (function): Returns the GameEngine of a new
+            session.
+            idle_timeout (float): The seconds a session may wait for
+            input before it is closed.
+            max_sessions (int): The most sessions served at once, later
+            connections are turned away.
+            store (SnapshotStore): Where to hibernate sessions that end
+            before the player exits, or None to drop them.
+
+        Returns:
+            None
+        """
+        self.new_engine = new_engine
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.store = store
+        self.sessions = 0
+        self.started = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.lines = 0
+        self.hibernated = 0
+        self.resumed = 0
+
+    async def handle(self, reader, writer):
+        """
+        Serves one connection until the player exits, the client closes
+        it or it is idle for too long.
+
+        Parameters:
+            reader (asyncio.StreamReader): The client's input.
+            writer (asyncio.StreamWriter): The client's output.
+
+        Returns:
+            None
+        """
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH)
+        if self.sessions >= self.max_sessions:
+            writer.write(_encode([{'event': 'error',
+                                   'message': 'the server is full'}]))
+            await self._close(writer)
+            return
+        self.sessions += 1
+        self.started += 1
+        try:
+            await self._play(self.started, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            #the client went away, the session was hibernated if there is
+            #a store and is otherwise dropped, as a closed terminal drops it
+            pass
+        except Exception:
+            #a bug in one session closes only that session
+            self.errors += 1
+            traceback.print_exc()
+            writer.write(_encode([{'event': 'error', 'message':
+                                   'the session failed and was closed'}]))
+        finally:
+            self.sessions -= 1
+            await self._close(writer)
+
+    async def _play(self, number, reader, writer):
+        """
+        Plays one session, answering every line with its events.
+
+        Parameters:
+            number (int): The number of the session.
+            reader (asyncio.StreamReader): The client's input.
+            writer (asyncio.StreamWriter): The client's output.
+
+        Returns:
+            None
+        """
+        engine = self.new_engine()
+        hello = {'event': 'hello', 'session': number}
+        token = None
+        if self.store is not None:
+            token = hello['token'] = self.store.new_token()
+        events = [hello] + engine.start()
+        first = True
+        failed = False
+        try:
+            while True:
+                if engine.state != EXIT:
+                    events.append({'event': 'prompt', 'state': engine.state})
+                writer.write(_encode(events))
+                #waits while the client is not reading what it was sent
+                await writer.drain()
+                if engine.state == EXIT:
+                    return
+                try:
+                    line = await asyncio.wait_for(reader.readline(),
+                                                  self.idle_timeout)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    writer.write(_encode([{'event': 'timeout',
+                                           'seconds': self.idle_timeout}]))
+                    return
+                except ValueError:
+                    #a line longer than the stream limit
+                    writer.write(_encode([{'event': 'error',
+                                           'message': 'line too long'}]))
+                    return
+                if not line:
+                    return
+                self.lines += 1
+                text = line.decode('utf-8', 'replace')
+                #played in a worker thread, as the engine blocks on the
+                #database and reads snapshot files
+                if first and token is not None and text.startswith(RESUME):
+                    events, token = await asyncio.to_thread(
+                        self._resume, engine, text[len(RESUME):], token)
+                else:
+                    events = await asyncio.to_thread(engine.send, text)
+                first = False
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            #a session that is not at the menu has a game worth keeping,
+            #unless its engine failed and may be left half way through
+            if (token is not None and not failed
+                    and engine.state not in (MENU, EXIT)):
+                self.store.save(token, engine.snapshot())
+                self.hibernated += 1
+
+    def _resume(self, engine, token, current):
+        """
+        Restores a hibernated session into a connection's engine.
+
+        Parameters:
+            engine (GameEngine): The connection's engine.
+            token (str): The token of the hibernated session.
+            current (str): The connection's own token.
+
+        Returns:
+            tuple: The events to send and the token the connection now
+            hibernates under, the resumed one unless it failed.
+        """
+        token = token.strip()
+        try:
+            data = self.store.load(token)
+        except (OSError, ValueError):
+            return [{'event': 'error', 'message': 'there is no hibernated'
+                     ' session with that token'}], current
+        try:
+            events = engine.restore(data)
+        except ValueError as error:
+            return [{'event': 'error', 'message': str(error)}], current
+        self.resumed += 1
+        events[0]['token'] = token
+        return events, token
+
+    async def _close(self, writer):
+        """
+        Closes a connection, ignoring a client that already went away.
+
+        Parameters:
+            writer (asyncio.StreamWriter): The client's output.
+
+        Returns:
+            None
+        """
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def start(self, address):
+        """
+        Starts listening on an address.
+
+        Parameters:
+            address (str): HOST:PORT, :PORT or a Unix socket path.
+
+        Returns:
+            asyncio.Server: The listening server.
+        """
+        host, port = parse_address(address)
+        if port is None:
+            return await asyncio.start_unix_server(self.handle, host,
+                                                   limit=MAX_LINE,
+                                                   backlog=BACKLOG)
+        return await asyncio.start_server(self.handle, host, port,
+                                          limit=MAX_LINE, backlog=BACKLOG)
+
+
+def serve(address, new_engine, idle_timeout=IDLE_TIMEOUT,
+          max_sessions=MAX_SESSIONS, report=None, store=None):
+    """
+    Runs a GameServer on an address until it is interrupted.
+
+    Parameters:
+        address (str): HOST:PORT, :PORT or a Unix socket path.
+        new_engine (function): Returns the GameEngine of a new session.
+        idle_timeout (float): The seconds a session may wait for input.
+        max_sessions (int): The most sessions served at once.
+        report (function): Receives a line of text when the server
+        starts and stops, for example print.
+        store (SnapshotStore): Where to hibernate unfinished sessions.
+        Snapshots older than SNAPSHOT_MAX_AGE are removed at start.
+
+    Returns:
+        GameServer: The server, with its session counts.
+    """
+    server = GameServer(new_engine, idle_timeout, max_sessions, store)
+    if store is not None:
+        store.prune()
+
+    async def run():
+        listener = await server.start(address)
+        if report is not None:
+            report(f"Serving on {address}")
+        async with listener:
+            await listener.serve_forever()
+
+    start = time.perf_counter()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    if report is not None:
+        report(f"Served {server.started} sessions and {server.lines} lines"
+               f" in {time.perf_counter() - start:.1f}s,"
+               f" {server.timeouts} timed out, {server.errors} failed,"
+               f" {server.hibernated} hibernated and {server.resumed} resumed")
+    return server
@@ -0,0 +1,182 @@
+"""
+This module contains a pre-forking launcher for one process per player.
+
+The web front end starts a new python3 run.py for every player, which
+pays for the interpreter, the rich, game and database imports and the
+database setup before the first screen is drawn. In zygote mode a parent
+process does all of that once and then forks children that already have
+it done. A configured number of children are kept waiting as warm
+spares, each with its first frame already drawn into its buffer and
+blocked in accept on the shared listening socket, so a connection is
+taken by a process that only has to write that frame out.
+
+A child that accepts a connection sends its pid to the parent through a
+pipe, so that the parent forks a new spare straight away. The child then
+moves its standard input, output and error onto the connection, as a pty
+would have them, and plays the session, exiting when it ends. The parent never plays a
+session itself, it only keeps the spares topped up and reaps the
+children that have exited.
+
+Forked children inherit the parent's memory, so they also inherit its
+random number generator and any open files. Every child is therefore
+given its own seed spawned from the parent's, and the session must open
+its own database connections.
+
+Functions:
+    serve_forked(address, prepare, ...): Runs the zygote until it is
+    interrupted.
+
+Attributes:
+    SPARES (int): The number of warm children kept waiting by default.
+"""
+import gc
+import os
+import select
+import signal
+import socket
+import struct
+import traceback
+import numpy as np
+from .server import parse_address, BACKLOG, MAX_SESSIONS
+
+SPARES = 4
+
+#the message a child sends the parent when it takes a connection
+_TAKEN = struct.Struct('<i')
+
+
+def _listen(address):
+    """
+    Opens a listening socket on an address.
+
+    Parameters:
+        address (str): HOST:PORT, :PORT or a Unix socket path.
+
+    Returns:
+        socket.socket: The listening socket.
+    """
+    host, port = parse_address(address)
+    if port is not None:
+        return socket.create_server((host or '', port), backlog=BACKLOG)
+    if os.path.exists(host):
+        os.unlink(host)
+    listener = socket.socket(socket.AF_UNIX)
+    listener.bind(host)
+    listener.listen(BACKLOG)
+    return listener
+
+
+def _child(listener, notify, prepare, number, seed_sequence):
+    """
+    Prepares a session in a forked child, waits for a connection and
+    plays the session on it. Never returns.
+
+    Parameters:
+        listener (socket.socket): The listening socket.
+        notify (int): The pipe the parent is told through.
+        prepare (function): Prepares a session and returns the function
+        that plays it.
+        number (int): The number of the child.
+        seed_sequence (numpy.random.SeedSequence): The child's seed.
+
+    Returns:
+        None
+    """
+    code = 0
+    try:
+        #the parent stops the spares with SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        play = prepare(number, seed_sequence)
+        connection, _ = listener.accept()
+        os.write(notify, _TAKEN.pack(os.getpid()))
+        os.close(notify)
+        listener.close()
+        for fd in (0, 1, 2):
+            os.dup2(connection.fileno(), fd)
+        connection.close()
+        play()
+    except BaseException:
+        #shown to the player, as a crash in a pty would be
+        traceback.print_exc()
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def serve_forked(address, prepare, spares=SPARES, max_sessions=MAX_SESSIONS,
+                 seed=None, report=None):
+    """
+    Keeps warm children waiting for connections on an address until it
+    is interrupted.
+
+    Parameters:
+        address (str): HOST:PORT, :PORT or a Unix socket path.
+        prepare (function): Called in each child before it waits, with
+        the number of the child and a numpy.random.SeedSequence for its
+        random numbers. It does whatever work does not need the
+        connection, such as drawing the first frame, and returns a
+        function that plays the session once the child's standard
+        streams are on the connection.
+        spares (int): The number of children kept waiting.
+        max_sessions (int): The most children alive at once, counting
+        the spares.
+        seed (int): The seed all child seeds are spawned from. If None,
+        fresh entropy is used.
+        report (function): Receives a line of text when the zygote
+        starts and stops, for example print.
+
+    Returns:
+        int: The number of children forked.
+    """
+    listener = _listen(address)
+    seed_sequence = np.random.SeedSequence(seed)
+    notify_read, notify_write = os.pipe()
+    children = set()
+    spare_pids = set()
+    forked = 0
+    #objects made before the fork are left out of garbage collection,
+    #which would otherwise write to, and so copy, every inherited page
+    gc.freeze()
+    #stopping the zygote with SIGTERM stops it as Ctrl+C does
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    if report is not None:
+        report(f"Serving on {address} with {spares} warm spares")
+    try:
+        while True:
+            while len(spare_pids) < spares and len(children) < max_sessions:
+                forked += 1
+                child_seed = seed_sequence.spawn(1)[0]
+                pid = os.fork()
+                if pid == 0:
+                    os.close(notify_read)
+                    _child(listener, notify_write, prepare, forked,
+                           child_seed)
+                children.add(pid)
+                spare_pids.add(pid)
+            #reaping is checked at least once a second
+            ready, _, _ = select.select([notify_read], [], [], 1.0)
+            if ready:
+                taken = os.read(notify_read, _TAKEN.size * 1024)
+                spare_pids.difference_update(
+                    pid for pid, in _TAKEN.iter_unpack(taken))
+            while children:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                children.discard(pid)
+                spare_pids.discard(pid)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        #spares still waiting are stopped, sessions being played are
+        #left to finish
+        for pid in spare_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        listener.close()
+        if report is not None:
+            report(f"Forked {forked} children")
+    return forked
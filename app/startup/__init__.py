@@ -0,0 +1 @@
+from .profile import StartupProfile, profile_startup, format_startup_report
@@ -0,0 +1,193 @@
+"""
+This module contains a profiler for the cold start of run.py.
+
+Every websocket session starts a new python3 run.py, and the headless
+modes are started over and over by scripts, so the time before the first
+line of output is paid on every run. The profiler runs a command in a
+new interpreter with -X importtime, times the whole process from start
+to exit, and reports that cold start time along with the imports that
+took longest, so that a slow new import shows up before it is shipped.
+A budget can be given, which a run exceeding it fails, for a check that
+the headless modes stay quick to start.
+
+The profiled process sees CHILD_ENV set in its environment, so that a
+command which itself asks for a profile runs instead of profiling again.
+
+Classes:
+    StartupProfile: Holds the timings of one profiled start.
+
+Functions:
+    parse_importtime(text): Returns the imports listed by -X importtime.
+    profile_startup(script, argv, executable): Runs and times a command.
+    format_startup_report(profile, top, budget): Formats a StartupProfile
+    as a plain text report.
+
+Attributes:
+    CHILD_ENV (str): The environment variable set in the profiled process.
+    TOP (int): The number of imports shown by default.
+"""
+import os
+import subprocess
+import sys
+import time
+
+CHILD_ENV = 'BLACKJACK_STARTUP_PROFILE'
+TOP = 15
+
+#the start of every line -X importtime writes to standard error
+_PREFIX = 'import time:'
+
+
+class StartupProfile:
+    """
+    Holds the timings of one profiled start.
+
+    Attributes:
+        command (list): The command that was run.
+        elapsed (float): The seconds from starting the process to its
+        exit.
+        imports (list): (module, depth, self seconds, cumulative seconds)
+        tuples in the order -X importtime listed them, depth 0 being an
+        import made by the program rather than by another module.
+        returncode (int): The exit status of the process.
+        errors (str): What the process wrote to standard error, other
+        than the import timings.
+    """
+    def __init__(self, command, elapsed, imports, returncode, errors=''):
+        """
+        Initializes a StartupProfile.
+
+        Parameters:
+            command (list): The command that was run.
+            elapsed (float): The wall clock time of the process.
+            imports (list): The imports, as parse_importtime returns them.
+            returncode (int): The exit status of the process.
+            errors (str): The rest of standard error.
+
+        Returns:
+            None
+        """
+        self.command = command
+        self.elapsed = elapsed
+        self.imports = imports
+        self.returncode = returncode
+        self.errors = errors
+
+    @property
+    def import_time(self):
+        """
+        Returns the time spent importing.
+
+        Returns:
+            float: The seconds spent in imports, counting each nested
+            import once.
+        """
+        return sum(cumulative for _, depth, _, cumulative in self.imports
+                   if depth == 0)
+
+    def over_budget(self, budget):
+        """
+        Returns whether the start took longer than a budget.
+
+        Parameters:
+            budget (float): The budget in milliseconds.
+
+        Returns:
+            bool: True if the process ran longer than the budget.
+        """
+        return self.elapsed * 1000 > budget
+
+
+def parse_importtime(text):
+    """
+    Returns the imports listed by -X importtime.
+
+    Parameters:
+        text (str): Standard error of a process run with -X importtime.
+
+    Returns:
+        tuple: The list of (module, depth, self seconds, cumulative
+        seconds) tuples, and the lines that were not import timings.
+    """
+    imports = []
+    others = []
+    for line in text.splitlines():
+        if not line.startswith(_PREFIX):
+            others.append(line)
+            continue
+        self_time, cumulative, name = line[len(_PREFIX):].split('|')
+        if not self_time.strip().isdigit():
+            #the header line
+            continue
+        module = name.lstrip()
+        #nested imports are indented by two spaces a level
+        depth = (len(name) - len(module) - 1) // 2
+        imports.append((module, depth, int(self_time) / 1e6,
+                        int(cumulative) / 1e6))
+    return imports, others
+
+
+def profile_startup(script, argv=(), executable=None):
+    """
+    Runs a python script with -X importtime in a new interpreter, with no
+    standard input and its output discarded, and times it from start to
+    exit.
+
+    Parameters:
+        script (str): The path of the script, such as run.py.
+        argv (list): The arguments to run the script with.
+        executable (str): The python interpreter, defaults to the one
+        running.
+
+    Returns:
+        StartupProfile: The timings of the run.
+    """
+    command = [executable or sys.executable, '-X', 'importtime', script,
+               *argv]
+    environment = dict(os.environ, **{CHILD_ENV: '1'})
+    start = time.perf_counter()
+    process = subprocess.run(command, stdin=subprocess.DEVNULL,
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE, env=environment,
+                             text=True)
+    elapsed = time.perf_counter() - start
+    imports, others = parse_importtime(process.stderr)
+    return StartupProfile(command, elapsed, imports, process.returncode,
+                          '\n'.join(others))
+
+
+def format_startup_report(profile, top=TOP, budget=None):
+    """
+    Formats a StartupProfile as a plain text report, with the imports
+    that took longest, counting the imports they made themselves.
+
+    Parameters:
+        profile (StartupProfile): The profile to format.
+        top (int): The number of imports to show.
+        budget (float): The budget in milliseconds to compare the start
+        against, or None.
+
+    Returns:
+        str: The report, one statistic per line.
+    """
+    lines = [
+        f"Command:         {' '.join(profile.command[3:])}",
+        f"Cold start:      {profile.elapsed * 1000:.1f}ms",
+        f"Imports:         {profile.import_time * 1000:.1f}ms in"
+        f" {len(profile.imports)} modules",
+    ]
+    if profile.returncode:
+        lines.append(f"Exit status:     {profile.returncode}")
+    if budget is not None:
+        verdict = 'exceeded' if profile.over_budget(budget) else 'met'
+        lines.append(f"Budget:          {budget:.1f}ms, {verdict}")
+    slowest = sorted(profile.imports, key=lambda entry: entry[3],
+                     reverse=True)[:top]
+    if slowest:
+        lines.append(f"{'cumulative':>12} {'self':>9}  module")
+        lines.extend(f"{cumulative * 1000:>10.1f}ms {self_time * 1000:>7.1f}ms"
+                     f"  {'  ' * depth}{module}"
+                     for module, depth, self_time, cumulative in slowest)
+    if profile.returncode and profile.errors:
+        lines.append(profile.errors)
+    return '\n'.join(lines)
@@ -0,0 +1 @@
+from .renderer import Renderer, PlainRenderer, new_renderer
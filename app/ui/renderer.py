@@ -0,0 +1,436 @@
+"""
+This module contains a frame-buffered renderer for the terminal game.
+
+Every screen of the game used to be drawn with a clear subprocess and
+one write per printed line, which over a websocket pty becomes a burst of
+small writes. The renderer instead collects everything printed to its
+rich Console into a frame buffer and presents the whole frame with a
+single write and flush, just before the game waits for input. Clearing
+the screen is an ANSI escape sequence at the start of the next frame, so
+no process is spawned, and anything printed and then cleared before it
+was presented is never sent at all.
+
+Renderables that never change, such as the title art, are rendered once
+and the rendered text is reused from a cache.
+
+With diff enabled, a frame that replaces the previous one only sends the
+lines that changed, each written in place with cursor movement escapes.
+Frames as tall as the terminal or taller, and frames following output
+that the renderer could not track, are always drawn in full.
+
+rich is only imported when a Renderer is made, so the headless modes that
+import the game never load it. PlainRenderer draws the same frames
+without rich, as plain text with the markup tags taken out, and is used
+in its place when it is asked for or when rich is not installed.
+
+Classes:
+    FrameBuffer: A file-like buffer that presents whole frames.
+    Renderer: A rich Console that draws into a FrameBuffer.
+    PlainRenderer: Draws plain text into a FrameBuffer without rich.
+
+Functions:
+    new_renderer(stream, diff, force_terminal, plain): Returns a Renderer,
+    or a PlainRenderer if one was asked for or rich is not installed.
+
+Attributes:
+    CLEAR (str): The escape sequence that clears the screen and the
+    scrollback, as the clear command does.
+"""
+import re
+import shutil
+import sys
+
+CLEAR = '\x1b[H\x1b[2J\x1b[3J'
+
+#a rich markup tag, such as [bold cyan] or [/bold cyan]
+_MARKUP_TAG = re.compile(r'(?<!\\)\[(?:/|[a-z#@])[^\[\]]*\]')
+
+
+class FrameBuffer:
+    """
+    A file-like buffer that collects output and presents it as frames.
+
+    Attributes:
+        stream (file): The stream frames are written to.
+        diff (bool): Whether to send only the changed lines of a frame.
+        frames (int): The number of frames presented.
+        writes (int): The number of writes made to the stream.
+
+    Methods:
+        write: Adds text to the current frame.
+        flush: Does nothing, frames are only written by present.
+        clear: Starts a new frame that replaces the screen.
+        present: Writes the pending frame to the stream.
+    """
+    def __init__(self, stream=None, diff=False):
+        """
+        Initializes an empty FrameBuffer.
+
+        Parameters:
+            stream (file): The stream to write to, defaults to sys.stdout.
+            diff (bool): Whether to send only the changed lines.
+
+        Returns:
+            None
+        """
+        self.stream = stream if stream is not None else sys.stdout
+        self.diff = diff
+        self.frames = 0
+        self.writes = 0
+        self._parts = []
+        self._clear = False
+        #the lines on screen after the last full frame, or None if unknown
+        self._previous = None
+
+    def write(self, text):
+        """
+        Adds text to the current frame.
+
+        Parameters:
+            text (str): The text, which may contain escape sequences.
+
+        Returns:
+            int: The length of the text.
+        """
+        self._parts.append(text)
+        return len(text)
+
+    def flush(self):
+        """
+        Does nothing. rich flushes after every print, but the frame is
+        only written once it is complete.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+
+    def isatty(self):
+        """
+        Returns whether the stream is a terminal, so that rich keeps
+        styling the output.
+
+        Parameters:
+        None
+
+        Returns:
+        bool: True if the stream is a terminal.
+        """
+        isatty = getattr(self.stream, 'isatty', None)
+        return bool(isatty and isatty())
+
+    def clear(self):
+        """
+        Starts a new frame that replaces everything on screen. Output
+        that has not been presented yet would be cleared straight away,
+        so it is dropped.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self._parts = []
+        self._clear = True
+
+    def _changed_lines(self, lines):
+        """
+        Returns the escape sequences that turn the previous frame into a
+        new one by rewriting only the lines that differ.
+
+        The last line of the previous frame is always rewritten, since it
+        is where the cursor was left and where the player's typing was
+        echoed.
+
+        Parameters:
+            lines (list): The lines of the new frame.
+
+        Returns:
+            str: The output to write.
+        """
+        previous = self._previous
+        output = []
+        for row, line in enumerate(lines[:-1]):
+            if row >= len(previous) - 1 or previous[row] != line:
+                output.append(f'\x1b[{row + 1};1H{line}\x1b[K')
+        #the last line leaves the cursor where the frame ends and clears
+        #whatever is left below it
+        output.append(f'\x1b[{len(lines)};1H{lines[-1]}\x1b[J')
+        return ''.join(output)
+
+    def present(self):
+        """
+        Writes the pending frame to the stream with a single write and
+        flush.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        if not self._parts and not self._clear:
+            return
+        text = ''.join(self._parts)
+        if self._clear:
+            lines = text.split('\n')
+            #a frame as tall as the terminal is scrolled up a line by the
+            #newline the player types, so only shorter frames stay put
+            fits = len(lines) < shutil.get_terminal_size().lines
+            if self.diff and self._previous is not None and fits:
+                output = self._changed_lines(lines)
+            else:
+                output = CLEAR + text
+            self._previous = lines if fits else None
+        else:
+            #output added to a frame that is already on screen scrolls it
+            #in ways the buffer cannot follow
+            output = text
+            self._previous = None
+        self._parts = []
+        self._clear = False
+        self.stream.write(output)
+        self.stream.flush()
+        self.frames += 1
+        self.writes += 1
+
+
+class Renderer:
+    """
+    A rich Console that draws into a FrameBuffer.
+
+    Attributes:
+        buffer (FrameBuffer): The frame buffer.
+        console (rich.console.Console): The console to print with.
+
+    Methods:
+        print: Prints to the current frame.
+        clear: Starts a new frame.
+        present: Writes the current frame.
+        cached: Prints a renderable that is only rendered once.
+        input: Presents the frame and reads a line.
+    """
+    def __init__(self, stream=None, diff=False, force_terminal=None):
+        """
+        Initializes a Renderer.
+
+        Parameters:
+            stream (file): The stream to write to, defaults to sys.stdout.
+            diff (bool): Whether to send only the changed lines of a
+            frame.
+            force_terminal (bool): True to style the output even when the
+            stream is not a terminal, such as a socket, or None to style
+            it only for a terminal.
+
+        Returns:
+            None
+        """
+        #imported here, so that importing the renderer does not load rich
+        from rich.console import Console
+        self.buffer = FrameBuffer(stream, diff)
+        self.console = Console(file=self.buffer, force_terminal=force_terminal)
+        self._cache = {}
+
+    def print(self, *objects, **kwargs):
+        """
+        Prints to the current frame, taking the same arguments as
+        rich.console.Console.print.
+
+        Returns:
+            None
+        """
+        self.console.print(*objects, **kwargs)
+
+    def clear(self):
+        """
+        Starts a new frame that replaces the screen.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.buffer.clear()
+
+    def present(self):
+        """
+        Writes the current frame to the terminal.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.buffer.present()
+
+    def cached(self, key, build, **kwargs):
+        """
+        Prints a renderable that never changes, rendering it only the
+        first time.
+
+        Parameters:
+            key (str): The name the rendered text is cached under.
+            build (function): Returns the renderable, called only on the
+            first use of the key.
+            **kwargs: Passed on to rich.console.Console.print, such as the
+            style.
+
+        Returns:
+            None
+        """
+        text = self._cache.get(key)
+        if text is None:
+            with self.console.capture() as capture:
+                self.console.print(build(), **kwargs)
+            text = self._cache[key] = capture.get()
+        self.buffer.write(text)
+
+    def input(self, prompt=''):
+        """
+        Presents the current frame and reads a line from the player.
+
+        Parameters:
+            prompt (str): Text shown before the player's input.
+
+        Returns:
+            str: The line read, without the newline.
+        """
+        self.present()
+        return input(prompt)
+
+
+class PlainRenderer:
+    """
+    Draws plain text into a FrameBuffer, for when rich is not wanted or
+    not installed. It takes the same calls as a Renderer, and is its own
+    console, so that code printing to a Renderer's console can print to
+    it unchanged.
+
+    Attributes:
+        buffer (FrameBuffer): The frame buffer.
+        console (PlainRenderer): The renderer itself.
+
+    Methods:
+        print: Prints to the current frame, without styles.
+        clear: Starts a new frame.
+        present: Writes the current frame.
+        cached: Prints text that never changes.
+        input: Presents the frame and reads a line.
+    """
+    def __init__(self, stream=None, diff=False, force_terminal=None):
+        """
+        Initializes a PlainRenderer.
+
+        Parameters:
+            stream (file): The stream to write to, defaults to sys.stdout.
+            diff (bool): Whether to send only the changed lines of a
+            frame.
+            force_terminal (bool): Ignored, plain text is never styled.
+
+        Returns:
+            None
+        """
+        self.buffer = FrameBuffer(stream, diff)
+        self.console = self
+
+    def print(self, *objects, sep=' ', end='\n', style=None, markup=True,
+              **kwargs):
+        """
+        Prints to the current frame, taking the arguments of
+        rich.console.Console.print and ignoring the styles.
+
+        Parameters:
+            *objects: The objects to print, as text.
+            sep (str): The text between the objects.
+            end (str): The text after the last object.
+            style (str): Ignored.
+            markup (bool): Whether to take rich markup tags out of the
+            text.
+
+        Returns:
+            None
+        """
+        text = sep.join(str(item) for item in objects)
+        if markup is not False:
+            text = _MARKUP_TAG.sub('', text).replace('\\[', '[')
+        self.buffer.write(text + end)
+
+    def clear(self):
+        """
+        Starts a new frame that replaces the screen.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.buffer.clear()
+
+    def present(self):
+        """
+        Writes the current frame to the terminal.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.buffer.present()
+
+    def cached(self, key, build, **kwargs):
+        """
+        Prints text that never changes. Plain text costs nothing to
+        render, so it is not cached.
+
+        Parameters:
+            key (str): Ignored.
+            build (function): Returns the text.
+            **kwargs: Passed on to print.
+
+        Returns:
+            None
+        """
+        self.print(build(), **kwargs)
+
+    def input(self, prompt=''):
+        """
+        Presents the current frame and reads a line from the player.
+
+        Parameters:
+            prompt (str): Text shown before the player's input.
+
+        Returns:
+            str: The line read, without the newline.
+        """
+        self.present()
+        return input(prompt)
+
+
+def new_renderer(stream=None, diff=False, force_terminal=None, plain=False):
+    """
+    Returns a Renderer, or a PlainRenderer if one was asked for or rich
+    is not installed.
+
+    Parameters:
+        stream (file): The stream to write to, defaults to sys.stdout.
+        diff (bool): Whether to send only the changed lines of a frame.
+        force_terminal (bool): True to style the output even when the
+        stream is not a terminal.
+        plain (bool): Whether to draw plain text without rich.
+
+    Returns:
+        Renderer: The renderer.
+    """
+    if not plain:
+        try:
+            return Renderer(stream, diff, force_terminal)
+        except ImportError:
+            pass
+    return PlainRenderer(stream, diff, force_terminal)
@@ -6,54 +6,111 @@ view high scores,
 and exit the game. The game is played against a computer dealer.
 
 The module includes the following functions:
+- start_renderer(diff, force_terminal, plain): Makes the renderer the
+interactive game draws with.
 - clear_screen(): Clears the terminal screen.
-- main_menu(): Displays the main menu for the game and handles user input for
-menu options.
-- start_new_game(): Initializes a new game of Black Jack and handles the game
-flow.
-- end_game(deck, player_hand, dealer_hand, player_chips): Handles the end of
-game logic and determines the winner.
-- display_high_scores(): Displays the top three high scores from the high
-scores table.
+- new_shoe(): Returns the shoe for a new game.
+- new_engine(new_shoe): Returns a game engine that records its scores.
+- main_menu(engine, events): Runs the interactive game from the main menu until the
+player exits.
+- warm_up(): Renders the main menu once before the zygote forks.
+- prepare_forked(seed_sequence, write_behind): Draws the first frame of
+the interactive game in a child forked by the zygote.
+- prompt(state): Shows the prompt of a state of the game and reads the
+player's input.
+- show_menu(): Displays the main menu.
+- show_event(engine, event): Displays what happened in an event of the
+game engine.
+- show_result(engine, event): Displays how a round ended.
+- display_high_scores(highscores, player_score, rank): Displays the top
+three high scores from the high scores table.
 - is_high score(score): Determines if the player's score is a high score.
-- take_bet(chips): Prompts the player to enter a bet and validates the bet
-amount.
-- hit(deck, hand): Adds a card to the player's or dealer's hand and adjusts
-the hand value for aces.
-- hit_or_stand(deck, player_hand, dealer_hand): Prompts the player to hit or
-stand and validates the player's input.
 - show_some(player, dealer): Displays the player's hand and one of the
-dealer's cards.  
+dealer's cards.
 - show_all(player, dealer): Displays the player's hand and the dealer's hand.
-- player_busts(chips): Displays a message indicating that the player has
-busted and updates the player's chip balance.
-- player_wins(chips): Displays a message indicating that the player has won
-and updates the player's chip balance.
-- dealer_busts(chips): Displays a message indicating that the dealer has
-busted and updates the player's chip balance.
+- parse_args(argv): Parses the command line options.
+- main(argv): Runs the interactive game or a headless simulation.
 
 The module also imports the following classes and functions:
-- Deck: A class representing a deck of cards.
-- Hand: A class representing a hand of cards.
+- GameEngine: A class holding the rules and flow of the game as a state
+machine, which takes the player's input and returns events to display.
+- Shoe: A class representing a multi-deck shoe of cards.
 - Chips: A class representing the player's chip balance.
 - create_table(): A function to create the high scores table in the database.
 - add_high score(name, score): A function to add a high score to the database.
 - get_high scores(): A function to retrieve the top three high scores from
 the database.
+- enable_write_behind(): A function to queue high scores for a background
+writer.
+- get_rank(score): A function to find the leaderboard position of a score.
+- close_all(): A function to write any queued high scores and close the
+pooled database connections on exit.
 
 The module is run as the main program to start the game by calling the
-main_menu function.
+main_menu function. Passing --simulate ROUNDS plays that many rounds
+headlessly with the chosen --strategy and prints a report instead;
+--engine batch plays them with the NumPy batch engine, and --workers
+shards them across a process pool with --seed making the run
+reproducible. --decks deals the scalar engine's rounds from a shoe,
+which --prefetch reshuffles from a background thread. --strategy optimal
+plays the hit or stand decisions of the exact expected value solver,
+read from the tables that python -m app.game.tables generates ahead of
+time. Without --simulate, --seed makes the interactive session deal the
+same cards every time it is played the same way. --bankroll PATHS
+measures the --strategy's outcome rates with the batch engine and
+estimates the risk of ruin and session length of a flat --bet over that
+many bankroll paths. --tournament BOTS plays that many bot sessions
+across a process pool, one strategy per bot in turn, streams their final
+chips into the high scores table of a scratch database in large batches
+and reports the ingest rate and the tournament's top --top scores;
+--database ingests them into that file instead. --maintain runs the
+retention job of the high scores database, keeping its best high scores
+and most recent games and deleting the rest, and is meant to be run on a
+schedule, such as a daily cron job, rather than by every game.
+--script [FILE] plays sessions from a file of actions, or from standard
+input, without prompts or styling, and writes every round and session
+result as a line of JSON; its games are recorded in a scratch database
+unless --database is given. --serve ADDRESS hosts any number of sessions in
+this one process, each on its own connection over TCP or a Unix socket,
+with the typed lines in and the game's events out as JSON lines;
+--idle-timeout and --max-sessions bound them, and --hibernate DIR keeps
+the games of sessions that time out or disconnect, as compact snapshots,
+until a later connection resumes them. --zygote ADDRESS keeps
+--spares interactive games imported, warmed up and forked ahead of time,
+each waiting to take the next connection to ADDRESS as its terminal.
+
+The screens of the interactive game are drawn by an app.ui.Renderer,
+which writes each screen as one frame just before the game waits for
+input; --diff-frames makes it send only the lines that changed. rich is
+only imported once the renderer is made for the interactive game, and
+--plain, or rich not being installed, draws plain text instead. The
+database, NumPy engines, server and profiler modules are likewise
+imported only by the modes that use them. --startup-profile runs the
+rest of the command in a new interpreter with -X importtime and reports
+its cold start time and slowest imports, exiting with status 1 if it
+exceeds --startup-budget milliseconds.
 """
 #imports
-import re
+import argparse
+import json
 import os
-from rich.console import Console
-from rich.text import Text
-from app.game.game import Deck, Hand, Chips
-from app.database.database import(create_table, add_highscore, get_highscores)
-
-#initialize console
-console=Console()
+import sys
+from app.ui import new_renderer
+from app.game import rng
+from app.game.game import Shoe, Chips
+from app.game.engine import (GameEngine, MENU, BETTING, PLAYER_TURN,
+                             PLAY_AGAIN, INITIALS, HIGH_SCORES, GAME_OVER, EXIT)
+from app.game.prefetch import ShoePrefetcher
+from app.game.simulation import STRATEGIES, ENGINES, simulate, format_report
+#the batch, parallel, bankroll, tournament, script, server and database
+#modules are imported by the modes and functions that use them, so that
+#each mode only pays for loading what it runs
+
+#the renderer, everything printed to its console is drawn as one frame
+#when the game next waits for input. It is made by start_renderer when
+#the interactive game starts, so that the headless modes never load rich
+renderer = None
+console = None
 #ASCII art for main menu
 BLACKJACK_ART = r"""
 .-------------------------------------.
@@ -63,249 +120,328 @@ BLACKJACK_ART = r"""
 | \_/ \_/ \_/ \_/ \_/ \_/ \_/ \_/ \_/ |
 '-------------------------------------'
 """
+#prompts shown while the game waits in each state
+PROMPTS = {
+    MENU: "Enter your choice: ",
+    BETTING: "How many chips would you like to bet? ",
+    PLAYER_TURN: "Would you like to Hit or Stand? Enter 'h' or 's' ",
+    PLAY_AGAIN: "Do you want to play another round? Enter 'y' or 'n': ",
+    HIGH_SCORES: "\nType 'b' to return to the main menu.",
+}
+#messages shown for the reason each round ended, with their style
+RESULT_MESSAGES = {
+    "both naturals": [("Dealer and Player tie! It's a push.", None)],
+    "player natural": [("Player wins!", None)],
+    "dealer natural": [("Round Over - Dealer wins!", None)],
+    "player busts": [("Player busts!", None)],
+    "dealer busts": [("Dealer busts! Player wins!", None),
+                     ("Round Over - Dealer busts! Player wins!", "bold green")],
+    "dealer wins": [("Round Over - Dealer wins!", None)],
+    "player wins": [("Player wins!", None),
+                    ("Round Over - Player wins!", "bold green")],
+    "push": [("Dealer and Player tie! It's a push.", None),
+             ("Round Over - its a push!", "bold yellow")],
+}
+#reasons of rounds that ended after the dealer played
+STAND_REASONS = ("dealer busts", "dealer wins", "player wins", "push")
+
+
+
+def start_renderer(diff=False, force_terminal=None, plain=False):
+    """
+    Makes the renderer that the interactive game draws with.
 
+    Parameters:
+    diff (bool): Whether to send only the lines of a frame that changed.
+    force_terminal (bool): True to style the output even when it is not
+    a terminal.
+    plain (bool): Whether to draw plain text without rich, which is also
+    done when rich is not installed.
 
+    Returns: none
+    """
+    global renderer, console
+    renderer = new_renderer(diff=diff, force_terminal=force_terminal,
+                            plain=plain)
+    console = renderer.console
 
 def clear_screen():
     """
     Clears the terminal screen.
+
+    The screen is cleared with an escape sequence at the start of the
+    next frame the renderer draws, rather than by running clear.
+    """
+    renderer.clear()
+
+def new_shoe():
     """
-    os.system('cls' if os.name == 'nt' else 'clear')
+    Returns the shoe for a new game. One shoe lasts the whole game and
+    is reshuffled at the cut card, the next shoe is shuffled in the
+    background while this one is played.
 
-def main_menu():
+    Returns:
+    Shoe: The shoe, which the engine closes at the end of the game.
+    """
+    return Shoe(prefetcher=ShoePrefetcher(depth=1))
+
+def new_engine(new_shoe=None):
+    """
+    Returns a game engine that records its scores in the high scores
+    table.
+
+    Parameters:
+    new_shoe (function): Returns the shoe for a new game, defaults to a
+    six deck shoe.
+
+    Returns:
+    GameEngine: The engine, waiting at the main menu.
     """
-    Displays the main menu for the game. Handles user input for the options:
+    from app.database.database import (add_highscore, get_rank,
+                                       get_highscores, ANONYMOUS_NAME)
+    return GameEngine(new_shoe, add_highscore, is_highscore, get_rank,
+                      get_highscores, ANONYMOUS_NAME)
+
+def main_menu(engine=None, events=None):
+    """
+    Runs the interactive game from the main menu until the player exits.
+    The main menu has the options:
     1. New Game
     2. View High Scores
     3. Exit
 
-    New Game: Starts a new game of Black Jack by calling the start_new_game
-    function.
+    The rules and the flow of the game are held by a GameEngine. This
+    function only shows the events of each action and the prompt of the
+    state the engine is in, reads the player's answer and passes it to
+    the engine, so the game is one loop that runs for as long as the
+    player keeps playing, however many games that is. However the loop
+    ends, the prefetcher of the last shoe is closed, along with the
+    database connections.
 
-    View High Scores: Displays the high scores table with the top three scores
-    by calling the display_high_scores_with_options function.
-
-    Exit: Exits the game.
+    Parameters:
+    engine (GameEngine): The engine to play on, defaults to a new one.
+    events (list): The events still to display, defaults to those of
+    the engine's first screen.
 
-    If the user enters an invalid choice, the function will display an error
-    message and prompt the user to enter a valid choice.
+    Returns: none
+    """
+    if renderer is None:
+        start_renderer()
+    if engine is None:
+        engine = new_engine(new_shoe)
+    if events is None:
+        events = engine.start()
+    from app.database.database import close_all
+    try:
+        while engine.state != EXIT:
+            for event in events:
+                show_event(engine, event)
+            events = engine.send(prompt(engine.state))
+        for event in events:
+            show_event(engine, event)
+        renderer.present()
+    finally:
+        #the engine only closes the shoe of a game that was finished, a
+        #player who quits from the menu or disconnects mid-game leaves
+        #its prefetcher running
+        if engine.shoe is not None and engine.shoe.prefetcher is not None:
+            engine.shoe.prefetcher.close()
+        close_all()
+
+def warm_up():
+    """
+    Draws the main menu once into a frame that is thrown away, so that
+    the title is rendered and rich has loaded everything a frame needs
+    before the zygote forks its children.
 
     Returns: none
     """
-    while True:
-        clear_screen()
-        blackjack_art=Text(BLACKJACK_ART,style="bold green")
-        console.print(blackjack_art)
-        console.print("\nBlack Jack Main Menu",style="red")
-        console.print("=====================",style="bold yellow")
-        console.print("1. New Game",style="bright_green")
-        console.print("2. View High Scores", style="bright_yellow")
-        console.print("3. Exit", style="bright_red")
-
-        console.print("Enter your choice: ", style="bold yellow")
-        choice = input().strip()
-
-        if choice == '1':
-            start_new_game()
-        elif choice == '2':
-            display_high_scores()
-        elif choice == '3':
-            console.print("Thank you for playing!",style="bold yellow")
-            break
-        else:
-            clear_screen()
-            console.print("Invalid choice. Please enter 1, 2, or 3.",
-                          style="bold red")
+    show_menu()
+    console.print("[bold cyan]0[/bold cyan]", style="bold green")
+    clear_screen()
 
-def start_new_game():
+def prepare_forked(seed_sequence, write_behind=False):
     """
-    Initalizes a new game of black jack. The game will continue until the
-    player runs out of chips or chooses to exit the game.
-    The game will display the player's current chip balance and prompt the
-    player to enter a bet.
-    The player and dealer hands will be dealt two cards each. 
-    The player's hand will be displayed, with one of the dealer's cards hidden.
+    Prepares the interactive game in a child forked by the zygote, before
+    the child waits for a player. The main menu is drawn into the frame
+    buffer, so that the player's first frame is written as soon as they
+    connect.
 
-    Returns: none
+    Parameters:
+    seed_sequence (numpy.random.SeedSequence): The seed of the child's
+    random numbers, so that no two children deal the same cards.
+    write_behind (bool): Whether to write high scores from a background
+    thread.
+
+    Returns:
+    function: Plays the game once the child's standard input and output
+    are the player's connection.
     """
-    create_table()
-    deck = Deck()
-    deck.shuffle()
-    #initialize player chips
-    player_chips=Chips()
-    player_chips.total=100
-    clear_screen()
-    console.print(f"You have [bold cyan]{player_chips.total}[/bold cyan] chips to start."
-                  ,style="bold yellow")
-    console.print("\nEach bet you make is taken from your total, each win added.",
-        style="bold green")
-    console.print("\nWhen you reach zero chips your game is over.\n"
-                  ,style="bold red")
-    #continue loop as long as player has chips
-    while player_chips.total > 0:
-        deck = Deck() #fix for bug where deck runs out of cards so new deck is created each round
-        deck.shuffle()
-        console.print(f"your current chip balance is: [bold cyan]{player_chips.total}[/bold cyan]"
-                      ,style="bold green")
-        take_bet(player_chips)
+    rng.seed(seed_sequence)
+    if write_behind:
+        from app.database.database import enable_write_behind
+        enable_write_behind()
+    engine = new_engine(new_shoe)
+    for event in engine.start():
+        show_event(engine, event)
+    return lambda: main_menu(engine, [])
 
-        clear_screen()
-        console.print(
-            f"Game has started, player has bet [bold cyan]{player_chips.bet}[/bold cyan] chips",
-                      style="bold green")
-        #deal inital hands
-        player_hand = Hand()
-        player_hand.add_card(deck.deal())
-        player_hand.add_card(deck.deal())
-
-        dealer_hand = Hand()
-        dealer_hand.add_card(deck.deal())
-        dealer_hand.add_card(deck.deal())
-
-        show_some(player_hand, dealer_hand)
-        #check for blackjack on dealt cards
-        if player_hand.value == 21 and dealer_hand.value == 21:
-            show_all(player_hand, dealer_hand)
-            push()
-        elif player_hand.value == 21:
-            show_all(player_hand,dealer_hand)
-            player_wins(player_chips)
-        elif dealer_hand.value == 21:
-            show_all(player_hand, dealer_hand)
-            dealer_wins(player_chips)
-        else:
-            playing = True
-            while playing:
-                playing = hit_or_stand(deck, player_hand, dealer_hand)
-                if player_hand.value > 21:
-                    player_busts(player_chips)
-                    break
-            if player_hand.value <= 21:
-                end_game(deck, player_hand, dealer_hand, player_chips)
-        if player_chips.total <= 0:
-            console.print("You have no more chips. Game Over",style="bold red")
-            break
-        #promt for new round
-        while True:
-            console.print("Do you want to play another round? Enter 'y' or 'n': "
-                          ,style="bold yellow")
-            play_again=input().strip().lower()
-            if play_again in ['y', 'n']:
-                break
-            else:
-                console.print("Invalid input. Please enter 'y' or 'n'."
-                              ,style="bold red")
-        if play_again == 'n':
-            console.print(f"Your score is: {player_chips.total}",
-                          style="bold green")
-            break
-     #check if player's score makes it to the high scores table
-    if player_chips.total > 0:
-        if is_highscore(player_chips.total):
-            while True:
-                console.print("Enter your initials for the high score table: "
-                              ,style="bright_magenta")
-                name = input().strip().upper()
-                console.print("3 letters max, only letters allowed"
-                              ,style="bold yellow")
-                if re.match("^[A-Z]{1,3}$", name):
-                    add_highscore(name, player_chips.total)
-                    display_high_scores()
-                    break
-                else:
-                    console.print("Invalid input. Please enter 1-3 letters."
-                          ,style="bold red")
-        else:
-            console.print("Thanks for playing", style="bold yellow")
-            console.print(f"Your score is: {player_chips.total}", style="bold green")
-        while True:
-            return_input = input("Press Enter to return to the main menu: ").strip()
-            if return_input == "":
-                break
-            else:
-                console.print("Invalid input. Please press Enter to return to the main menu."
-                              , style="bold red")
+def prompt(state):
+    """
+    Shows the prompt of a state of the game and reads the player's
+    answer.
+
+    Parameters:
+    state (str): The state the engine is in.
+
+    Returns:
+    str: The line the player entered.
+    """
+    if state == GAME_OVER:
+        return renderer.input("Press Enter to return to the main menu: ")
+    if state == INITIALS:
+        console.print("Enter your initials for the high score table: "
+                      ,style="bright_magenta")
+        console.print("3 letters max, only letters allowed"
+                      ,style="bold yellow")
     else:
-        console.print("Thanks for playing", style="bold yellow")
-        console.print(f"Your score is: {player_chips.total}", style="bold green")
-    while True:
-        return_input = input("Press Enter to return to the main menu: ").strip()
-        if return_input == "":
-            break
-        else:
-            console.print("Invalid input. Please press Enter to return to the main menu."
-                          , style="bold red")
+        console.print(PROMPTS[state], style="bold yellow")
+    return renderer.input()
 
+def show_menu():
+    """
+    Displays the main menu.
+
+    Returns: none
+    """
     clear_screen()
-    main_menu()
+    renderer.cached("title", lambda: BLACKJACK_ART, style="bold green",
+                    markup=False, highlight=False)
+    console.print("\nBlack Jack Main Menu",style="red")
+    console.print("=====================",style="bold yellow")
+    console.print("1. New Game",style="bright_green")
+    console.print("2. View High Scores", style="bright_yellow")
+    console.print("3. Exit", style="bright_red")
 
-def end_game(deck,player_hand, dealer_hand, player_chips):
+def show_event(engine, event):
     """
-    Handles the end of game logic which includes the dealer playing and
-    determining the winner of the game and updating the player's chip balance.
-        
+    Displays what happened in one event of the game engine.
+
     Parameters:
-    deck (Deck): The deck of cards used in the game.
-    player_hand (Hand): The player's hand of cards.
-    dealer_hand (Hand): The dealer's hand of cards.
-    player_chips (Chips): The player's chip balance.
+    engine (GameEngine): The engine, which holds the hands of the round.
+    event (dict): The event to display.
 
     Returns: none
-
     """
-    while dealer_hand.value < 17:
-        hit(deck, dealer_hand)
-    clear_screen()
-    show_all(player_hand, dealer_hand)
-    if dealer_hand.value > 21:
-        dealer_busts(player_chips)
-        console.print("Round Over - Dealer busts! Player wins!"
+    kind = event['event']
+    if kind == 'menu':
+        show_menu()
+    elif kind == 'new_game':
+        clear_screen()
+        console.print(f"You have [bold cyan]{event['chips']}[/bold cyan] chips to start."
+                      ,style="bold yellow")
+        console.print("\nEach bet you make is taken from your total, each win added.",
+            style="bold green")
+        console.print("\nWhen you reach zero chips your game is over.\n"
+                      ,style="bold red")
+    elif kind == 'round_start':
+        if event['reshuffled']:
+            console.print("The cut card has been reached, shuffling the shoe."
+                          ,style="bold magenta")
+        console.print(f"your current chip balance is: [bold cyan]{event['chips']}[/bold cyan]"
                       ,style="bold green")
-    elif dealer_hand.value > player_hand.value:
-        dealer_wins(player_chips)
-    elif dealer_hand.value < player_hand.value:
-        player_wins(player_chips)
-        console.print("Round Over - Player wins!",
+    elif kind == 'deal':
+        clear_screen()
+        console.print(
+            f"Game has started, player has bet [bold cyan]{event['bet']}[/bold cyan] chips",
                       style="bold green")
-    else:
-        push()
-        console.print("Round Over - its a push!",
-                      style="bold yellow")
+        show_some(engine.player_hand, engine.dealer_hand)
+    elif kind == 'hit':
+        clear_screen()
+        show_some(engine.player_hand, engine.dealer_hand)
+    elif kind == 'stand':
+        console.print("Player stands. Dealer is playing.",
+                      style="bold green")
+    elif kind == 'round':
+        show_result(engine, event)
+    elif kind == 'quit':
+        console.print(f"Your score is: {event['score']}",
+                      style="bold green")
+    elif kind == 'session' and event['name'] is None:
+        console.print("Thanks for playing", style="bold yellow")
+        console.print(f"Your score is: {event['score']}", style="bold green")
+        if 'rank' in event:
+            console.print(f"Your score would rank #{event['rank']} of the"
+                          " high scores", style="bold green")
+    elif kind == 'high_scores':
+        display_high_scores(event['highscores'], event['score'], event['rank'])
+    elif kind == 'error':
+        if engine.state == MENU:
+            show_menu()
+        console.print(event['message'], style="bold red")
+        if 'chips' in event:
+            console.print(f"you have {event['chips']} chips")
+    elif kind == 'exit':
+        console.print("Thank you for playing!",style="bold yellow")
+
+def show_result(engine, event):
+    """
+    Displays how a round ended. After a natural 21 both hands are shown
+    below the deal, after the dealer has played they are shown on a new
+    screen.
+
+    Parameters:
+    engine (GameEngine): The engine, which holds the hands of the round.
+    event (dict): The 'round' event.
+
+    Returns: none
+    """
+    reason = event['reason']
+    if reason in STAND_REASONS:
+        clear_screen()
+    if reason != 'player busts':
+        show_all(engine.player_hand, engine.dealer_hand)
+    for message, style in RESULT_MESSAGES[reason]:
+        console.print(message, style=style)
+    if event['chips'] <= 0:
+        console.print("You have no more chips. Game Over",style="bold red")
 
-def display_high_scores():
+def display_high_scores(highscores, player_score=None, rank=None):
     """
     Displays the top three high scores from the high scores table.
     If there are no high scores, the function will display a message
     indicating that the player's score did not break the top three.
+    If a player's score is given, its rank among the high scores is shown
+    too.
+
+    Parameters:
+    highscores (list): The (name, score) rows of the high scores table.
+    player_score (int): The score the player just finished with, if any.
+    rank (int): The rank of the player's score among the high scores.
 
     Returns: none
     """
     clear_screen()
-    highscores = get_highscores()
     if highscores:
         console.print('\nHigh Scores:',style="bold green")
-        for rank, (name, score) in enumerate(highscores, start=1):
-            console.print(f"{rank}. {name} - {score}")
+        for position, (name, score) in enumerate(highscores, start=1):
+            console.print(f"{position}. {name} - {score}")
     else:
         console.print("There are no high scores yet.",style="bold red")
-    while True:
-        console.print("\nType 'b' to return to the main menu.",
-                      style="bold yellow")
-        user_input = input().strip()
-        if user_input == 'b':
-            break
-        else:
-            console.print("Invalid input. Type b to return to the main menu.",
-                          style="bold red")
+    if player_score is not None:
+        console.print(f"\nYour score of {player_score} ranks #{rank}"
+                      " of the high scores", style="bold cyan")
 
 def is_highscore(score):
     """
     Determines if the player's score is a high score by comparing the player's 
-    score to the top three scores in the high scores table.
+    score to the lowest of the top three scores, which is held in memory by
+    the leaderboard cache.
     If the player's score is greater than the lowest score in the high scores
     table, the function will return True.
     If the player's score is not greater than the lowest score in the high
-    scores table, the function will return False.
+    scores table, or the player has no chips left, the function will
+    return False.
     
     Parameters:
     score (int): The player's score to compare to the high scores table.
@@ -313,97 +449,11 @@ def is_highscore(score):
     Returns:
     bool: True if the player's score is a high score, False otherwise.
     """
-    highscores=get_highscores()
-    return len(highscores) < 3 or score > highscores[-1][1]
-
-def take_bet(chips):
-    """
-    Prompts the player to enter a bet and validates the bet amount.
-    If the player enters a bet greater than their chip balance, the function
-    will display an error message and prompt the player to enter a valid bet.
-    If the player enters a non-integer value, the function will display an
-    error message and prompt the player to enter a valid bet.
-
-    Parameters:
-    chips (Chips): The player's chip balance.
-
-    Returns: none
-    """
-    while True:
-        try:
-            console.print("How many chips would you like to bet? ",
-                          style="bold yellow")
-            bet =input().strip()
-            if bet.isnumeric():
-                bet=int(bet)
-                if bet > 0:
-                    if bet > chips.total:
-                        console.print("You do not have enough chips",
-                                      style="bold red")
-                        console.print(f"you have {chips.total} chips")
-                    else:
-                        chips.bet=bet
-                        break
-                else:
-                    console.print("bet needs to be a number greater than 0",
-                                  style="bold red")
-            else:
-                console.print("bet needs to be a positive number",
-                              style="bold red")
-        except ValueError:
-            console.print("bet needs to be a number", style="bold red")
-
-def hit(deck, hand):
-    """
-    Adds a card to the player's or dealer's hand and adjusts the hand value
-    for aces.
-    
-    Parameters:
-    deck (Deck): The deck of cards used in the game.
-    hand (Hand): The player's or dealer's hand of cards.
-
-    Returns: none
-    """
-    hand.add_card(deck.deal())
-    hand.adjust_for_ace()
-
-def hit_or_stand(deck, player_hand, dealer_hand):
-    """
-    Prompts the player to hit or stand and validates the player's input.
-    If the player enters an invalid input, the function will display an
-    error message and prompt the player to enter a valid input.
-    If the player chooses to hit, the player will be dealt another card
-    and the player's hand will be displayed.
-    If the player chooses to stand, the function will return False.
-    
-    Parameters:
-    deck (Deck): The deck of cards used in the game.
-    player_hand (Hand): The player's hand of cards.
-    dealer_hand (Hand): The dealer's hand of cards.
-    
-    Returns:
-    bool: True if the player chooses to hit, False if the player chooses
-    to stand.
-    """
-    while True:
-        try:
-            console.print("Would you like to Hit or Stand? Enter 'h' or 's' ",
-                          style="bold yellow")
-            x = input().strip()
-            if x[0].lower() == 'h':
-                hit(deck, player_hand)
-                clear_screen()
-                show_some(player_hand, dealer_hand)
-                if player_hand.value > 21:
-                    return False  # Player busts, end game
-            elif x[0].lower() == 's':
-                console.print("Player stands. Dealer is playing.",
-                              style="bold green")
-                return False  # Player stands, end game
-        except(IndexError, ValueError):
-            console.print("Invalid input, please enter either 'h' or 's'.",
-                          style="bold red")
-            return True
+    if score <= 0:
+        return False
+    from app.database.database import get_highscore_threshold
+    threshold = get_highscore_threshold()
+    return threshold is None or score > threshold
 
 def show_some(player, dealer):
     """
@@ -443,65 +493,226 @@ def show_all(player, dealer):
         console.print(f" {card}",style="bright_blue")
     console.print(f"Player's Hand = {player.value}",style="bright_blue")
 
-def player_busts(chips):
-    """
-    Displays a message indicating that the player has busted and updates the
-    player's chip balance.
-    
-    Parameters:
-    chips (Chips): The player's chip balance.
-    
-    Returns: none
+def parse_args(argv=None):
     """
-    print("Player busts!")
-    chips.lose_bet()
+    Parses the command line options.
 
-def player_wins(chips):
-    """
-    Displays a message indicating that the player has won and updates the
-    player's chip balance.
-    
     Parameters:
-    chips (Chips): The player's chip balance.
-    
-    Returns: none
-    """
-    print("Player wins!")
-    chips.win_bet()
+    argv (list): The arguments to parse, defaults to sys.argv.
 
-def dealer_busts(chips):
-    """
-    Displays a message indicating that the dealer has busted and updates
-    the player's chip balance.
-    
-    Parameters:
-    chips (Chips): The player's chip balance.
-    
-    Returns: none
-    """
-    print("Dealer busts! Player wins!")
-    chips.win_bet()
+    Returns:
+    argparse.Namespace: The parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Black Jack")
+    parser.add_argument("--write-behind", action="store_true",
+                        help="write high scores from a background thread")
+    parser.add_argument("--diff-frames", action="store_true",
+                        help="redraw only the lines of the screen that changed")
+    parser.add_argument("--plain", action="store_true",
+                        help="draw the game as plain text, without rich")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="run the rest of the command in a new interpreter"
+                        " and report its cold start time and slowest imports")
+    parser.add_argument("--startup-budget", type=float, metavar="MS",
+                        help="with --startup-profile, exit with status 1 if"
+                        " the cold start takes longer than MS milliseconds")
+    parser.add_argument("--simulate", type=int, metavar="ROUNDS",
+                        help="play ROUNDS rounds headlessly and report the results")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES),
+                        default="dealer-mimic",
+                        help="the player strategy used by --simulate")
+    parser.add_argument("--bet", type=int, default=10,
+                        help="the flat bet placed on every simulated round")
+    parser.add_argument("--engine", choices=ENGINES, default="scalar",
+                        help="play simulated rounds one at a time or as NumPy batches")
+    parser.add_argument("--decks", type=int, metavar="N",
+                        help="deal simulated rounds from an N-deck shoe (scalar engine)")
+    parser.add_argument("--penetration", type=float, default=0.75,
+                        help="the fraction of the shoe dealt before reshuffling")
+    parser.add_argument("--prefetch", type=int, default=0, metavar="DEPTH",
+                        help="shuffle up to DEPTH shoes ahead on a background thread")
+    parser.add_argument("--workers", type=int, metavar="N",
+                        help="shard simulated rounds across N worker processes")
+    parser.add_argument("--bankroll", type=int, metavar="PATHS",
+                        help="estimate the risk of ruin over PATHS bankroll paths")
+    parser.add_argument("--max-rounds", type=int, default=10_000,
+                        help="the most rounds played on each bankroll path"
+                        " or bot session")
+    parser.add_argument("--tournament", type=int, metavar="BOTS",
+                        help="play BOTS bot sessions and record their scores")
+    parser.add_argument("--top", type=int, default=10, metavar="K",
+                        help="the number of top scores the tournament reports")
+    parser.add_argument("--script", nargs="?", const="-", metavar="FILE",
+                        help="play the actions in FILE, or standard input,"
+                        " and write the results as JSON lines")
+    parser.add_argument("--serve", metavar="ADDRESS",
+                        help="serve game sessions on HOST:PORT or a Unix"
+                        " socket path")
+    parser.add_argument("--zygote", metavar="ADDRESS",
+                        help="fork a warm interactive game for each"
+                        " connection to HOST:PORT or a Unix socket path")
+    parser.add_argument("--spares", type=int, default=4, metavar="N",
+                        help="the number of warm games the zygote keeps"
+                        " waiting")
+    parser.add_argument("--idle-timeout", type=float, default=300.0,
+                        metavar="SECONDS",
+                        help="close served sessions idle for this long")
+    parser.add_argument("--hibernate", metavar="DIR",
+                        help="keep served sessions that time out or"
+                        " disconnect in DIR, to be resumed later")
+    parser.add_argument("--max-sessions", type=int, default=10_000,
+                        help="the most sessions served or forked at once")
+    parser.add_argument("--database", metavar="PATH",
+                        help="the high scores database file to use")
+    parser.add_argument("--maintain", action="store_true",
+                        help="delete all but the best high scores and the"
+                        " most recent games from the database")
+    parser.add_argument("--seed", type=int,
+                        help="seed the simulation or the session so that it"
+                        " can be reproduced")
+    args = parser.parse_args(argv)
+    if args.decks and args.engine != "scalar":
+        parser.error("--decks is only supported by the scalar engine")
+    return args
+
+def main(argv=None):
+    """
+    Runs a headless simulation if one was requested, otherwise starts the
+    interactive game at the main menu.
 
-def dealer_wins(chips):
-    """
-    Displays a message indicating that the dealer has won and updates
-    the player's chip balance.
-    
     Parameters:
-    chips (Chips): The player's chip balance.
-    
-    Returns: none
-    """
-    print("Round Over - Dealer wins!")
-    chips.lose_bet()
+    argv (list): The command line arguments, defaults to sys.argv.
 
-def push():
-    """
-    Displays a message indicating that the player and dealer have tied.
-    
     Returns: none
     """
-    print("Dealer and Player tie! It's a push.")
+    args = parse_args(argv)
+    #the profiled run has app.startup.profile.CHILD_ENV set, and runs the
+    #command rather than profiling it again
+    if args.startup_profile and not os.environ.get("BLACKJACK_STARTUP_PROFILE"):
+        from app.startup import profile_startup, format_startup_report
+        profile = profile_startup(__file__,
+                                  sys.argv[1:] if argv is None else argv)
+        print(format_startup_report(profile, budget=args.startup_budget))
+        if profile.returncode or (args.startup_budget is not None and
+                                  profile.over_budget(args.startup_budget)):
+            sys.exit(1)
+        return
+    if args.database:
+        from app.database.database import configure_pool
+        configure_pool(args.database)
+    if args.seed is not None:
+        rng.seed(args.seed)
+    if args.maintain:
+        from app.database.database import (create_table, maintain_highscores,
+                                           close_all)
+        create_table()
+        highscores, games = maintain_highscores()
+        close_all()
+        print(f"Deleted {highscores} high scores and {games} games")
+    elif args.zygote is not None:
+        from app.server import serve_forked
+        from app.database.database import create_table, get_highscores, close_all
+        #the children talk to a terminal over a socket, which rich would
+        #not style by itself
+        start_renderer(args.diff_frames, True, args.plain)
+        create_table()
+        get_highscores()
+        #every child opens connections of its own
+        close_all()
+        warm_up()
+        serve_forked(args.zygote,
+                     lambda number, seed: prepare_forked(seed, args.write_behind),
+                     args.spares, args.max_sessions, args.seed, print)
+    elif args.serve is not None:
+        from app.server import SnapshotStore, serve
+        from app.database.database import (create_table, enable_write_behind,
+                                           close_all)
+        create_table()
+        #high scores are queued for a writer thread, so that a write
+        #never holds up the other sessions
+        enable_write_behind()
+        store = SnapshotStore(args.hibernate) if args.hibernate else None
+        serve(args.serve, new_engine, args.idle_timeout, args.max_sessions,
+              print, store)
+        close_all()
+    elif args.script is not None:
+        import tempfile
+        from app.game.script import run_script
+        from app.database.database import (create_table, add_highscore,
+                                           get_rank, configure_pool, close_all,
+                                           ANONYMOUS_NAME)
+        #scripted runs, like the tournament's bots, record their games
+        #away from the players' unless a database is asked for
+        with tempfile.TemporaryDirectory() as scratch:
+            if not args.database:
+                configure_pool(os.path.join(scratch, "script.db"))
+            create_table()
+            emit = lambda event: print(json.dumps(event))
+            if args.script == "-":
+                run_script(sys.stdin, emit, add_highscore, is_highscore,
+                           get_rank, anonymous_name=ANONYMOUS_NAME)
+            else:
+                with open(args.script) as script:
+                    run_script(script, emit, add_highscore, is_highscore,
+                               get_rank, anonymous_name=ANONYMOUS_NAME)
+            close_all()
+    elif args.tournament is not None:
+        import tempfile
+        from app.game.tournament import run_tournament, format_tournament_report
+        from app.database.database import (create_table, add_highscores,
+                                           configure_pool, close_all)
+        #the bots' scores are kept away from the players' unless a
+        #database is asked for
+        with tempfile.TemporaryDirectory() as scratch:
+            if not args.database:
+                configure_pool(os.path.join(scratch, "tournament.db"))
+            create_table()
+            result = run_tournament(args.tournament, add_highscores,
+                                    bet=args.bet, max_rounds=args.max_rounds,
+                                    workers=args.workers, seed=args.seed,
+                                    top=args.top)
+            print(format_tournament_report(result))
+            close_all()
+    elif args.bankroll is not None:
+        from app.game.batch import simulate_batch
+        from app.game.bankroll import (estimate_ruin, flat_bet,
+                                       outcome_probabilities,
+                                       format_bankroll_report)
+        stream = rng.FastRNG(args.seed)
+        measured = simulate_batch(args.simulate or 1_000_000, args.strategy,
+                                  args.bet, rng=stream)
+        probabilities = outcome_probabilities(measured)
+        result = estimate_ruin(Chips(), probabilities, flat_bet(args.bet),
+                               args.bankroll, args.max_rounds, stream.generator)
+        print(f"Strategy:        {args.strategy} (win {probabilities[0]:.4%},"
+              f" loss {probabilities[1]:.4%}, push {probabilities[2]:.4%}"
+              f" over {measured.rounds} rounds)")
+        print(f"Bet:             {args.bet}")
+        print(format_bankroll_report(result))
+    elif args.simulate is not None:
+        if args.workers or args.seed is not None:
+            from app.game.parallel import simulate_parallel
+            #a seeded run without --workers is one shard, so that its
+            #result does not depend on the number of CPUs
+            result = simulate_parallel(args.simulate, args.strategy, args.bet,
+                                       args.workers or 1, args.seed,
+                                       args.engine, args.decks,
+                                       args.penetration, args.prefetch)
+        elif args.engine == "batch":
+            from app.game.batch import simulate_batch
+            result = simulate_batch(args.simulate, args.strategy, args.bet)
+        else:
+            result = simulate(args.simulate, args.strategy, args.bet,
+                              decks=args.decks, penetration=args.penetration,
+                              prefetch=args.prefetch)
+        print(format_report(result))
+    else:
+        start_renderer(args.diff_frames, plain=args.plain)
+        from app.database.database import create_table, enable_write_behind
+        create_table()
+        if args.write_behind:
+            enable_write_behind()
+        main_menu()
 
 if __name__ == "__main__":
-    main_menu()
+    main()
@@ -0,0 +1,78 @@
+"""
+This module contains the tests for the cold start of the headless modes.
+
+Each test runs run.py in a new interpreter through the startup profiler,
+so that what it measures is what a script starting a headless mode pays.
+
+Classes:
+    TestStartup: Tests the cold start of run.py --simulate.
+
+Attributes:
+    RUN (str): The path of run.py.
+    BUDGET (float): The cold start budget in milliseconds, which the
+    BLACKJACK_STARTUP_BUDGET environment variable overrides for slower
+    machines.
+    HEAVY (tuple): The modules the scalar --simulate mode must not import.
+"""
+import os
+import unittest
+
+from app.startup import profile_startup
+
+RUN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), 'run.py')
+BUDGET = float(os.environ.get('BLACKJACK_STARTUP_BUDGET', 500))
+HEAVY = ('numpy', 'rich', 'sqlite3', 'asyncio', 'multiprocessing',
+         'app.database', 'app.server', 'app.game.batch',
+         'app.game.parallel', 'app.game.bankroll', 'app.game.tournament',
+         'app.game.script')
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Tests the cold start of run.py --simulate.
+    """
+    @classmethod
+    def setUpClass(cls):
+        """
+        Profiles the start of a one round simulation once, for every test
+        to check.
+
+        Returns:
+            None
+        """
+        cls.profile = profile_startup(RUN, ['--simulate', '1'])
+
+    def test_runs(self):
+        """
+        Tests that the profiled simulation exits cleanly.
+
+        Returns:
+            None
+        """
+        self.assertEqual(self.profile.returncode, 0, self.profile.errors)
+
+    def test_within_budget(self):
+        """
+        Tests that the simulation starts and exits within the budget.
+
+        Returns:
+            None
+        """
+        self.assertFalse(self.profile.over_budget(BUDGET),
+                         f'cold start took {self.profile.elapsed * 1000:.1f}'
+                         f'ms, over the budget of {BUDGET:.0f}ms')
+
+    def test_lazy_imports(self):
+        """
+        Tests that the simulation imports none of the other modes.
+
+        Returns:
+            None
+        """
+        imported = {module for module, _, _, _ in self.profile.imports}
+        self.assertFalse(imported.intersection(HEAVY))
+
+
+if __name__ == '__main__':
+    unittest.main()